@@ -0,0 +1,75 @@
+from typing import Iterable
+
+NO_INFORMATION_INDICATORS = [
+    "I don't have enough information",
+    "I don't have information",
+    "I cannot provide",
+    "I don't have specific",
+    "not included in",
+    "not mentioned in",
+    "not in the context",
+    "not available in",
+    "not specified in",
+    "not found in",
+    "I don't know",
+    "I'm not sure",
+    "cannot find",
+    "no information about",
+    "the provided context does not",
+    "no details about",
+    "cannot access",
+    "do not have access",
+    "not provided in"
+]
+
+ESCALATION_INDICATORS = [
+    "would need more details",
+    "cannot accurately",
+    "specific to your situation",
+    "recommend speaking with an agent",
+    "cannot calculate",
+    "varies depending on",
+    "specific information",
+    "not in my knowledge",
+    "outside the scope",
+    "detailed answer"
+]
+
+
+class AnswerGuard:
+    """
+    Incremental check of a generated answer for no-information and escalation phrases.
+
+    Fed the answer piece by piece as the model streams it, it reaches the same verdicts
+    as matching the phrases against the complete answer (case-insensitively), but as
+    soon as a phrase has been generated. Only the last few characters of earlier pieces
+    are kept, enough to catch a phrase split across pieces, so each piece costs time
+    proportional to its own length.
+    """
+
+    def __init__(self, no_information: Iterable[str] = NO_INFORMATION_INDICATORS,
+                 escalation: Iterable[str] = ESCALATION_INDICATORS):
+        self._no_information = [phrase.lower() for phrase in no_information]
+        self._escalation = [phrase.lower() for phrase in escalation]
+        self._overlap = max(len(phrase) for phrase in self._no_information + self._escalation) - 1
+        self._tail = ""
+        self.chars = 0
+        self.no_information = False
+        self.escalation = False
+
+    def feed(self, text: str) -> bool:
+        """
+        Check the next piece of the answer.
+
+        Returns:
+            True once the answer is known to be a no-information answer, which
+            post-processing replaces, so generating the rest is wasted
+        """
+        window = self._tail + text.lower()
+        if not self.no_information:
+            self.no_information = any(phrase in window for phrase in self._no_information)
+        if not self.escalation:
+            self.escalation = any(phrase in window for phrase in self._escalation)
+        self._tail = window[-self._overlap:]
+        self.chars += len(text)
+        return self.no_information
@@ -1,9 +1,14 @@
 import streamlit as st
 import os
-import tempfile
+import hashlib
 from insurance_chatbot import InsuranceChatbot
 from knowledge_base import create_knowledge_base
-from utils import display_chat_history, give_feedback
+from utils import display_chat_history, HISTORY_WINDOW
+from model_backends import uses_google_backend
+from metrics import start_metrics_server
+from response_cache import FAQ_QUESTIONS, ensure_faq_answers
+from session_store import ACTIVE_SESSIONS, get_session_store, answer_metadata, restore_memory
+from memory_accounting import KNOWLEDGE_BASES, memory_report
 
 os.environ["GOOGLE_API_KEY"] = "AddApiHere"
 
@@ -12,21 +17,94 @@ st.set_page_config(page_title="Insurance Advisor Chatbot",
                    layout="wide",
                    initial_sidebar_state="collapsed") 
 
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+if os.getenv("METRICS_PORT"):
+    start_metrics_server(int(os.getenv("METRICS_PORT")))
+
+DEFAULT_DOCUMENT = "Default Insurance Policies"
+DEFAULT_KNOWLEDGE_BASE = "default"
+APOLOGY_RESPONSE = "I apologize, but I'm having trouble processing your question. Let me connect you with a customer support executive who can help you better."
+
+# The conversation lives in the session store, under the id kept in the page URL, so
+# it survives reloads and restarts; st.session_state only holds small per-tab values.
+store = get_session_store()
+
+if "session_id" not in st.session_state:
+    session_id = st.query_params.get("session")
+    session = store.get_session(session_id) if session_id else None
+    if session is None:
+        session_id = store.create_session(DEFAULT_DOCUMENT)
+        st.query_params["session"] = session_id
+        session = store.get_session(session_id)
+    st.session_state.session_id = session_id
+    st.session_state.active_document = session["document"] or DEFAULT_DOCUMENT
+    last_message = store.recent_messages(session_id, 1)
+    st.session_state.typed_until = last_message[0]["seq"] if last_message else -1
 if "documents" not in st.session_state:
-    st.session_state.documents = {} 
-if "active_document" not in st.session_state:
-    st.session_state.active_document = None
-if "chatbot" not in st.session_state:
-    st.session_state.chatbot = None
-if "feedback_given" not in st.session_state:
-    st.session_state.feedback_given = set() 
+    # Document name -> KNOWLEDGE_BASES key. Only the key is kept: the uploaded bytes are
+    # dropped once their knowledge base is built.
+    st.session_state.documents = {DEFAULT_DOCUMENT: DEFAULT_KNOWLEDGE_BASE}
+for document_name, key in list(st.session_state.documents.items()):
+    if key != DEFAULT_KNOWLEDGE_BASE and key not in KNOWLEDGE_BASES:
+        # An evicted upload cannot be rebuilt without its bytes; it has to be uploaded again.
+        del st.session_state.documents[document_name]
+if st.session_state.active_document not in st.session_state.documents:
+    # An uploaded document does not outlive the browser session it was uploaded in.
+    st.session_state.active_document = DEFAULT_DOCUMENT
+    store.set_document(st.session_state.session_id, DEFAULT_DOCUMENT)
 if "show_document_upload" not in st.session_state:
     st.session_state.show_document_upload = False 
 
+
+def upload_key(document_name, content):
+    """Cache key of an uploaded document, by content so that different files with one name are kept apart."""
+    return ("upload", document_name, hashlib.blake2b(content, digest_size=8).hexdigest())
+
+
+def _evicted_upload(document_name):
+    raise LookupError(f"{document_name} is no longer loaded; please upload it again")
+
+
+def load_knowledge_base(document_name):
+    """Shared knowledge base for a document, built on first use and kept within KB_MEMORY_BUDGET_MB."""
+    key = st.session_state.documents[document_name]
+    if key == DEFAULT_KNOWLEDGE_BASE:
+        return KNOWLEDGE_BASES.get(key, create_knowledge_base)
+    return KNOWLEDGE_BASES.get(key, lambda: _evicted_upload(document_name))
+
+
+def reload_knowledge_base():
+    """
+    Rebuild the default knowledge base, e.g. after the policy files changed.
+
+    Conversations using it, in this session and others, keep answering from the old
+    one until the new one is swapped in. Uploads are not kept on the server, so they
+    are reloaded by uploading them again.
+    """
+    return KNOWLEDGE_BASES.rebuild(DEFAULT_KNOWLEDGE_BASE, create_knowledge_base)
+
+
+def build_chatbot():
+    chatbot = InsuranceChatbot(load_knowledge_base(st.session_state.active_document))
+    restore_memory(chatbot, store, st.session_state.session_id)
+    return chatbot
+
+
+def get_chatbot():
+    """This session's chatbot; rebuilt with its conversation memory if it was evicted while idle."""
+    return ACTIVE_SESSIONS.get(st.session_state.session_id, build_chatbot)
+
+
+def switch_document(document_name, kb):
+    """Answer from another document's knowledge base, keeping the conversation."""
+    get_chatbot().index.swap(kb, label=document_name)
+    store.set_document(st.session_state.session_id, document_name)
+    st.session_state.active_document = document_name
+
+
+chatbot = None
+
 api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
+if not api_key and uses_google_backend():
     st.error(
         "Google API key not found. Please set the GOOGLE_API_KEY environment variable."
     )
@@ -35,42 +113,37 @@ if not api_key:
     )
 else:
     try:
-        if not st.session_state.documents and st.session_state.chatbot is None:
-            kb = create_knowledge_base()
-            st.session_state.chatbot = InsuranceChatbot(kb)
-            st.session_state.documents[
-                "Default Insurance Policies"] = "Default"
-            st.session_state.active_document = "Default Insurance Policies"
+        chatbot = get_chatbot()
     except Exception as e:
         st.error(f"Error initializing chatbot: {str(e)}")
 
+# FAQ answers are only warmed for the default documents, which every session shares.
+if chatbot is not None and st.session_state.documents[st.session_state.active_document] == DEFAULT_KNOWLEDGE_BASE:
+    ensure_faq_answers(chatbot.knowledge_base)
+
 
 def handle_document_upload():
     uploaded_file = st.file_uploader(
         "Upload insurance policy document (PDF)", type="pdf")
 
-    if uploaded_file is not None:
-        with tempfile.NamedTemporaryFile(delete=False,
-                                         suffix='.pdf') as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_path = tmp_file.name
-
+    if uploaded_file is None:
+        return
+    document_name = uploaded_file.name
+    content = uploaded_file.getvalue()
+    key = upload_key(document_name, content)
+    # A re-upload under an existing name replaces that document when its content differs.
+    if st.session_state.documents.get(document_name) != key:
         try:
-            kb = create_knowledge_base(custom_pdf_path=tmp_path)
-            document_name = uploaded_file.name
-            st.session_state.documents[document_name] = tmp_path
-            st.session_state.active_document = document_name
-            st.session_state.chatbot = InsuranceChatbot(kb)
+            kb = KNOWLEDGE_BASES.get(key, lambda: create_knowledge_base(
+                custom_pdf_bytes=content, source_name=document_name))
+            st.session_state.documents[document_name] = key
+            switch_document(document_name, kb)
 
             st.success(
                 f"Successfully uploaded and processed {document_name}")
-            st.session_state.chat_history = []
 
         except Exception as e:
             st.error(f"Error processing the uploaded document: {str(e)}")
-        finally:
-            import os
-            os.unlink(tmp_path)
 
 st.markdown("""
 <style>
@@ -404,16 +477,16 @@ with st.sidebar:
             if st.session_state.active_document else 0)
         
         if selected_document != st.session_state.active_document:
-            if st.session_state.documents[selected_document] == "Default":
-                kb = create_knowledge_base()
-            else:
-                kb = create_knowledge_base(custom_pdf_path=st.session_state.
-                                           documents[selected_document])
-            
-            st.session_state.chatbot = InsuranceChatbot(kb)
-            st.session_state.active_document = selected_document
-            st.session_state.chat_history = [] 
+            switch_document(selected_document, load_knowledge_base(selected_document))
             st.rerun()
+
+    if st.button("Reload Policy Documents", key="reload_documents"):
+        with st.spinner("Rebuilding the knowledge base..."):
+            try:
+                reload_knowledge_base()
+                st.success(f"Reloaded {DEFAULT_DOCUMENT}")
+            except Exception as e:
+                st.error(f"Error reloading the document: {str(e)}")
     
     st.markdown("---")
     st.markdown("""
@@ -424,7 +497,10 @@ with st.sidebar:
 
 st.markdown("<div class='chat-container'>", unsafe_allow_html=True)
 
-if not st.session_state.chat_history:
+session_id = st.session_state.session_id
+chat_history = store.recent_messages(session_id, st.session_state.get("history_window", HISTORY_WINDOW))
+
+if not chat_history:
     st.markdown("""
     ### Welcome to the Insurance Assistant!
     
@@ -439,42 +515,45 @@ if not st.session_state.chat_history:
     Ask me any insurance-related question to get started!
     """)
 
-display_chat_history(st.session_state.chat_history)
+display_chat_history(
+    chat_history,
+    hidden=store.message_count(session_id) - len(chat_history),
+    feedback=store.feedback(session_id, chat_history[0]["seq"]) if chat_history else None,
+    knowledge_base=chatbot.knowledge_base if chatbot is not None else None,
+)
 
 st.markdown("</div>", unsafe_allow_html=True) 
 
+def ask(question, caller):
+    """Answer a question in this session and store both sides of the exchange."""
+    session_id = st.session_state.session_id
+    store.append_message(session_id, "user", question)
+
+    with st.spinner("Thinking..."):
+        try:
+            chatbot = get_chatbot()
+            memory_length = len(chatbot.memory.chat_memory.messages)
+            details = chatbot.get_response_details(question)
+            store.append_message(session_id, "assistant", details["answer"],
+                                 answer_metadata(chatbot, details, memory_length))
+        except Exception as e:
+            import traceback
+            print(f"Error in {caller}: {str(e)}")
+            print(traceback.format_exc())
+
+            store.append_message(session_id, "assistant", APOLOGY_RESPONSE)
+
+
 def submit():
     if "temp_input" in st.session_state and st.session_state.temp_input:
         user_message = st.session_state.temp_input
-        temp_value = st.session_state.temp_input
         
-        if st.session_state.chatbot is None:
+        if chatbot is None:
             st.error(
                 "Chatbot is not initialized. Please check the error above.")
             return
         
-        st.session_state.chat_history.append({
-            "role": "user",
-            "content": user_message
-        })
-        
-        with st.spinner("Thinking..."):
-            try:
-                response = st.session_state.chatbot.get_response(user_message)
-                
-                st.session_state.chat_history.append({
-                    "role": "assistant",
-                    "content": response
-                })
-            except Exception as e:
-                import traceback
-                print(f"Error in submit: {str(e)}")
-                print(traceback.format_exc())
-                
-                st.session_state.chat_history.append({
-                    "role": "assistant",
-                    "content": "I apologize, but I'm having trouble processing your question. Let me connect you with a customer support executive who can help you better."
-                })
+        ask(user_message, "submit")
         
         if "clear_input" not in st.session_state:
             st.session_state.clear_input = True
@@ -482,29 +561,11 @@ def submit():
         st.rerun()
 
 def process_faq(question):
-    if st.session_state.chatbot is None:
+    if chatbot is None:
         st.error("Chatbot is not initialized. Please check the error above.")
         return
     
-    st.session_state.chat_history.append({"role": "user", "content": question})
-    
-    with st.spinner("Thinking..."):
-        try:
-            response = st.session_state.chatbot.get_response(question)
-            
-            st.session_state.chat_history.append({
-                "role": "assistant",
-                "content": response
-            })
-        except Exception as e:
-            import traceback
-            print(f"Error in process_faq: {str(e)}")
-            print(traceback.format_exc())
-            
-            st.session_state.chat_history.append({
-                "role": "assistant",
-                "content": "I apologize, but I'm having trouble processing your question. Let me connect you with a customer support executive who can help you better."
-            })
+    ask(question, "process_faq")
     
     st.rerun()
 
@@ -525,23 +586,18 @@ with st.container():
     
     with col2:
         if st.button("Clear", use_container_width=True):
-            st.session_state.chat_history = []
+            store.clear_messages(session_id)
+            if chatbot is not None:
+                chatbot.memory.clear()
+            st.session_state.typed_until = -1
+            st.session_state.pop("history_window", None)
             st.rerun()
     
     st.markdown("### Quick Questions")
-    faq_questions = [
-        "What are the eligibility criteria for life insurance?",
-        "How do I file a health insurance claim?",
-        "What does auto liability insurance cover?",
-        "What factors affect my home insurance premium?",
-        "What is the difference between term and whole life insurance?",
-        "How much coverage do I need for my car insurance?"
-    ]
-    
 
     col1, col2 = st.columns(2)
     
-    for i, question in enumerate(faq_questions):
+    for i, question in enumerate(FAQ_QUESTIONS):
         if i % 2 == 0:
             with col1:
                 if st.button(question, key=f"faq_{i}"):
@@ -551,6 +607,10 @@ with st.container():
                 if st.button(question, key=f"faq_{i}"):
                     process_faq(question)
 
+if os.getenv("MEMORY_DIAGNOSTICS", "false").lower() in ("1", "true", "yes"):
+    with st.expander("Memory diagnostics"):
+        st.json(memory_report(store=store))
+
 st.markdown("---")
 st.markdown(
     "*This chatbot uses AI to provide information about insurance policies based on our knowledge base. For complex inquiries or specific policy details, please contact our customer service.*"
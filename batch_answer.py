@@ -0,0 +1,228 @@
+"""
+Answer a file of questions without the UI.
+
+Reads questions from JSONL (one object per line with a "question" and an optional
+"id"; the line number is used when there is no id) and answers each one with the
+chatbot on a pool of worker threads, through the same retrieval, generation and
+post-processing as the app. Every question is answered as the first turn of its
+own conversation.
+
+Each answer is appended to the output JSONL as soon as it is ready:
+    {"id", "question", "answer", "sources", "kb_version", "flags", "error",
+     "timings": {"total_ms", "<stage>_ms", ...}}
+The output doubles as the checkpoint: rerunning the same command skips the ids
+already in it, so an interrupted run resumes where it stopped. Pass --overwrite to
+start over, or --retry-errors to answer failed items (errors, and retrieval-only
+answers given while the chat model was unavailable) again.
+
+Usage:
+    python batch_answer.py questions.jsonl --output answers.jsonl --concurrency 8
+    EMBEDDING_BACKEND=hashing LLM_BACKEND=fake python batch_answer.py golden_questions.jsonl --output answers.jsonl
+"""
+import os
+import json
+import time
+import argparse
+import threading
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+
+def read_questions(path):
+    """
+    Read the input JSONL.
+
+    Returns:
+        A list of {"id", "question"} items; the id is the item's "id" field or its line number
+    """
+    items, seen = [], set()
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            question = str(record.get("question") or "").strip()
+            if not question:
+                logger.warning(f"{path}:{line_number}: no question, skipped")
+                continue
+            item_id = str(record.get("id", line_number))
+            if item_id in seen:
+                logger.warning(f"{path}:{line_number}: duplicate id {item_id!r}, skipped")
+                continue
+            seen.add(item_id)
+            items.append({"id": item_id, "question": question})
+    return items
+
+
+def _failed(record) -> bool:
+    return bool(record.get("error") or record.get("flags", {}).get("degraded"))
+
+
+def load_checkpoint(path, retry_errors=False):
+    """
+    Ids already answered in an earlier run's output.
+
+    The output is rewritten without lines that do not parse (the tail of a run killed
+    mid-write) and, with retry_errors, without failed items, so new answers can be
+    appended after it.
+
+    Returns:
+        The set of ids to skip
+    """
+    if not os.path.exists(path):
+        return set()
+
+    kept, done, dropped = [], set(), 0
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                item_id = str(record["id"])
+            except (ValueError, KeyError, TypeError):
+                dropped += 1
+                continue
+            if retry_errors and _failed(record):
+                dropped += 1
+                continue
+            kept.append(line if line.endswith("\n") else line + "\n")
+            done.add(item_id)
+
+    if dropped:
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.writelines(kept)
+        os.replace(temp_path, path)
+        logger.info(f"Dropped {dropped} incomplete or failed records from {path}")
+    return done
+
+
+def answer_record(chatbot, item):
+    """Answer one item as a fresh conversation and build its output record."""
+    chatbot.memory.clear()
+    start = time.perf_counter()
+    details = chatbot.get_response_details(item["question"])
+    total = time.perf_counter() - start
+
+    trace = details["trace"]
+    timings = {"total_ms": round(total * 1000, 3)}
+    timings.update({f"{stage}_ms": round(seconds * 1000, 3) for stage, seconds in trace["spans"].items()})
+    return {
+        "id": item["id"],
+        "question": item["question"],
+        "answer": details["answer"],
+        "sources": sorted({doc.metadata.get("source", "") for doc in details["source_documents"]}),
+        "kb_version": details["kb_version"],
+        "flags": trace["flags"],
+        "error": trace["error"],
+        "timings": timings,
+    }
+
+
+def run_batch(items, output_path, knowledge_base, llm, concurrency=DEFAULT_CONCURRENCY, use_cache=True):
+    """
+    Answer items on ``concurrency`` threads, appending each record to output_path as it completes.
+
+    Each thread keeps one InsuranceChatbot over the shared knowledge base and chat
+    model and clears its memory before every question.
+
+    Returns:
+        A summary with the number of answered and failed items and the latency percentiles
+
+    Raises:
+        KeyboardInterrupt: After dropping the unfinished items, which a rerun picks up
+    """
+    from insurance_chatbot import InsuranceChatbot
+    from response_cache import RESPONSE_CACHE
+
+    local = threading.local()
+
+    def answer(item):
+        if not hasattr(local, "chatbot"):
+            local.chatbot = InsuranceChatbot(knowledge_base, verbose=False, llm=llm,
+                                             response_cache=RESPONSE_CACHE if use_cache else None)
+        return answer_record(local.chatbot, item)
+
+    latencies, failed = [], 0
+    started = time.perf_counter()
+    pending = iter(items)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-answer")
+    try:
+        with open(output_path, "a") as output:
+            in_flight = set()
+            while True:
+                # Keep the queue short so an interrupted run has little in flight.
+                for item in pending:
+                    in_flight.add(executor.submit(answer, item))
+                    if len(in_flight) >= concurrency * 2:
+                        break
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = future.result()
+                    output.write(json.dumps(record) + "\n")
+                    output.flush()
+                    latencies.append(record["timings"]["total_ms"])
+                    failed += _failed(record)
+                    if len(latencies) % 100 == 0:
+                        logger.warning(f"Answered {len(latencies)}/{len(items)}")
+    except KeyboardInterrupt:
+        # Answers still in flight may be cut short by the shutdown; leave them to the next run.
+        logger.warning(f"Interrupted after {len(latencies)}/{len(items)} answers; rerun to resume")
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    ordered = sorted(latencies)
+    return {
+        "answered": len(latencies),
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "questions_per_second": round(len(latencies) / elapsed, 3) if elapsed else None,
+        "p50_ms": ordered[len(ordered) // 2] if ordered else None,
+        "p95_ms": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] if ordered else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="Input JSONL with a 'question' (and optional 'id') per line")
+    parser.add_argument("--output", required=True, help="Output JSONL, also used to resume")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--overwrite", action="store_true", help="Discard an existing output instead of resuming")
+    parser.add_argument("--retry-errors", action="store_true", help="Answer items that failed in an earlier run again")
+    parser.add_argument("--no-cache", action="store_true", help="Generate every answer instead of using cached FAQ answers")
+    args = parser.parse_args()
+
+    from knowledge_base import create_knowledge_base
+    from model_backends import get_chat_model
+
+    logging.getLogger().setLevel(logging.WARNING)
+    items = read_questions(args.questions)
+    if args.overwrite and os.path.exists(args.output):
+        os.remove(args.output)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    done = load_checkpoint(args.output, retry_errors=args.retry_errors)
+    todo = [item for item in items if item["id"] not in done]
+    logger.warning(f"{len(items)} questions, {len(items) - len(todo)} already answered, {len(todo)} to go")
+    if not todo:
+        return
+
+    try:
+        summary = run_batch(todo, args.output, create_knowledge_base(), get_chat_model(),
+                            concurrency=args.concurrency, use_cache=not args.no_cache)
+    except KeyboardInterrupt:
+        raise SystemExit(130)
+    print(f"answered={summary['answered']} failed={summary['failed']} in {summary['seconds']:.1f}s "
+          f"({summary['questions_per_second']:.2f}/s) p50={summary['p50_ms']:.0f}ms p95={summary['p95_ms']:.0f}ms")
+    print(f"Answers written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
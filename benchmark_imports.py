@@ -0,0 +1,80 @@
+"""
+Cold-start import benchmark for the modules app.py loads at start-up.
+
+Each measurement runs in a fresh interpreter. "lazy" imports the app modules as they
+are now; "eager" first imports the LangChain/Gemini/FAISS/reportlab modules that the
+app modules used to pull in at import time, reproducing the previous cold start.
+
+Usage:
+    python benchmark_imports.py --repeat 5
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+APP_MODULES = ["model_backends", "metrics", "knowledge_base", "insurance_chatbot", "session_store",
+               "memory_accounting"]
+HEAVY_MODULES = [
+    "langchain.chains",
+    "langchain.prompts",
+    "langchain.memory",
+    "langchain.text_splitter",
+    "langchain_community.document_loaders",
+    "langchain_community.vectorstores",
+    "langchain_google_genai",
+    "google.generativeai",
+    "faiss",
+    "reportlab.pdfgen.canvas",
+]
+
+_PROBE = """
+import sys, time, json, importlib
+heavy, modules = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+start = time.perf_counter()
+for name in heavy + modules:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+elapsed = time.perf_counter() - start
+loaded = [name for name in json.loads(sys.argv[3]) if name in sys.modules]
+print(json.dumps({"seconds": elapsed, "heavy_loaded": loaded, "modules_loaded": len(sys.modules)}))
+"""
+
+
+def probe(preload):
+    output = subprocess.check_output(
+        [sys.executable, "-c", _PROBE, json.dumps(preload), json.dumps(APP_MODULES), json.dumps(HEAVY_MODULES)],
+        text=True,
+        stderr=subprocess.DEVNULL,
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for label, preload in (("lazy", []), ("eager", HEAVY_MODULES)):
+        runs = [probe(preload) for _ in range(args.repeat)]
+        results[label] = {
+            "median_seconds": statistics.median(run["seconds"] for run in runs),
+            "heavy_loaded": runs[-1]["heavy_loaded"],
+            "modules_loaded": runs[-1]["modules_loaded"],
+        }
+
+    for label, result in results.items():
+        print(
+            f"{label:>6}: {result['median_seconds'] * 1000:8.1f} ms, "
+            f"{result['modules_loaded']} modules, heavy modules loaded: {result['heavy_loaded'] or 'none'}"
+        )
+    saved = results["eager"]["median_seconds"] - results["lazy"]["median_seconds"]
+    print(f"Cold-start saving: {saved * 1000:.1f} ms ({saved / results['eager']['median_seconds']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
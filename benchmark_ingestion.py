@@ -0,0 +1,202 @@
+"""
+Ingestion benchmark over synthetic policy corpora of increasing size.
+
+Generates policy PDFs with the same reportlab writer used for the sample files,
+then, for each corpus size and in a fresh subprocess (so peak RSS is per size),
+measures parse, split, embed and index-build time, peak RSS and index size.
+
+Usage:
+    python benchmark_ingestion.py --sizes 10 100 1000 10000
+    python benchmark_ingestion.py --sizes 10 100 --baseline bench_results/ingestion-<old>.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import logging
+
+from knowledge_base import SAMPLE_POLICIES, write_policy_pdf
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+CORPUS_DIR = os.path.join("bench_corpora", "synthetic")
+RESULTS_DIR = "bench_results"
+
+CARRIERS = ["Acme Mutual", "Harbor Life", "Summit Casualty", "Prairie General", "Lakeside Assurance"]
+ENDORSEMENTS = [
+    ("WATER BACKUP ENDORSEMENT", "Covers damage caused by sewer or drain backup up to ${limit}."),
+    ("RENTAL REIMBURSEMENT", "Pays up to ${limit} per day for a rental vehicle while yours is repaired."),
+    ("ACCIDENTAL DEATH RIDER", "Pays an additional ${limit} if death results from a covered accident."),
+    ("DENTAL AND VISION ADD-ON", "Reimburses routine dental and vision care up to ${limit} per year."),
+    ("SCHEDULED PERSONAL PROPERTY", "Covers listed jewelry, art and collectibles up to ${limit} each."),
+    ("ROADSIDE ASSISTANCE", "Covers towing, jump starts and lockout service up to ${limit} per event."),
+]
+
+
+def synthetic_policy_text(index):
+    """Build a deterministic, varied policy document from the sample templates."""
+    rng = random.Random(index)
+    name, template = sorted(SAMPLE_POLICIES.items())[index % len(SAMPLE_POLICIES)]
+    lines = [
+        f"POLICY NUMBER: {name[:2].upper()}-{index:06d}",
+        f"INSURER: {rng.choice(CARRIERS)}",
+        f"ANNUAL PREMIUM: ${rng.randrange(300, 9000)}",
+        template.replace("$500", f"${rng.choice([250, 500, 750, 1000, 2500])}"),
+    ]
+    for _ in range(rng.randrange(1, 12)):
+        title, clause = rng.choice(ENDORSEMENTS)
+        lines.append(f"{title}:")
+        for clause_number in range(1, rng.randrange(3, 8)):
+            limit = rng.randrange(50, 50000)
+            lines.append(f"{clause_number}. {clause.format(limit=limit)}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def ensure_corpus(size, directory=CORPUS_DIR):
+    """Generate synthetic policy PDFs up to `size`; larger corpora are supersets of smaller ones."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    created = 0
+    for index in range(size):
+        pdf_path = os.path.join(directory, f"policy_{index:05d}.pdf")
+        if not os.path.exists(pdf_path):
+            write_policy_pdf(pdf_path, synthetic_policy_text(index))
+            created += 1
+        paths.append(pdf_path)
+    if created:
+        logger.info(f"Generated {created} synthetic policies in {directory}")
+    return paths
+
+
+def measure(size, embedding_backend, pipeline="streaming"):
+    """
+    Ingest the first `size` synthetic policies in this process and return the measurements.
+
+    The "streaming" pipeline overlaps its stages, so its per-stage times are busy times
+    that can add up to more than `total_seconds`; "batch" runs the stages one after another.
+    """
+    import resource
+    import faiss
+    from knowledge_base import iter_pdf_pages, load_pdf_files, split_documents, build_vector_store
+    from ingestion import ingest_documents
+    from retrieval import indexed_documents
+    from model_backends import get_embeddings
+    from metrics import Trace
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    paths = ensure_corpus(size)
+    embeddings = get_embeddings(embedding_backend)
+    trace = Trace("benchmark_ingestion")
+
+    start = time.perf_counter()
+    if pipeline == "streaming":
+        vector_store = ingest_documents(iter_pdf_pages(paths), embeddings, trace=trace)
+    else:
+        with trace.span("load"):
+            documents = load_pdf_files(paths)
+        trace.add_count("documents", len(documents))
+        with trace.span("split"):
+            chunks = split_documents(documents)
+        vector_store = build_vector_store(chunks, embeddings, trace)
+    total_seconds = time.perf_counter() - start
+
+    return {
+        "documents": size,
+        "pipeline": pipeline,
+        "pages": trace.counts["documents"],
+        "chunks": trace.counts["chunks"],
+        "total_seconds": total_seconds,
+        "parse_seconds": trace.spans["load"],
+        "split_seconds": trace.spans["split"],
+        "embed_seconds": trace.spans["embed"],
+        "index_seconds": trace.spans["index"],
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "index_bytes": int(faiss.serialize_index(vector_store.index).nbytes),
+        "chunk_text_bytes": sum(len(doc.page_content.encode("utf-8")) for doc in indexed_documents(vector_store)),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def _print_table(results, baseline=None):
+    columns = ["documents", "chunks", "total_seconds", "parse_seconds", "split_seconds", "embed_seconds",
+               "index_seconds", "peak_rss_bytes", "index_bytes"]
+    baseline_by_size = {row["documents"]: row for row in (baseline or {}).get("results", [])}
+    print(" | ".join(f"{column:>15}" for column in columns))
+    for row in results:
+        cells = []
+        for column in columns:
+            value = row[column]
+            cell = f"{value:.3f}" if isinstance(value, float) else str(value)
+            previous = baseline_by_size.get(row["documents"], {}).get(column)
+            if previous and column not in ("documents",):
+                cell += f" ({(value - previous) / previous:+.0%})"
+            cells.append(f"{cell:>15}")
+        print(" | ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--embedding-backend", default="hashing")
+    parser.add_argument("--pipeline", choices=["streaming", "batch"], default="streaming")
+    parser.add_argument("--output", help="Results file (default: bench_results/ingestion-<timestamp>.json)")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.embedding_backend, args.pipeline)))
+        return
+
+    ensure_corpus(max(args.sizes))
+
+    results = []
+    for size in args.sizes:
+        logger.info(f"Benchmarking ingestion of {size} documents")
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), "--worker", str(size),
+             "--embedding-backend", args.embedding_backend, "--pipeline", args.pipeline],
+            text=True,
+        )
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    report = {
+        "benchmark": "ingestion",
+        "revision": _git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "embedding_backend": args.embedding_backend,
+        "pipeline": args.pipeline,
+        "results": results,
+    }
+
+    output_path = args.output or os.path.join(RESULTS_DIR, f"ingestion-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    _print_table(results, baseline)
+    print(f"\nResults written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
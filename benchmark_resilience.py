@@ -0,0 +1,156 @@
+"""
+Resilience layer check on the offline fake chat model.
+
+Three scenarios, each with its own circuit breaker:
+  tail      - a fake model with a heavy log-normal latency tail, called (blocking and
+              streamed) with hedging off and on; reports p50/p95/p99 latency and how
+              many hedges fired
+  outage    - every call fails; the breaker should open after LLM_BREAKER_FAILURES
+              failures, answers degrade to policy excerpts without calling the model,
+              and the breaker closes again once the model recovers
+  deadline  - the model is slower than the request deadline; answers degrade to
+              excerpts after the deadline instead of hanging
+
+Usage:
+    python benchmark_resilience.py --calls 300 --concurrency 8
+"""
+import time
+import argparse
+import statistics
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PROMPT = (
+    "CONTEXT INFORMATION:\nCollision Coverage: Pays for damage to your vehicle from an accident\n"
+    "PREVIOUS CONVERSATION:\n\nCURRENT QUESTION: What does collision coverage pay for?\nYOUR RESPONSE:"
+)
+
+
+def _percentiles(latencies):
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "mean_ms": statistics.mean(ordered) * 1000}
+
+
+def tail_scenario(calls, concurrency, ttft_ms, sigma):
+    from offline_models import FakeChatModel
+    from resilient_model import ResilientChatModel
+    from metrics import REGISTRY
+
+    rows = []
+    for mode, hedge in [(mode, hedge) for mode in ("invoke", "stream") for hedge in (False, True)]:
+        name = f"tail-{mode}-{'hedged' if hedge else 'plain'}"
+        model = ResilientChatModel(
+            primary=FakeChatModel(ttft_ms=ttft_ms, ttft_sigma=sigma, seed=1),
+            fallback=FakeChatModel(ttft_ms=ttft_ms, ttft_sigma=sigma, seed=2),
+            hedge=hedge,
+            breaker_name=name,
+        )
+
+        def call(_):
+            start = time.perf_counter()
+            if mode == "stream":
+                for _ in model.stream(PROMPT):
+                    pass
+            else:
+                model.invoke(PROMPT)
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            latencies = list(executor.map(call, range(calls)))
+        hedges = REGISTRY.counter("llm_calls").value(backend=name, outcome="hedge_started")
+        rows.append({"scenario": "tail", "mode": mode, "hedge": hedge, "calls": calls, "hedges_started": int(hedges),
+                     **_percentiles(latencies)})
+    return rows
+
+
+def _chatbot(model, knowledge_base):
+    from insurance_chatbot import InsuranceChatbot
+
+    return InsuranceChatbot(knowledge_base, verbose=False, llm=model, single_flight=None, response_cache=None)
+
+
+def outage_scenario(knowledge_base, questions, reset_seconds):
+    from offline_models import FakeChatModel
+    from resilient_model import ResilientChatModel
+
+    primary = FakeChatModel(ttft_ms=20, failure_rate=1.0, seed=3)
+    model = ResilientChatModel(primary=primary, hedge=False, breaker_name="outage")
+    model.breaker.reset_timeout = reset_seconds
+
+    rows = []
+    for phase in ("failing", "recovered"):
+        if phase == "recovered":
+            primary.failure_rate = 0.0
+            time.sleep(reset_seconds)
+        for question in questions:
+            start = time.perf_counter()
+            details = _chatbot(model, knowledge_base).get_response_details(question)
+            flags = details["trace"]["flags"]
+            rows.append({
+                "scenario": "outage",
+                "phase": phase,
+                "breaker": model.breaker.state,
+                "degraded_reason": flags.get("degraded_reason"),
+                "error": details["trace"]["error"],
+                "latency_ms": (time.perf_counter() - start) * 1000,
+            })
+    return rows
+
+
+def deadline_scenario(knowledge_base, questions, timeout):
+    from offline_models import FakeChatModel
+    from resilient_model import ResilientChatModel
+
+    model = ResilientChatModel(primary=FakeChatModel(ttft_ms=timeout * 4000, seed=4), hedge=False,
+                               timeout=timeout, breaker_name="deadline")
+    rows = []
+    for question in questions:
+        start = time.perf_counter()
+        details = _chatbot(model, knowledge_base).get_response_details(question)
+        rows.append({
+            "scenario": "deadline",
+            "timeout_ms": timeout * 1000,
+            "degraded_reason": details["trace"]["flags"].get("degraded_reason"),
+            "latency_ms": (time.perf_counter() - start) * 1000,
+            "answer_starts": details["answer"][:40],
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ttft-ms", type=float, default=200.0)
+    parser.add_argument("--sigma", type=float, default=0.8)
+    parser.add_argument("--breaker-reset", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=0.5)
+    args = parser.parse_args()
+
+    from knowledge_base import create_knowledge_base
+
+    logging.getLogger().setLevel(logging.ERROR)
+    knowledge_base = create_knowledge_base()
+    questions = [
+        "What does collision coverage pay for?",
+        "How do I file a home insurance claim?",
+        "What is a health insurance deductible?",
+    ] * 3
+
+    for row in tail_scenario(args.calls, args.concurrency, args.ttft_ms, args.sigma):
+        print(f"tail     {row['mode']:6} hedge={str(row['hedge']):5} calls={row['calls']} hedges={row['hedges_started']:4d} "
+              f"p50={row['p50_ms']:7.1f}ms p95={row['p95_ms']:7.1f}ms p99={row['p99_ms']:7.1f}ms")
+    for row in outage_scenario(knowledge_base, questions, args.breaker_reset):
+        print(f"outage   {row['phase']:9} breaker={row['breaker']:9} degraded={row['degraded_reason']} "
+              f"latency={row['latency_ms']:6.1f}ms")
+    for row in deadline_scenario(knowledge_base, questions[:3], args.timeout):
+        print(f"deadline timeout={row['timeout_ms']:.0f}ms degraded={row['degraded_reason']} "
+              f"latency={row['latency_ms']:6.1f}ms answer='{row['answer_starts']}...'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Per-session memory footprint of the conversation state, before and after the session store.
+
+For synthetic conversations of increasing length this compares:
+  session_state  - the old layout: chat_history dicts, displayed_messages and
+                   feedback_given in st.session_state plus the chatbot's LangChain memory
+  active         - a session in use with the store: the chatbot's LangChain memory and
+                   the recent messages loaded for one rerun
+  restored       - the same after eviction and rebuild, where memory is restored with
+                   at most SESSION_MEMORY_TURNS turns
+  evicted        - an idle session dropped from memory: nothing but its rows on disk
+and reports the bytes on disk per session, the time to load the recent messages for a
+rerun, and the time to rebuild a chatbot's memory from the store after eviction.
+
+Usage:
+    python benchmark_sessions.py --sessions 50 --turns 10,50,200
+"""
+import os
+import time
+import json
+import argparse
+import logging
+import tempfile
+import statistics
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+QUESTION = "What does my auto insurance policy cover if I hit a parked car? "
+ANSWER = (
+    "Collision coverage pays for damage to your vehicle from an accident with another car or object, "
+    "subject to your deductible. Liability coverage pays for the damage you cause to the other vehicle. "
+)
+
+
+class _Memory:
+    """Stands in for InsuranceChatbot: only the conversation memory matters here."""
+
+    def __init__(self):
+        from langchain.memory import ConversationBufferMemory
+
+        self.memory = ConversationBufferMemory(
+            memory_key="chat_history", return_messages=True, input_key="question", output_key="answer"
+        )
+
+
+def _session_state_layout(turns):
+    chatbot = _Memory()
+    chat_history = []
+    for turn in range(turns):
+        chat_history.append({"role": "user", "content": f"{QUESTION}{turn}"})
+        chat_history.append({"role": "assistant", "content": f"{ANSWER}{turn}"})
+        chatbot.memory.save_context({"question": f"{QUESTION}{turn}"}, {"answer": f"{ANSWER}{turn}"})
+    state = {
+        "chat_history": chat_history,
+        "displayed_messages": set(range(1, 2 * turns, 2)),
+        "feedback_given": set(range(1, 2 * turns, 4)),
+    }
+    return state, chatbot
+
+
+def _fill_store(store, turns):
+    session_id = store.create_session("Default Insurance Policies")
+    for turn in range(turns):
+        store.append_message(session_id, "user", f"{QUESTION}{turn}")
+        seq = store.append_message(session_id, "assistant", f"{ANSWER}{turn}", {
+            "sources": ["sample_insurance_policies/auto_insurance.pdf"],
+            "kb_version": "0123456789abcdef",
+            "raw_answer": f"{ANSWER}{turn}",
+        })
+        if turn % 2 == 0:
+            store.record_feedback(session_id, seq, "positive")
+    return session_id
+
+
+def measure(turns, sessions, directory):
+    from session_store import SessionStore, approximate_size, restore_memory
+    from utils import HISTORY_WINDOW
+
+    state, chatbot = _session_state_layout(turns)
+    old_bytes = approximate_size(state) + approximate_size(chatbot.memory)
+
+    path = os.path.join(directory, f"sessions-{turns}.db")
+    store = SessionStore(path)
+    session_ids = [_fill_store(store, turns) for _ in range(sessions)]
+    store.close()
+    disk_bytes = sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+
+    store = SessionStore(path)
+    load_times, restore_times = [], []
+    for session_id in session_ids:
+        start = time.perf_counter()
+        recent = store.recent_messages(session_id, HISTORY_WINDOW)
+        store.message_count(session_id)
+        store.feedback(session_id, recent[0]["seq"])
+        load_times.append(time.perf_counter() - start)
+
+        rebuilt = _Memory()
+        start = time.perf_counter()
+        restore_memory(rebuilt, store, session_id)
+        restore_times.append(time.perf_counter() - start)
+    active_bytes = approximate_size(chatbot.memory) + approximate_size(recent)
+    restored_bytes = approximate_size(rebuilt.memory) + approximate_size(recent)
+    store.close()
+
+    return {
+        "turns": turns,
+        "session_state_bytes": old_bytes,
+        "active_bytes": active_bytes,
+        "restored_bytes": restored_bytes,
+        "evicted_bytes": 0,
+        "disk_bytes_per_session": disk_bytes / sessions,
+        "load_recent_ms": statistics.median(load_times) * 1000,
+        "restore_memory_ms": statistics.median(restore_times) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", default="10,50,200")
+    parser.add_argument("--output", default="bench_results/sessions.json")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for turns in (int(value) for value in args.turns.split(",")):
+            row = measure(turns, args.sessions, directory)
+            rows.append(row)
+            print(f"turns={row['turns']:4d} session_state={row['session_state_bytes'] / 1024:8.1f}KiB "
+                  f"active={row['active_bytes'] / 1024:8.1f}KiB restored={row['restored_bytes'] / 1024:7.1f}KiB evicted=0KiB "
+                  f"disk={row['disk_bytes_per_session'] / 1024:7.1f}KiB "
+                  f"load_recent={row['load_recent_ms']:.2f}ms restore={row['restore_memory_ms']:.2f}ms")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(rows, f, indent=2)
+    logger.warning(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
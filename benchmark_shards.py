@@ -0,0 +1,135 @@
+"""
+Scatter-gather retrieval over local shard processes compared with a single in-process index.
+
+Starts --shards shard processes (sharding.py) over the same documents as a single local
+knowledge base, runs the golden questions through both and reports:
+  healthy   - end-to-end and per-shard p50/p95 search latency, and the overlap of the
+              merged top-k with the single index's top-k (1.0 = identical results)
+  slow      - shard 0 answers after the deadline; searches return partial results on time
+  down      - shard 0 is stopped; searches return partial results from the other shards
+
+Usage:
+    python benchmark_shards.py --shards 4 --pdf-dir bench_corpora/synthetic --rounds 5
+"""
+import os
+import json
+import time
+import argparse
+import statistics
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else None
+
+
+def run_questions(knowledge_base, questions, k, rounds, reference=None):
+    """Search every question `rounds` times and summarize latency, shard timings and result overlap."""
+    from metrics import Trace
+    from resilience import deadline_scope
+
+    latencies, shard_seconds, overlaps, partial = [], {}, [], 0
+    for _ in range(rounds):
+        for question in questions:
+            vector = knowledge_base.embeddings.embed_query(question)
+            trace = Trace("shard_benchmark")
+            start = time.perf_counter()
+            search = getattr(knowledge_base, "similarity_search_for_question", None)
+            with deadline_scope():
+                if search is not None:
+                    docs = search(question, vector, k, trace=trace)
+                else:
+                    docs = knowledge_base.similarity_search_by_vector(vector, k=k)
+            latencies.append(time.perf_counter() - start)
+            flags = trace.finish()["flags"]
+            partial += bool(flags.get("partial_results"))
+            for shard, ms in flags.get("shard_ms", {}).items():
+                shard_seconds.setdefault(shard, []).append(ms / 1000)
+            if reference is not None:
+                expected = {doc.page_content for doc in reference[question]}
+                overlaps.append(len(expected & {doc.page_content for doc in docs}) / max(1, len(expected)))
+
+    return {
+        "searches": len(latencies),
+        "p50_ms": _percentile(latencies, 0.50),
+        "p95_ms": _percentile(latencies, 0.95),
+        "partial_share": partial / len(latencies),
+        "overlap_at_k": statistics.mean(overlaps) if overlaps else None,
+        "shards": {
+            shard: {"p50_ms": _percentile(values, 0.50), "p95_ms": _percentile(values, 0.95)}
+            for shard, values in sorted(shard_seconds.items())
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--pdf-dir", help="Documents to shard; defaults to the default policies")
+    parser.add_argument("--base-port", type=int, default=9100)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=0.5, help="Scatter deadline in seconds")
+    parser.add_argument("--output", default="bench_results/shards.json")
+    args = parser.parse_args()
+
+    os.environ.setdefault("EMBEDDING_BACKEND", "hashing")
+    from evaluate_retrieval import load_questions
+    from ingestion import ingest_documents, ingest_partitioned_documents
+    from knowledge_base import iter_documents, iter_pdf_pages, partitioning_enabled
+    from model_backends import get_embeddings
+    from sharding import ShardedKnowledgeBase, start_local_shards, stop_local_shards
+
+    logging.getLogger().setLevel(logging.WARNING)
+    questions = [item["question"] for item in load_questions()]
+    embeddings = get_embeddings()
+
+    if args.pdf_dir:
+        pdf_paths = sorted(os.path.join(args.pdf_dir, name) for name in os.listdir(args.pdf_dir) if name.endswith(".pdf"))
+        documents = iter_pdf_pages(pdf_paths)
+    else:
+        documents = iter_documents()
+    local = (ingest_partitioned_documents if partitioning_enabled() else ingest_documents)(documents, embeddings)
+    reference = {question: local.similarity_search(question, k=args.k) for question in questions}
+
+    rows = []
+    start = time.perf_counter()
+    processes, urls = start_local_shards(args.shards, args.base_port, args.pdf_dir)
+    print(f"Started {args.shards} shards in {time.perf_counter() - start:.1f}s")
+    slow_processes = []
+    try:
+        sharded = ShardedKnowledgeBase(urls, embeddings, timeout=args.timeout)
+        print("vectors per shard:", [info["vectors"] for info in sharded.shard_info])
+        rows.append({"scenario": "single_index", **run_questions(local, questions, args.k, args.rounds)})
+        rows.append({"scenario": "healthy", **run_questions(sharded, questions, args.k, args.rounds, reference)})
+
+        slow_processes, slow_urls = start_local_shards(
+            args.shards, args.base_port + args.shards, args.pdf_dir, delays_ms={0: args.timeout * 2000}, only=[0]
+        )
+        slow = ShardedKnowledgeBase(slow_urls + urls[1:], embeddings, timeout=args.timeout)
+        rows.append({"scenario": "slow", **run_questions(slow, questions, args.k, 1, reference)})
+
+        stop_local_shards(processes[:1])
+        rows.append({"scenario": "down", **run_questions(sharded, questions, args.k, 1, reference)})
+    finally:
+        stop_local_shards(processes + slow_processes)
+
+    for row in rows:
+        overlap = f"{row['overlap_at_k']:.3f}" if row["overlap_at_k"] is not None else "  -  "
+        print(f"{row['scenario']:12} searches={row['searches']:4d} p50={row['p50_ms']:7.2f}ms p95={row['p95_ms']:7.2f}ms "
+              f"partial={row['partial_share']:.2f} overlap@k={overlap}")
+        for shard, stats in row["shards"].items():
+            print(f"{'':12}   shard {shard}: p50={stats['p50_ms']:7.2f}ms p95={stats['p95_ms']:7.2f}ms")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"benchmark": "shards", "shards": args.shards, "rows": rows}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Knowledge base snapshot formats compared on size, save time and load time.
+
+Builds a knowledge base, saves its chunk texts, metadata and embeddings as
+  json      - document_to_dict per chunk plus embedding lists, one JSON file
+  pickle    - Document objects plus the embedding matrix, one pickle file
+  columnar  - kb_snapshot.py, uncompressed (memory-mapped) and with zlib / lzma
+and reports per format the size on disk, the save time, the time to load every chunk
+and embedding back, and for columnar snapshots the time to read a few chunks after
+opening (lazy access) and to load a ready-to-query knowledge base. Every load is
+checked against the original: texts, metadata and embeddings must round-trip exactly,
+and the loaded knowledge base must have the same version and answer the golden
+questions with the same chunks.
+
+Usage:
+    python benchmark_snapshots.py
+    python benchmark_snapshots.py --pdf-dir bench_corpora/synthetic --documents 1000 --repeat 3
+"""
+import os
+import json
+import time
+import pickle
+import random
+import shutil
+import argparse
+import tempfile
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+COLUMNAR_FORMATS = {"columnar": None, "columnar-zlib": "zlib", "columnar-lzma": "lzma"}
+LAZY_READS = 10
+
+
+class RoundTripError(AssertionError):
+    pass
+
+
+def extract_partitions(knowledge_base):
+    """{partition: (documents, embedding matrix)} of a FAISS or partitioned knowledge base, in index order."""
+    from kb_snapshot import _stored_vectors
+    from retrieval import indexed_documents
+
+    stores = getattr(knowledge_base, "partitions", None) or {"": knowledge_base}
+    return {name: (indexed_documents(store), _stored_vectors(store.index)) for name, store in sorted(stores.items())}
+
+
+def check_round_trip(expected, loaded, label):
+    """Raise RoundTripError unless every partition's texts, metadata and embeddings match exactly."""
+    import numpy as np
+
+    if sorted(expected) != sorted(loaded):
+        raise RoundTripError(f"{label}: partitions {sorted(loaded)} != {sorted(expected)}")
+    for name, (documents, vectors) in expected.items():
+        loaded_documents, loaded_vectors = loaded[name]
+        if [doc.page_content for doc in loaded_documents] != [doc.page_content for doc in documents]:
+            raise RoundTripError(f"{label}: chunk texts differ in partition '{name}'")
+        if [doc.metadata for doc in loaded_documents] != [doc.metadata for doc in documents]:
+            raise RoundTripError(f"{label}: chunk metadata differs in partition '{name}'")
+        if not np.array_equal(np.asarray(loaded_vectors), vectors):
+            raise RoundTripError(f"{label}: embeddings differ in partition '{name}'")
+
+
+def save_json(partitions, version, path):
+    from knowledge_base import document_to_dict
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": version,
+            "partitions": {
+                name: {"documents": [document_to_dict(doc) for doc in documents], "embeddings": vectors.tolist()}
+                for name, (documents, vectors) in partitions.items()
+            },
+        }, f)
+
+
+def load_json(path):
+    import numpy as np
+    from knowledge_base import dict_to_document
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {
+        name: ([dict_to_document(doc) for doc in part["documents"]], np.asarray(part["embeddings"], dtype=np.float32))
+        for name, part in data["partitions"].items()
+    }
+
+
+def save_pickle(partitions, version, path):
+    with open(path, "wb") as f:
+        pickle.dump({"version": version, "partitions": partitions}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)["partitions"]
+
+
+def load_columnar(path):
+    import numpy as np
+    from kb_snapshot import partition_readers
+
+    return {
+        name: (list(reader.documents()), np.array(reader.embeddings))
+        for name, reader in partition_readers(path).items()
+    }
+
+
+def read_some_chunks(path, reads=LAZY_READS, seed=0):
+    """Open a snapshot and read a few random chunks with their metadata and embeddings."""
+    from kb_snapshot import partition_readers
+
+    rng = random.Random(seed)
+    readers = [reader for reader in partition_readers(path).values() if len(reader)]
+    for _ in range(reads):
+        reader = rng.choice(readers)
+        i = rng.randrange(len(reader))
+        reader.document(i)
+        reader.embeddings[i].sum()
+
+
+def _disk_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _best(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-dir", help="Documents to index; defaults to the default policies")
+    parser.add_argument("--documents", type=int, help="Use only the first N PDFs of --pdf-dir")
+    parser.add_argument("--repeat", type=int, default=3, help="Report the best of this many loads")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--output", default="bench_results/snapshots.json")
+    args = parser.parse_args()
+
+    os.environ.setdefault("EMBEDDING_BACKEND", "hashing")
+    from evaluate_retrieval import load_questions
+    from ingestion import ingest_documents, ingest_partitioned_documents
+    from kb_snapshot import load_snapshot, save_snapshot
+    from knowledge_base import iter_documents, iter_pdf_pages, knowledge_base_version, partitioning_enabled
+    from model_backends import get_embeddings
+
+    logging.getLogger().setLevel(logging.WARNING)
+    embeddings = get_embeddings()
+    if args.pdf_dir:
+        pdf_paths = sorted(os.path.join(args.pdf_dir, name) for name in os.listdir(args.pdf_dir) if name.endswith(".pdf"))
+        documents = iter_pdf_pages(pdf_paths[:args.documents])
+    else:
+        documents = iter_documents()
+    start = time.perf_counter()
+    knowledge_base = (ingest_partitioned_documents if partitioning_enabled() else ingest_documents)(documents, embeddings)
+    build_seconds = time.perf_counter() - start
+    version = knowledge_base_version(knowledge_base)
+    original = extract_partitions(knowledge_base)
+    chunks = sum(len(documents) for documents, _ in original.values())
+    print(f"Built {chunks} chunks in {build_seconds:.2f}s (version {version})")
+
+    questions = [item["question"] for item in load_questions()]
+    reference = {question: [doc.page_content for doc in knowledge_base.similarity_search(question, k=args.k)]
+                 for question in questions}
+
+    rows = []
+    workdir = tempfile.mkdtemp(prefix="kb-snapshots-")
+    try:
+        for name, save, load in [("json", save_json, load_json), ("pickle", save_pickle, load_pickle)]:
+            path = os.path.join(workdir, f"snapshot.{name}")
+            save_seconds, _ = _best(lambda: save(original, version, path), 1)
+            load_seconds, loaded = _best(lambda: load(path), args.repeat)
+            check_round_trip(original, loaded, name)
+            rows.append({"format": name, "disk_bytes": _disk_bytes(path), "save_seconds": save_seconds,
+                         "load_seconds": load_seconds, "lazy_read_seconds": None, "knowledge_base_seconds": None})
+
+        for name, compression in COLUMNAR_FORMATS.items():
+            path = os.path.join(workdir, name)
+            save_seconds, _ = _best(lambda: save_snapshot(knowledge_base, path, compression), 1)
+            load_seconds, loaded = _best(lambda: load_columnar(path), args.repeat)
+            check_round_trip(original, loaded, name)
+            lazy_seconds, _ = _best(lambda: read_some_chunks(path), args.repeat)
+            kb_seconds, restored = _best(lambda: load_snapshot(path, embeddings), args.repeat)
+            if knowledge_base_version(restored) != version:
+                raise RoundTripError(f"{name}: loaded version {knowledge_base_version(restored)} != {version}")
+            for question in questions:
+                found = [doc.page_content for doc in restored.similarity_search(question, k=args.k)]
+                if found != reference[question]:
+                    raise RoundTripError(f"{name}: different results for {question!r}")
+            rows.append({"format": name, "disk_bytes": _disk_bytes(path), "save_seconds": save_seconds,
+                         "load_seconds": load_seconds, "lazy_read_seconds": lazy_seconds,
+                         "knowledge_base_seconds": kb_seconds})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("All formats round-tripped texts, metadata and embeddings exactly; "
+          "loaded snapshots match the original's version and search results.\n")
+    json_row = rows[0]
+    print(f"{'format':14} {'size':>10} {'vs json':>8} {'save':>9} {'load':>9} {'vs json':>8} "
+          f"{'lazy read':>10} {'to KB':>9}")
+    for row in rows:
+        lazy = f"{row['lazy_read_seconds'] * 1000:8.1f}ms" if row["lazy_read_seconds"] is not None else f"{'-':>10}"
+        to_kb = f"{row['knowledge_base_seconds'] * 1000:7.1f}ms" if row["knowledge_base_seconds"] is not None \
+            else f"{'-':>9}"
+        print(f"{row['format']:14} {row['disk_bytes'] / 1024:8.0f}KB {row['disk_bytes'] / json_row['disk_bytes']:7.2f}x "
+              f"{row['save_seconds'] * 1000:7.1f}ms {row['load_seconds'] * 1000:7.1f}ms "
+              f"{json_row['load_seconds'] / row['load_seconds']:7.1f}x {lazy} {to_kb}")
+    print(f"\nRebuilding from the documents took {build_seconds * 1000:.1f}ms.")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"benchmark": "snapshots", "chunks": chunks, "build_seconds": build_seconds, "rows": rows}, f,
+                  indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import re
+import logging
+from typing import Dict, List, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CHUNKING_STRATEGIES = ("recursive", "policy")
+POLICY_TYPES = ("auto", "health", "home", "life")
+
+_TITLE_PATTERN = re.compile(r"^(AUTO|HEALTH|HOME|LIFE)\s+INSURANCE(\s+POLICY)?\s*:?$")
+_HEADING_PATTERN = re.compile(r"^[A-Z][A-Z0-9 ,&/()'\-]{2,}:?$")
+_SOURCE_TYPE_PATTERN = re.compile(r"(auto|health|home|life)_insurance", re.IGNORECASE)
+
+# Inside an oversized section prefer to break between paragraphs, then between list
+# items (numbered or bulleted), and only then inside a line.
+_SECTION_SEPARATORS = [r"\n\n", r"\n(?=\d+[.)]\s)", r"\n(?=[-•*]\s)", r"\n", r" ", r""]
+
+
+def get_chunking_strategy(strategy=None) -> str:
+    """Resolve the chunking strategy, defaulting to the CHUNKING_STRATEGY environment variable."""
+    strategy = (strategy or os.getenv("CHUNKING_STRATEGY", "recursive")).lower()
+    if strategy not in CHUNKING_STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy '{strategy}'. Expected one of {CHUNKING_STRATEGIES}.")
+    return strategy
+
+
+def policy_type_from_source(source: str) -> Optional[str]:
+    """Policy type named in a source file name such as 'auto_insurance.pdf', if any."""
+    match = _SOURCE_TYPE_PATTERN.search(os.path.basename(str(source)))
+    return match.group(1).lower() if match else None
+
+
+def _is_heading(line: str) -> bool:
+    return bool(_HEADING_PATTERN.match(line)) and any(char.isalpha() for char in line)
+
+
+class PolicySectionSplitter:
+    """
+    Structure-aware splitter for insurance policy documents.
+
+    Text is cut into sections at ALL-CAPS headings such as "COVERAGE TYPES:" and
+    "FILING A CLAIM:". Consecutive whole sections are packed into a chunk up to
+    ``chunk_size`` without any overlap; only a section that is itself longer than
+    ``chunk_size`` is split further, preferring list-item boundaries, with
+    ``chunk_overlap`` and its heading repeated on every piece.
+
+    Each chunk gets 'section' and 'policy_type' metadata. The section and policy type
+    carry over from page to page of the same source, so an instance should be used
+    for one ingestion run.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._section_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=_SECTION_SEPARATORS,
+            is_separator_regex=True,
+        )
+        self._last_section: Dict[str, str] = {}
+        self._policy_type: Dict[str, Optional[str]] = {}
+
+    def _sections(self, text: str, source: str):
+        """Group the lines of a page into (heading, body, policy_type) sections."""
+        heading = self._last_section.get(source, "")
+        sections = [(heading, [], self._policy_type.get(source))]
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            title = _TITLE_PATTERN.match(line)
+            if title:
+                self._policy_type[source] = title.group(1).lower()
+            if _is_heading(line):
+                heading = line.rstrip(":").strip()
+                sections.append((heading, [line], self._policy_type.get(source)))
+            elif line:
+                sections[-1][1].append(line)
+        self._last_section[source] = heading
+        return [(heading, "\n".join(lines), policy_type) for heading, lines, policy_type in sections if lines]
+
+    def _pieces(self, heading: str, body: str) -> List[str]:
+        """Split an oversized section, repeating its heading on continuation pieces."""
+        pieces = self._section_splitter.split_text(body)
+        return [pieces[0]] + [f"{heading} (continued):\n{piece}" if heading else piece for piece in pieces[1:]]
+
+    def split_documents(self, documents) -> List:
+        from langchain_core.documents import Document
+
+        chunks = []
+        for document in documents:
+            source = str(document.metadata.get("source", ""))
+            if source not in self._policy_type:
+                self._policy_type[source] = policy_type_from_source(source)
+
+            pending_text, pending_headings, pending_types = [], [], []
+
+            def flush():
+                if pending_text:
+                    chunks.append(self._make_chunk(
+                        Document, document, "\n".join(pending_text), pending_headings, pending_types
+                    ))
+                pending_text.clear()
+                pending_headings.clear()
+                pending_types.clear()
+
+            for heading, body, policy_type in self._sections(document.page_content, source):
+                if len(body) > self.chunk_size:
+                    flush()
+                    for piece in self._pieces(heading, body):
+                        chunks.append(self._make_chunk(Document, document, piece, [heading], [policy_type]))
+                    continue
+                current_length = sum(len(text) + 1 for text in pending_text)
+                if pending_text and current_length + len(body) > self.chunk_size:
+                    flush()
+                pending_text.append(body)
+                pending_headings.append(heading)
+                pending_types.append(policy_type)
+            flush()
+        return chunks
+
+    @staticmethod
+    def _make_chunk(document_cls, document, text, headings, policy_types):
+        """Attach section metadata; a chunk spanning several policy types gets an empty policy_type."""
+        metadata = dict(document.metadata)
+        metadata["section"] = "; ".join(heading for heading in dict.fromkeys(headings) if heading)
+        distinct_types = set(policy_types)
+        metadata["policy_type"] = (distinct_types.pop() or "") if len(distinct_types) == 1 else ""
+        return document_cls(page_content=text, metadata=metadata)
@@ -0,0 +1,135 @@
+"""
+Compare the generic recursive splitter with the policy-aware section splitter.
+
+For each chunking strategy, splits the same documents, builds the index while
+counting the texts and estimated tokens sent to the embedding model, and runs the
+golden questions through retrieval to report hit rate (share of questions with a
+relevant chunk in the top k), recall@k and MRR.
+
+Usage:
+    python compare_chunking.py --pdf-dir bench_corpora/synthetic --k 4
+"""
+import os
+import json
+import time
+import argparse
+import logging
+
+from chunking import CHUNKING_STRATEGIES
+from evaluate_retrieval import DEFAULT_QUESTIONS, load_questions, evaluate, is_relevant
+from metrics import estimate_tokens
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def counting_embeddings(embeddings):
+    """Wrap an embedding model so the texts and tokens it is asked to embed are counted."""
+    from langchain_core.embeddings import Embeddings
+
+    class CountingEmbeddings(Embeddings):
+        def __init__(self):
+            self.texts = 0
+            self.tokens = 0
+
+        def embed_documents(self, texts):
+            self.texts += len(texts)
+            self.tokens += sum(estimate_tokens(text) for text in texts)
+            return embeddings.embed_documents(texts)
+
+        def embed_query(self, text):
+            return embeddings.embed_query(text)
+
+    return CountingEmbeddings()
+
+
+def compare(documents, questions, embeddings, k, chunk_size=1000, chunk_overlap=200, mode="dense"):
+    """Evaluate every chunking strategy over the same documents and questions."""
+    from knowledge_base import split_documents, build_vector_store
+    from retrieval import make_searcher
+
+    rows = []
+    for strategy in CHUNKING_STRATEGIES:
+        start = time.perf_counter()
+        chunks = split_documents(documents, chunk_size, chunk_overlap, strategy=strategy)
+        split_seconds = time.perf_counter() - start
+
+        counting = counting_embeddings(embeddings)
+        vector_store = build_vector_store(chunks, counting)
+        search = make_searcher(vector_store, mode)
+        hits = sum(1 for item in questions if any(is_relevant(doc, item) for doc in search(item["question"], k)))
+
+        rows.append({
+            "strategy": strategy,
+            "chunks": len(chunks),
+            "embedded_texts": counting.texts,
+            "embedded_tokens": counting.tokens,
+            "split_seconds": split_seconds,
+            "hit_rate": hits / len(questions) if questions else 0.0,
+            **evaluate(search, chunks, questions, k),
+        })
+    return rows
+
+
+def print_table(rows):
+    columns = ["strategy", "chunks", "embedded_texts", "embedded_tokens", "split_seconds",
+               "hit_rate", "recall_at_k", "mrr", "p50_ms"]
+    print(" | ".join(f"{column:>15}" for column in columns))
+    for row in rows:
+        cells = [f"{row[column]:.3f}" if isinstance(row[column], float) else str(row[column]) for column in columns]
+        print(" | ".join(f"{cell:>15}" for cell in cells))
+    if len(rows) == 2 and rows[0]["chunks"]:
+        baseline, candidate = rows
+        print(
+            f"\n{candidate['strategy']} vs {baseline['strategy']}: "
+            f"chunks {candidate['chunks'] / baseline['chunks'] - 1:+.0%}, "
+            f"embedded tokens {candidate['embedded_tokens'] / baseline['embedded_tokens'] - 1:+.0%}, "
+            f"hit rate {candidate['hit_rate'] - baseline['hit_rate']:+.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--pdf-dir", help="Compare over every PDF in this directory instead of the default policies")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--overlap", type=int, default=200)
+    parser.add_argument("--mode", default="dense")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--embedding-backend", default="hashing")
+    parser.add_argument("--output", help="Write the rows as JSON to this file")
+    args = parser.parse_args()
+
+    from knowledge_base import load_documents, load_pdf_files
+    from model_backends import get_embeddings
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.pdf_dir:
+        pdf_paths = sorted(
+            os.path.join(args.pdf_dir, name) for name in os.listdir(args.pdf_dir) if name.endswith(".pdf")
+        )
+        documents = load_pdf_files(pdf_paths)
+    else:
+        documents = load_documents()
+
+    rows = compare(
+        documents,
+        load_questions(args.questions),
+        get_embeddings(args.embedding_backend),
+        args.k,
+        args.chunk_size,
+        args.overlap,
+        args.mode,
+    )
+    print_table(rows)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"comparison": "chunking", "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "rows": rows}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Retrieval quality and latency evaluation against a golden question set.
+
+For every combination of chunk size, chunk overlap, partitioning, index type, search
+mode and k, builds the knowledge base, runs each golden question through retrieval and
+reports recall@k, MRR, p50/p95 retrieval latency and the share of indexed vectors each
+question searched, side by side. Partitioned knowledge bases (one index per policy
+type with keyword routing) support dense search only.
+
+A retrieved chunk counts as relevant when it belongs to the question's policy type
+and contains at least one of its relevant phrases. The rows are also written as JSON to
+bench_results/retrieval.json (see --output).
+
+Usage:
+    python evaluate_retrieval.py --chunk-sizes 500 1000 --overlaps 0 200 --k 2 4 \
+        --index-types flat hnsw --modes dense hybrid --partitioning none policy_type
+"""
+import os
+import json
+import time
+import argparse
+import itertools
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUESTIONS = "golden_questions.jsonl"
+PARTITIONINGS = ("none", "policy_type")
+RESULTS_DIR = "bench_results"
+
+
+def load_questions(path=DEFAULT_QUESTIONS):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_relevant(doc, item) -> bool:
+    """Check whether a chunk answers a golden question."""
+    policy_type = item.get("policy_type")
+    text = doc.page_content.lower()
+    if policy_type:
+        source = os.path.basename(str(doc.metadata.get("source", ""))).lower()
+        matches_type = (
+            source.startswith(f"{policy_type}_")
+            or doc.metadata.get("policy_type") == policy_type
+            or f"{policy_type} insurance policy" in text
+        )
+        if not matches_type:
+            return False
+    phrases = item.get("relevant_phrases") or []
+    return not phrases or any(phrase.lower() in text for phrase in phrases)
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[position]
+
+
+def evaluate(search, all_chunks, questions, k):
+    """
+    Run every question through `search` and compute recall@k, MRR and latency percentiles.
+
+    Args:
+        search: Callable taking (query, k) and returning ranked Documents
+        all_chunks: Every chunk in the index, used to count the relevant chunks per question
+        questions: Golden question records; must not be empty
+        k: Number of results to retrieve
+    """
+    if not questions:
+        raise ValueError("No questions to evaluate; the golden question set is empty")
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for item in questions:
+        total_relevant = sum(1 for chunk in all_chunks if is_relevant(chunk, item))
+
+        start = time.perf_counter()
+        results = search(item["question"], k)
+        latencies.append(time.perf_counter() - start)
+
+        hits = [is_relevant(doc, item) for doc in results]
+        if total_relevant:
+            recalls.append(sum(hits) / min(total_relevant, k))
+        reciprocal_ranks.append(next((1.0 / (rank + 1) for rank, hit in enumerate(hits) if hit), 0.0))
+
+    return {
+        "recall_at_k": sum(recalls) / len(recalls) if recalls else 0.0,
+        "mrr": sum(reciprocal_ranks) / len(reciprocal_ranks) if reciprocal_ranks else 0.0,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "questions": len(questions),
+    }
+
+
+def searched_share(knowledge_base, questions) -> float:
+    """Average share of the indexed vectors that a partitioned knowledge base searches per question."""
+    sizes = knowledge_base.partition_sizes()
+    total = sum(sizes.values())
+    shares = [
+        sum(sizes[name] for name in knowledge_base.route(item["question"])[0]) / total
+        for item in questions
+    ]
+    return sum(shares) / len(shares) if shares else 1.0
+
+
+def run_matrix(documents, questions, chunk_sizes, overlaps, index_types, modes, ks, embeddings,
+               partitionings=("none",)):
+    """Evaluate every configuration in the cartesian product of the given options."""
+    from knowledge_base import split_documents, build_vector_store
+    from partitioning import build_partitioned_knowledge_base
+    from retrieval import make_searcher
+
+    rows = []
+    for chunk_size, overlap in itertools.product(chunk_sizes, overlaps):
+        if overlap >= chunk_size:
+            continue
+        chunks = split_documents(documents, chunk_size=chunk_size, chunk_overlap=overlap)
+        for partitioning, index_type in itertools.product(partitionings, index_types):
+            if partitioning == "policy_type":
+                vector_store = build_partitioned_knowledge_base(chunks, embeddings, index_type=index_type)
+                searched = searched_share(vector_store, questions)
+            else:
+                vector_store = build_vector_store(chunks, embeddings, index_type=index_type)
+                searched = 1.0
+            for mode in modes:
+                if partitioning == "policy_type" and mode != "dense":
+                    continue
+                search = make_searcher(vector_store, mode)
+                for k in ks:
+                    result = evaluate(search, chunks, questions, k)
+                    rows.append({
+                        "chunk_size": chunk_size,
+                        "chunk_overlap": overlap,
+                        "partitioning": partitioning,
+                        "index_type": index_type,
+                        "mode": mode,
+                        "k": k,
+                        "chunks": len(chunks),
+                        "searched": searched,
+                        **result,
+                    })
+    return rows
+
+
+def print_table(rows):
+    columns = ["chunk_size", "chunk_overlap", "partitioning", "index_type", "mode", "k", "chunks",
+               "searched", "recall_at_k", "mrr", "p50_ms", "p95_ms"]
+    print(" | ".join(f"{column:>13}" for column in columns))
+    for row in rows:
+        cells = [f"{row[column]:.3f}" if isinstance(row[column], float) else str(row[column]) for column in columns]
+        print(" | ".join(f"{cell:>13}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--pdf-dir", help="Evaluate over every PDF in this directory instead of the default policies")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[1000])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[200])
+    parser.add_argument("--index-types", nargs="+", default=["flat"])
+    parser.add_argument("--modes", nargs="+", default=["dense", "hybrid"])
+    parser.add_argument("--partitioning", nargs="+", default=["none"], choices=PARTITIONINGS)
+    parser.add_argument("--k", type=int, nargs="+", default=[4])
+    parser.add_argument("--embedding-backend", default="hashing")
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "retrieval.json"),
+                        help="Write the rows as JSON to this file")
+    args = parser.parse_args()
+
+    from knowledge_base import load_documents, load_pdf_files
+    from model_backends import get_embeddings
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.pdf_dir:
+        pdf_paths = sorted(
+            os.path.join(args.pdf_dir, name) for name in os.listdir(args.pdf_dir) if name.endswith(".pdf")
+        )
+        documents = load_pdf_files(pdf_paths)
+    else:
+        documents = load_documents()
+
+    questions = load_questions(args.questions)
+    if not questions:
+        parser.error(f"{args.questions} contains no questions")
+
+    rows = run_matrix(
+        documents,
+        questions,
+        args.chunk_sizes,
+        args.overlaps,
+        args.index_types,
+        args.modes,
+        args.k,
+        get_embeddings(args.embedding_backend),
+        args.partitioning,
+    )
+    print_table(rows)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"evaluation": "retrieval", "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "rows": rows}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FEEDBACK_LOG_PATH = os.getenv("FEEDBACK_LOG_PATH", "feedback.jsonl")
+FEEDBACK_FLUSH_SECONDS = float(os.getenv("FEEDBACK_FLUSH_SECONDS", "1.0"))
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "100"))
+FEEDBACK_QUEUE_SIZE = int(os.getenv("FEEDBACK_QUEUE_SIZE", "10000"))
+FEEDBACK_UPDATES_CACHE = os.getenv("FEEDBACK_UPDATES_CACHE", "false").lower() in ("1", "true", "yes")
+
+_FLUSH = object()
+_STOP = object()
+
+
+class FeedbackLog:
+    """
+    Append-only JSONL log of answer ratings, written by a background thread.
+
+    record() only puts the event on a queue, so rating an answer never waits for the
+    disk. The writer appends events in batches: as soon as ``batch_size`` are waiting,
+    and otherwise at most ``flush_interval`` seconds after the first one arrived. Each
+    batch is fsynced before the next is taken. When the queue is full, events are
+    dropped and counted rather than blocking the caller.
+
+    With a ``cache``, rated first-turn answers also update it after they are written:
+    helpful answers are pinned in the response cache (added to it if necessary) and
+    unhelpful ones are evicted, so the next user asking gets a fresh answer.
+    """
+
+    def __init__(self, path: str = FEEDBACK_LOG_PATH, flush_interval: float = FEEDBACK_FLUSH_SECONDS,
+                 batch_size: int = FEEDBACK_BATCH_SIZE, max_queue: int = FEEDBACK_QUEUE_SIZE, cache=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.cache = cache
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="feedback-log", daemon=True)
+        self._thread.start()
+
+    def record(self, entry: Dict[str, Any], knowledge_base=None, raw_answer: str = None) -> bool:
+        """
+        Queue a rating for the log without waiting for it to be written.
+
+        Args:
+            entry: JSON-serializable event, e.g. question, answer, sources, kb_version,
+                the answer's trace flags and verdict; a 'time' field is added
+            knowledge_base: Knowledge base the answer came from, for updating the cache
+            raw_answer: Model output kept in conversation memory, for caching the answer
+
+        Returns:
+            False if the queue was full and the event was dropped
+        """
+        entry = {"time": time.time(), **entry}
+        try:
+            self._queue.put_nowait((entry, knowledge_base, raw_answer))
+        except queue.Full:
+            REGISTRY.counter("feedback_log_dropped", "Feedback events dropped by reason").inc(reason="queue_full")
+            logger.warning("Feedback log queue is full; dropping an event")
+            return False
+        REGISTRY.counter("feedback_events", "Answer ratings by verdict").inc(verdict=str(entry.get("verdict")))
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until every event queued so far is written.
+
+        Returns:
+            False if the timeout expired first
+        """
+        done = threading.Event()
+        self._queue.put((_FLUSH, done, None))
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """Write the queued events and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put((_STOP, None, None))
+            self._thread.join(timeout)
+
+    def _run(self):
+        batch: List[Tuple[Dict[str, Any], Any, Optional[str]]] = []
+        first_queued = None
+        while True:
+            timeout = None if not batch else max(0.0, first_queued + self.flush_interval - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and item[0] is _STOP:
+                self._write(batch)
+                return
+            if item is not None and item[0] is _FLUSH:
+                self._write(batch)
+                batch = []
+                item[1].set()
+                continue
+            if item is not None:
+                if not batch:
+                    first_queued = time.monotonic()
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            self._write(batch)
+            batch = []
+
+    def _write(self, batch):
+        if not batch:
+            return
+        start = time.perf_counter()
+        lines = "".join(json.dumps(entry, separators=(",", ":"), default=str) + "\n" for entry, _, _ in batch)
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            REGISTRY.counter("feedback_log_dropped", "Feedback events dropped by reason").inc(len(batch), reason="write_error")
+            logger.error(f"Could not write {len(batch)} feedback events to {self.path}: {str(e)}")
+            return
+        REGISTRY.histogram("feedback_log_flush_seconds", "Time to append and fsync a batch of feedback").observe(
+            time.perf_counter() - start
+        )
+        REGISTRY.histogram("feedback_log_batch_size", "Feedback events per write").observe(len(batch))
+
+        if self.cache is not None:
+            for entry, knowledge_base, raw_answer in batch:
+                try:
+                    apply_feedback_to_cache(self.cache, entry, knowledge_base, raw_answer)
+                except Exception as e:
+                    logger.error(f"Could not apply feedback to the response cache: {str(e)}")
+
+
+def apply_feedback_to_cache(cache, entry: Dict[str, Any], knowledge_base, raw_answer: str = None,
+                            k: int = 4) -> Optional[str]:
+    """
+    Pin a helpful first-turn answer in the response cache, or evict an unhelpful one.
+
+    Only answers to questions asked without earlier conversation, against the current
+    version of the knowledge base, are what the cache serves, so other ratings are
+    ignored. A helpful answer that is not cached yet is added with the k chunks the
+    question retrieves now, which are the ones it was answered from. Answers flagged
+    'degraded' or 'no_information' in the entry's trace ``flags``, and error replies,
+    are never pinned: they say nothing about the policy, however they were rated.
+
+    Returns:
+        "pinned", "evicted", or None when the cache was left alone
+    """
+    from insurance_chatbot import ERROR_RESPONSE
+    from knowledge_base import knowledge_base_version
+
+    if knowledge_base is None or not entry.get("first_turn"):
+        return None
+    if entry.get("kb_version") != knowledge_base_version(knowledge_base):
+        return None
+
+    question = entry["question"]
+    if entry.get("verdict") == "negative":
+        if not cache.evict(question, knowledge_base):
+            return None
+        action = "evicted"
+    elif entry.get("verdict") == "positive":
+        flags = entry.get("flags") or {}
+        if flags.get("degraded") or flags.get("no_information") or ERROR_RESPONSE in (entry["answer"], raw_answer):
+            return None
+        if not cache.pin(question, knowledge_base):
+            if not raw_answer:
+                return None
+            source_documents = knowledge_base.similarity_search(question, k=k)
+            cache.put(question, knowledge_base, raw_answer, entry["answer"], source_documents, pinned=True)
+        action = "pinned"
+    else:
+        return None
+    REGISTRY.counter("feedback_cache_updates", "Response cache entries changed by feedback").inc(action=action)
+    return action
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_feedback_log() -> FeedbackLog:
+    """
+    Process-wide feedback log at FEEDBACK_LOG_PATH, started on first use.
+
+    It updates RESPONSE_CACHE when FEEDBACK_UPDATES_CACHE is set, and writes the queued
+    events when the process exits.
+    """
+    global _log
+    with _log_lock:
+        if _log is None:
+            cache = None
+            if FEEDBACK_UPDATES_CACHE:
+                from response_cache import RESPONSE_CACHE
+
+                cache = RESPONSE_CACHE
+            _log = FeedbackLog(cache=cache)
+            atexit.register(_log.close)
+            logger.info(f"Writing feedback to {_log.path}")
+        return _log
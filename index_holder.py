@@ -0,0 +1,204 @@
+import time
+import threading
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+from metrics import REGISTRY
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class IndexSnapshot:
+    """
+    One version of a knowledge base served by an IndexHolder.
+
+    Readers register while they use the snapshot. Once it has been swapped out
+    (``retired``), the last reader to leave releases it; a snapshot nobody was
+    reading is released by the swap itself.
+    """
+
+    def __init__(self, knowledge_base, version: int, label: str = None):
+        self.knowledge_base = knowledge_base
+        self.version = version
+        self.label = label
+        self.created = time.time()
+        self.retired = None
+        self._readers = set()
+        self._release_lock = threading.Lock()
+        self._released = threading.Event()
+        self._holder = None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._readers)
+
+    @property
+    def released(self) -> bool:
+        return self._released.is_set()
+
+    def wait_released(self, timeout: float = None) -> bool:
+        """Wait until the queries that were using this snapshot when it was retired have finished."""
+        return self._released.wait(timeout)
+
+    def _enter(self):
+        # set.add and set.discard are atomic, so registering a reader takes no lock.
+        token = object()
+        self._readers.add(token)
+        return token
+
+    def _exit(self, token):
+        self._readers.discard(token)
+        if self.retired is not None and not self._readers:
+            self._release()
+
+    def _release(self):
+        with self._release_lock:
+            if self._released.is_set():
+                return
+            self._released.set()
+        holder, self._holder = self._holder, None
+        if holder is not None:
+            holder._released(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        from knowledge_base import knowledge_base_version
+
+        return {
+            "version": self.version,
+            "label": self.label,
+            "kb_version": knowledge_base_version(self.knowledge_base),
+            "created": self.created,
+            "retired": self.retired,
+            "in_flight": self.in_flight,
+        }
+
+
+class IndexHolder:
+    """
+    Versioned, hot-swappable reference to a knowledge base.
+
+    Queries pin the current snapshot with acquire() and use it until they finish,
+    without taking a lock. A rebuild builds the next knowledge base off to the side
+    while queries keep using the current one, then swap() publishes it with a single
+    reference assignment. The old snapshot is released (``on_release`` is called and
+    the holder drops it) once the queries still using it have drained.
+    """
+
+    def __init__(self, knowledge_base, label: str = None,
+                 on_release: Callable[[IndexSnapshot], None] = None):
+        self.on_release = on_release
+        self._current = IndexSnapshot(knowledge_base, 1, label)
+        self._current._holder = self
+        self._swap_lock = threading.Lock()
+        self._draining: List[IndexSnapshot] = []
+        self._rebuilds = None
+
+    @property
+    def current(self) -> IndexSnapshot:
+        return self._current
+
+    @property
+    def knowledge_base(self):
+        return self._current.knowledge_base
+
+    @property
+    def version(self) -> int:
+        return self._current.version
+
+    @contextmanager
+    def acquire(self) -> Iterator[IndexSnapshot]:
+        """Pin the current snapshot for the duration of a query."""
+        while True:
+            snapshot = self._current
+            token = snapshot._enter()
+            # A swap between reading and registering may have retired the snapshot
+            # without seeing this reader; use the new one instead.
+            if self._current is snapshot:
+                break
+            snapshot._exit(token)
+        try:
+            yield snapshot
+        finally:
+            snapshot._exit(token)
+
+    def swap(self, knowledge_base, label: str = None) -> IndexSnapshot:
+        """
+        Publish a new knowledge base and retire the current one.
+
+        Queries started before the swap finish on the old snapshot, later ones use the
+        new one. Returns the new snapshot.
+        """
+        with self._swap_lock:
+            old = self._current
+            snapshot = IndexSnapshot(knowledge_base, old.version + 1, label if label is not None else old.label)
+            snapshot._holder = self
+            self._draining.append(old)
+            self._current = snapshot
+            old.retired = time.time()
+        REGISTRY.counter("index_swaps", "Knowledge base snapshots swapped in").inc()
+        logger.info(f"Swapped in knowledge base version {snapshot.version} ({snapshot.label}); "
+                    f"{old.in_flight} queries still on version {old.version}")
+        if not old._readers:
+            old._release()
+        return snapshot
+
+    def rebuild(self, factory: Callable[[], Any], label: str = None) -> IndexSnapshot:
+        """
+        Build a new knowledge base with `factory` and swap it in.
+
+        Queries keep using the current snapshot while it is built. If the build fails,
+        the current snapshot stays in place and the error is raised.
+        """
+        start = time.perf_counter()
+        try:
+            knowledge_base = factory()
+        except Exception as e:
+            REGISTRY.counter("index_rebuild_failures", "Knowledge base rebuilds that failed").inc()
+            logger.error(f"Rebuilding the knowledge base failed, keeping version {self.version}: {str(e)}")
+            raise
+        REGISTRY.histogram("index_rebuild_seconds", "Time to build a replacement knowledge base").observe(
+            time.perf_counter() - start
+        )
+        return self.swap(knowledge_base, label)
+
+    def rebuild_in_background(self, factory: Callable[[], Any], label: str = None) -> Future:
+        """Run rebuild() on the holder's rebuild thread; rebuilds queued behind each other run in order."""
+        with self._swap_lock:
+            if self._rebuilds is None:
+                self._rebuilds = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-rebuild")
+        return self._rebuilds.submit(self.rebuild, factory, label)
+
+    def draining(self) -> List[IndexSnapshot]:
+        """Retired snapshots that queries are still using."""
+        with self._swap_lock:
+            return list(self._draining)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "current": self._current.to_dict(),
+            "draining": [snapshot.to_dict() for snapshot in self.draining()],
+        }
+
+    def _released(self, snapshot: IndexSnapshot):
+        with self._swap_lock:
+            if snapshot in self._draining:
+                self._draining.remove(snapshot)
+        REGISTRY.histogram("index_drain_seconds", "Time from swapping a snapshot out to releasing it").observe(
+            time.time() - snapshot.retired
+        )
+        logger.info(f"Released knowledge base version {snapshot.version} ({snapshot.label})")
+        if self.on_release is not None:
+            try:
+                self.on_release(snapshot)
+            except Exception as e:
+                logger.error(f"Error releasing knowledge base version {snapshot.version}: {str(e)}")
+
+
+def as_index_holder(knowledge_base, label: str = None) -> IndexHolder:
+    """Return `knowledge_base` if it already is an IndexHolder, otherwise a holder serving it."""
+    if isinstance(knowledge_base, IndexHolder):
+        return knowledge_base
+    return IndexHolder(knowledge_base, label)
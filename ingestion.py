@@ -0,0 +1,199 @@
+import queue
+import threading
+import logging
+
+from knowledge_base import make_text_splitter, create_empty_vector_store, new_content_digest, update_content_version
+from metrics import Trace, estimate_tokens
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_QUEUE_SIZE = 4
+# IVF quantizers need a training sample larger than one batch: the first vectors of each
+# partition are held back until this many are gathered (or the input ends) and the index
+# is trained on all of them. About 39 vectors per inverted list for up to 64 lists.
+IVF_TRAINING_SAMPLE = 2496
+
+_DONE = object()
+
+
+class _StageFailure:
+    """Carries an exception from a pipeline stage to the stage downstream of it."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _put(target: queue.Queue, item, stop: threading.Event):
+    """Block until there is room in the queue, giving up if the pipeline was stopped."""
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _drain(source: queue.Queue, stop: threading.Event):
+    """Yield items from an upstream queue until it is exhausted, re-raising upstream failures."""
+    while not stop.is_set():
+        try:
+            item = source.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _StageFailure):
+            raise item.error
+        yield item
+
+
+def _start_stage(name, work, output: queue.Queue, stop: threading.Event):
+    def run():
+        try:
+            work()
+        except BaseException as e:
+            _put(output, _StageFailure(e), stop)
+        finally:
+            _put(output, _DONE, stop)
+
+    thread = threading.Thread(target=run, name=f"ingestion-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def _embedded_batches(documents, embeddings, trace, splitter, batch_size, queue_size):
+    """
+    Run the parse/split and embed stages in the background, yielding (chunks, vectors) batches.
+    """
+    chunk_batches = queue.Queue(maxsize=queue_size)
+    embedded_batches = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def parse_and_split():
+        pages = iter(documents)
+        batch = []
+        while not stop.is_set():
+            with trace.span("load"):
+                page = next(pages, None)
+            if page is None:
+                break
+            trace.add_count("documents")
+            with trace.span("split"):
+                chunks = splitter.split_documents([page])
+            for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    _put(chunk_batches, batch, stop)
+                    batch = []
+        if batch:
+            _put(chunk_batches, batch, stop)
+
+    def embed():
+        for batch in _drain(chunk_batches, stop):
+            texts = [chunk.page_content for chunk in batch]
+            with trace.span("embed"):
+                vectors = embeddings.embed_documents(texts)
+            trace.add_tokens("embedding", sum(estimate_tokens(text) for text in texts))
+            _put(embedded_batches, (batch, vectors), stop)
+
+    _start_stage("split", parse_and_split, chunk_batches, stop)
+    _start_stage("embed", embed, embedded_batches, stop)
+
+    try:
+        yield from _drain(embedded_batches, stop)
+    finally:
+        stop.set()
+
+
+def ingest_documents(documents, embeddings, trace=None, splitter=None, index_type="flat",
+                     batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Build a FAISS knowledge base from a stream of documents with bounded memory.
+
+    Parsing/splitting, embedding and index insertion run as three overlapping stages
+    connected by bounded queues (pages -> chunk batches -> embedded batches -> index),
+    so at most ``queue_size`` batches are in flight between any two stages no matter
+    how large the source documents are. For ``index_type="ivf"`` the index stage also
+    holds back up to IVF_TRAINING_SAMPLE vectors per partition to train the quantizer on.
+
+    Args:
+        documents: Iterable of Document objects, typically one per PDF page (may be a generator)
+        embeddings: Embedding model used for the chunks
+        trace: Optional Trace receiving 'load', 'split', 'embed' and 'index' busy times
+        splitter: Text splitter; defaults to make_text_splitter()
+        index_type: FAISS index flavour, see knowledge_base.INDEX_TYPES
+        batch_size: Number of chunks embedded and inserted per batch
+        queue_size: Maximum number of batches buffered between two stages
+
+    Returns:
+        A FAISS vector store whose 'version' is a digest of the indexed chunk texts
+    """
+    stores = _ingest(documents, embeddings, lambda chunk: None, trace, splitter, index_type, batch_size, queue_size)
+    return stores[None]
+
+
+def ingest_partitioned_documents(documents, embeddings, trace=None, splitter=None, index_type="flat",
+                                 batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Build a knowledge base with one FAISS index per policy type from a stream of documents.
+
+    Runs the same pipeline as ingest_documents; the index stage sends each chunk to the
+    index of its partition (see partitioning.partition_key).
+
+    Returns:
+        A PartitionedKnowledgeBase
+    """
+    from partitioning import PartitionedKnowledgeBase, partition_key
+
+    stores = _ingest(documents, embeddings, partition_key, trace, splitter, index_type, batch_size, queue_size)
+    logger.info(f"Indexed partitions: {', '.join(f'{name}={store.index.ntotal}' for name, store in sorted(stores.items()))}")
+    return PartitionedKnowledgeBase(stores, embeddings)
+
+
+def _add_group(vector_store, group):
+    vector_store.add_embeddings(
+        [(chunk.page_content, vector) for chunk, vector in group],
+        metadatas=[chunk.metadata for chunk, _ in group],
+    )
+
+
+def _ingest(documents, embeddings, partition_by, trace, splitter, index_type, batch_size, queue_size):
+    """Run the ingestion pipeline, inserting each chunk into the vector store of its partition."""
+    trace = trace or Trace("ingestion")
+    splitter = splitter or make_text_splitter()
+
+    training_size = IVF_TRAINING_SAMPLE if index_type == "ivf" else 0
+    stores = {}
+    digests = {}
+    pending = {}
+    for batch, vectors in _embedded_batches(documents, embeddings, trace, splitter, batch_size, queue_size):
+        groups = {}
+        for chunk, vector in zip(batch, vectors):
+            groups.setdefault(partition_by(chunk), []).append((chunk, vector))
+        with trace.span("index"):
+            for name, group in groups.items():
+                if name not in stores:
+                    pending.setdefault(name, []).extend(group)
+                    if len(pending[name]) < training_size:
+                        continue
+                    group = pending.pop(name)
+                    stores[name] = create_empty_vector_store(embeddings, [vector for _, vector in group], index_type)
+                _add_group(stores[name], group)
+        for name, group in groups.items():
+            if name not in digests:
+                digests[name] = new_content_digest()
+            update_content_version(digests[name], (chunk.page_content for chunk, _ in group))
+        trace.add_count("chunks", len(batch))
+
+    with trace.span("index"):
+        for name, group in pending.items():
+            stores[name] = create_empty_vector_store(embeddings, [vector for _, vector in group], index_type)
+            _add_group(stores[name], group)
+
+    if not stores:
+        raise ValueError("No text could be extracted from the provided documents.")
+    for name, vector_store in stores.items():
+        vector_store.version = digests[name].hexdigest()
+    return stores
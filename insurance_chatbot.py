@@ -1,43 +1,91 @@
 import os
-from typing import List, Dict, Any
-import google.generativeai as genai
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
+from typing import List, Dict, Any, Iterator, Optional
 import logging
+from model_backends import get_chat_model
+from metrics import Trace, estimate_tokens
+from singleflight import REQUEST_FLIGHTS, request_key
+from response_cache import RESPONSE_CACHE
+from resilience import BackendUnavailable, deadline_scope
+from answer_guard import AnswerGuard, ESCALATION_INDICATORS, NO_INFORMATION_INDICATORS
+from index_holder import as_index_holder
+from knowledge_base import knowledge_base_version
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+OFF_TOPIC_RESPONSE = (
+    "I'm an insurance specialist and can only answer questions related to insurance policies, "
+    "coverage, premiums, and claims. Could you please ask an insurance-related question?"
+)
+
+NO_INFORMATION_RESPONSE = (
+    "I don't have enough information to answer that question completely. "
+    "Would you like me to connect you with a customer support executive who can provide you with more detailed information?"
+)
+
+RETRIEVAL_ONLY_INTRO = (
+    "Our answer service is temporarily unavailable, so here are the most relevant excerpts "
+    "from the policy documents:"
+)
+
+# Generate non-streamed answers as a stream too, so that a no-information answer is
+# cut off as soon as it is recognised; "false" restores hedged whole-answer calls.
+STREAM_GUARD = os.getenv("STREAM_GUARD", "true").lower() in ("1", "true", "yes")
+
+RETRIEVAL_ONLY_EXCERPTS = 3
+RETRIEVAL_ONLY_EXCERPT_CHARS = 400
+
+ERROR_RESPONSE = (
+    "I'm having trouble processing your request at the moment. "
+    "This could be due to technical difficulties or the complexity of your query. "
+    "Please try again or consider speaking with one of our human insurance agents for assistance."
+)
+
+
+def _format_chat_history(messages) -> str:
+    """Render memory messages the same way ConversationalRetrievalChain does."""
+    role_prefixes = {"human": "Human: ", "ai": "Assistant: "}
+    return "".join(
+        f"\n{role_prefixes.get(message.type, f'{message.type}: ')}{message.content}" for message in messages
+    )
+
+
+def _verbose_from_env() -> bool:
+    return os.getenv("CHAIN_VERBOSE", "true").lower() in ("1", "true", "yes")
+
+
 class InsuranceChatbot:
-    def __init__(self, knowledge_base):
+    def __init__(self, knowledge_base, verbose=None, llm=None, single_flight=REQUEST_FLIGHTS,
+                 response_cache=RESPONSE_CACHE):
         """
         Initialize the insurance chatbot with a knowledge base.
 
         Args:
-            knowledge_base: Vector database with insurance policy information
+            knowledge_base: Vector database with insurance policy information, or an
+                IndexHolder serving it so that it can be swapped without losing the conversation
+            verbose: Log chain prompts to stdout; defaults to the CHAIN_VERBOSE environment variable
+            llm: Chat model to use, e.g. one shared between sessions; defaults to get_chat_model()
+            single_flight: SingleFlight used to share answers to identical first-turn questions
+                asked concurrently by different chatbots; None disables coalescing
+            response_cache: ResponseCache holding precomputed answers (e.g. the warmed FAQ
+                answers) served for first-turn questions; None disables it
         """
-        self.knowledge_base = knowledge_base
-        self.api_key = os.getenv("GOOGLE_API_KEY")
+        from langchain.chains import LLMChain
+        from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
+        from langchain.chains.question_answering import load_qa_chain
+        from langchain.prompts import PromptTemplate
+        from langchain.memory import ConversationBufferMemory
 
-        if not self.api_key:
-            raise ValueError("Google API key not found. Please set the GOOGLE_API_KEY environment variable.")
+        self.index = as_index_holder(knowledge_base)
+        self.single_flight = single_flight
+        self.response_cache = response_cache
+        self.search_kwargs = {"k": 4}
+        self.verbose = _verbose_from_env() if verbose is None else verbose
 
         try:
-            genai.configure(api_key=self.api_key)
-
-            models = genai.list_models()
-            logger.info(f"Available Gemini models: {[model.name for model in models]}")
-
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-1.5-flash-latest", 
-                temperature=0.2,
-                google_api_key=self.api_key,
-                convert_system_message_to_human=True
-            )
+            self.llm = llm or get_chat_model()
         except Exception as e:
-            logger.error(f"Error initializing Gemini model: {str(e)}")
+            logger.error(f"Error initializing chat model: {str(e)}")
             raise
 
         self.memory = ConversationBufferMemory(
@@ -78,18 +126,17 @@ class InsuranceChatbot:
             input_variables=["context", "question", "chat_history"]
         )
 
-        self.chain = ConversationalRetrievalChain.from_llm(
-            llm=self.llm,
-            retriever=self.knowledge_base.as_retriever(
-                search_kwargs={"k": 4},
-                search_type="similarity" 
-            ),
-            memory=self.memory,
-            combine_docs_chain_kwargs={"prompt": QA_PROMPT},
-            return_source_documents=True,
-            verbose=True,
-            output_key="answer"  
-        )
+        # The two steps of ConversationalRetrievalChain, without its retriever: retrieval
+        # runs against the snapshot each query acquires from self.index, so nothing here
+        # keeps a swapped-out knowledge base alive.
+        self.question_generator = LLMChain(llm=self.llm, prompt=CONDENSE_QUESTION_PROMPT, verbose=self.verbose)
+        self.combine_docs_chain = load_qa_chain(self.llm, chain_type="stuff", prompt=QA_PROMPT,
+                                                verbose=self.verbose)
+
+    @property
+    def knowledge_base(self):
+        """The knowledge base new questions are answered from."""
+        return self.index.knowledge_base
 
     def get_response(self, query: str) -> str:
         """
@@ -101,48 +148,312 @@ class InsuranceChatbot:
         Returns:
             A response string with information about the insurance query
         """
+        return self.get_response_details(query)["answer"]
+
+    def get_response_details(self, query: str) -> Dict[str, Any]:
+        """
+        Answer a query and report how the answer was produced.
+
+        Args:
+            query: The user's question about insurance
+
+        Returns:
+            A dictionary with the final 'answer', the retrieved 'source_documents',
+            the request 'trace' (per-stage timings, token counts and flags) and the
+            'kb_version' of the knowledge base snapshot it was answered from
+        """
+        trace = Trace("request")
+        source_docs = []
+
+        # Answer the whole question from one snapshot, even if the index is swapped meanwhile.
+        with self.index.acquire() as snapshot:
+            knowledge_base = snapshot.knowledge_base
+            try:
+                if not self._is_insurance_related(query):
+                    trace.set_flag("off_topic")
+                    answer = OFF_TOPIC_RESPONSE
+                else:
+                    logger.info(f"Processing query: {query}")
+                    cached = self._cached_answer(query, knowledge_base, trace)
+                    if cached is not None:
+                        raw_answer, answer, source_docs = cached
+                    else:
+                        with deadline_scope():
+                            raw_answer, answer, source_docs = self._answer(query, knowledge_base, trace)
+                    self.memory.save_context({"question": query}, {"answer": raw_answer})
+
+            except Exception as e:
+                logger.error(f"Error in get_response: {type(e).__name__}: {str(e)}")
+                import traceback
+                logger.error(traceback.format_exc())
+                trace.record_error(e)
+
+                answer = ERROR_RESPONSE
+
+        return {"answer": answer, "source_documents": source_docs, "trace": trace.finish(),
+                "kb_version": knowledge_base_version(knowledge_base)}
+
+    def stream_response(self, query: str) -> Iterator[Dict[str, Any]]:
+        """
+        Answer a query, yielding the answer text as the model produces it.
+
+        Yields {"type": "token", "text": ...} events while generating, then one
+        {"type": "done", ...} event carrying the same fields as get_response_details.
+        The final 'answer' may differ from the streamed text when post-processing
+        replaces it (no-information answers) or appends an escalation offer.
+
+        Args:
+            query: The user's question about insurance
+        """
+        trace = Trace("request")
+        trace.set_flag("streamed")
+        source_docs = []
+
+        with self.index.acquire() as snapshot:
+            knowledge_base = snapshot.knowledge_base
+            try:
+                if not self._is_insurance_related(query):
+                    trace.set_flag("off_topic")
+                    answer = OFF_TOPIC_RESPONSE
+                    yield {"type": "token", "text": answer}
+                else:
+                    logger.info(f"Processing streamed query: {query}")
+                    cached = self._cached_answer(query, knowledge_base, trace)
+                    if cached is not None:
+                        raw_answer, answer, source_docs = cached
+                        self.memory.save_context({"question": query}, {"answer": raw_answer})
+                        yield {"type": "token", "text": answer}
+                        yield {"type": "done", "answer": answer, "source_documents": source_docs,
+                               "trace": trace.finish(), "kb_version": knowledge_base_version(knowledge_base)}
+                        return
+
+                    with deadline_scope():
+                        question, chat_history_text, source_docs = self._prepare(query, knowledge_base, trace)
+                        if not source_docs:
+                            trace.set_flag("no_information")
+                            raw_answer = answer = NO_INFORMATION_RESPONSE
+                            yield {"type": "token", "text": answer}
+                        else:
+                            prompt = self._answer_prompt(source_docs, question, chat_history_text)
+                            guard = AnswerGuard()
+                            pieces = []
+                            try:
+                                with trace.span("generate"):
+                                    for piece in self._stream_generation(prompt, guard, trace):
+                                        pieces.append(piece)
+                                        yield {"type": "token", "text": piece}
+                                raw_answer = "".join(pieces)
+                                answer = self._finish(query, question, chat_history_text, raw_answer, source_docs, trace,
+                                                      guard)
+                            except BackendUnavailable as e:
+                                if pieces:
+                                    raw_answer = answer = self._partial_answer(pieces, trace, e)
+                                else:
+                                    raw_answer = answer = self._retrieval_only_answer(source_docs, trace, e)
+                    self.memory.save_context({"question": query}, {"answer": raw_answer})
+
+            except Exception as e:
+                logger.error(f"Error in stream_response: {type(e).__name__}: {str(e)}")
+                trace.record_error(e)
+                answer = ERROR_RESPONSE
+
+        yield {"type": "done", "answer": answer, "source_documents": source_docs, "trace": trace.finish(),
+               "kb_version": knowledge_base_version(knowledge_base)}
+
+    def _cached_answer(self, query: str, knowledge_base, trace: Trace):
+        """Look up a precomputed answer for a first-turn question against the knowledge base."""
+        if self.response_cache is None or self.memory.chat_memory.messages:
+            return None
+        entry = self.response_cache.get(query, knowledge_base)
+        if entry is None:
+            return None
+        trace.set_flag("cache_hit")
+        return entry["raw_answer"], entry["answer"], entry["source_documents"]
+
+    def _answer(self, query: str, knowledge_base, trace: Trace):
+        """
+        Run the pipeline, sharing the work with identical concurrent first-turn questions.
+
+        A question without chat history only depends on its text and the knowledge base,
+        so concurrent chatbots asking the same one against the same knowledge base version
+        wait for a single pipeline run instead of each paying for retrieval and generation.
+        """
+        if self.single_flight is None or self.memory.chat_memory.messages:
+            return self._run_pipeline(query, knowledge_base, trace)
+
+        key = request_key(query, knowledge_base)
+        result, shared = self.single_flight.do(key, lambda: self._run_pipeline(query, knowledge_base, trace))
+        trace.set_flag("coalesced", shared)
+        return result
+
+    def _run_pipeline(self, query: str, knowledge_base, trace: Trace):
+        """
+        Run question rewriting, retrieval, generation and post-processing as timed stages.
+
+        Mirrors ConversationalRetrievalChain: the rewritten question drives retrieval and
+        generation, while the original question and the raw answer (returned alongside the
+        post-processed one) are what the caller stores in memory.
+
+        Returns:
+            A (raw_answer, answer, source_documents) tuple
+        """
+        question, chat_history_text, source_docs = self._prepare(query, knowledge_base, trace)
+        if not source_docs:
+            # Post-processing would discard whatever the model says without context.
+            trace.set_flag("no_information")
+            return NO_INFORMATION_RESPONSE, NO_INFORMATION_RESPONSE, source_docs
+
+        guard = AnswerGuard() if STREAM_GUARD else None
         try:
-            if not self._is_insurance_related(query):
-                return (
-                    "I'm an insurance specialist and can only answer questions related to insurance policies, "
-                    "coverage, premiums, and claims. Could you please ask an insurance-related question?"
-                )
+            with trace.span("generate"):
+                if guard is not None:
+                    prompt = self._answer_prompt(source_docs, question, chat_history_text)
+                    answer = "".join(self._stream_generation(prompt, guard, trace))
+                else:
+                    answer = self.combine_docs_chain.run(
+                        input_documents=source_docs,
+                        question=question,
+                        chat_history=chat_history_text,
+                    )
+        except BackendUnavailable as e:
+            answer = self._retrieval_only_answer(source_docs, trace, e)
+            return answer, answer, source_docs
 
-            logger.info(f"Processing query: {query}")
+        return answer, self._finish(query, question, chat_history_text, answer, source_docs, trace, guard), source_docs
 
-            result = self.chain({"question": query})
+    def _answer_prompt(self, source_docs, question: str, chat_history_text: str) -> str:
+        """Fill the answer prompt the way the combine-documents chain does."""
+        return self.combine_docs_chain.llm_chain.prompt.format(
+            context="\n\n".join(doc.page_content for doc in source_docs),
+            question=question,
+            chat_history=chat_history_text,
+        )
 
-            logger.info(f"Got result: {result.keys()}")
-            
-            answer = result['answer']
-            source_docs = result.get('source_documents', [])
-            
-            if not source_docs or self._is_no_information_response(answer):
-                return (
-                    "I don't have enough information to answer that question completely. "
-                    "Would you like me to connect you with a customer support executive who can provide you with more detailed information?"
-                )
+    def _stream_generation(self, prompt: str, guard: AnswerGuard, trace: Trace) -> Iterator[str]:
+        """
+        Yield the answer as the model generates it, checking each piece with the guard.
+
+        Generation is stopped as soon as the answer is recognised as a no-information
+        answer, which post-processing replaces anyway, so the rest of it is never paid for.
+        """
+        stream = self.llm.stream(prompt)
+        try:
+            for chunk in stream:
+                if not guard.chars:
+                    trace.mark("first_token")
+                yield chunk.content
+                if guard.feed(chunk.content):
+                    trace.set_flag("generation_aborted")
+                    trace.add_count("aborted_at_chars", guard.chars)
+                    break
+        finally:
+            stream.close()
 
-            if self._should_escalate(query, answer):
-                return (
-                    f"{answer}\n\n"
-                    "For this specific query, it might be better to speak with one of our human insurance agents. "
-                    "Would you like me to arrange for someone to contact you?"
-                )
+    def _prepare(self, query: str, knowledge_base, trace: Trace):
+        """Rewrite the query against the conversation so far and retrieve its context."""
+        trace.set_flag("cache_hit", False)
+        chat_history = self.memory.load_memory_variables({})[self.memory.memory_key]
+        chat_history_text = _format_chat_history(chat_history)
 
-            return answer
+        question = query
+        if chat_history:
+            try:
+                with trace.span("rewrite"):
+                    question = self.question_generator.run(question=query, chat_history=chat_history_text)
+                trace.add_tokens("prompt", estimate_tokens(chat_history_text) + estimate_tokens(query))
+                trace.add_tokens("completion", estimate_tokens(question))
+            except BackendUnavailable as e:
+                logger.warning(f"Skipping question rewrite: {str(e)}")
+                trace.set_flag("rewrite_skipped")
 
-        except Exception as e:
-            logger.error(f"Error in get_response: {type(e).__name__}: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
+        return question, chat_history_text, self._retrieve(question, knowledge_base, trace)
+
+    def _finish(self, query: str, question: str, chat_history_text: str, answer: str, source_docs, trace: Trace,
+                guard: Optional[AnswerGuard] = None) -> str:
+        """Account for the generation and post-process the answer, reusing the guard's verdicts if it has any."""
+        context_tokens = sum(estimate_tokens(doc.page_content) for doc in source_docs)
+        trace.add_tokens("prompt", context_tokens + estimate_tokens(chat_history_text) + estimate_tokens(question))
+        trace.add_tokens("completion", estimate_tokens(answer))
+
+        with trace.span("postprocess"):
+            return self._postprocess(query, answer, source_docs, trace, guard)
+
+    def _retrieve(self, question: str, knowledge_base, trace: Trace):
+        """
+        Fetch the most relevant chunks, timing query embedding and index search separately.
+
+        Knowledge bases that route by question text (see partitioning.py) are searched
+        with both the question and its embedding.
+        """
+        embeddings = getattr(knowledge_base, "embeddings", None)
+        if embeddings is None:
+            with trace.span("retrieve"):
+                retriever = knowledge_base.as_retriever(search_kwargs=self.search_kwargs, search_type="similarity")
+                return retriever.get_relevant_documents(question)
+
+        with trace.span("embed"):
+            query_vector = embeddings.embed_query(question)
+        trace.add_tokens("embedding", estimate_tokens(question))
+
+        with trace.span("search"):
+            search = getattr(knowledge_base, "similarity_search_for_question", None)
+            if search is not None:
+                return search(question, query_vector, trace=trace, **self.search_kwargs)
+            return knowledge_base.similarity_search_by_vector(query_vector, **self.search_kwargs)
+
+    def _partial_answer(self, pieces: List[str], trace: Trace, error: BackendUnavailable) -> str:
+        """
+        Degraded answer used when the model stops after part of the answer was streamed:
+        the text the client already has, rather than a different answer replacing it.
+        """
+        logger.warning(f"Ending a streamed answer early: {type(error).__name__}: {str(error)}")
+        trace.set_flag("degraded")
+        trace.set_flag("degraded_reason", type(error).__name__)
+        trace.set_flag("partial_answer")
+        return "".join(pieces)
+
+    def _retrieval_only_answer(self, source_docs, trace: Trace, error: BackendUnavailable) -> str:
+        """
+        Degraded answer used when the model backend is unavailable: quote the retrieved excerpts.
+        """
+        logger.warning(f"Answering from retrieval only: {type(error).__name__}: {str(error)}")
+        trace.set_flag("degraded")
+        trace.set_flag("degraded_reason", type(error).__name__)
+        if not source_docs:
+            return ERROR_RESPONSE
 
+        excerpts = []
+        for doc in source_docs[:RETRIEVAL_ONLY_EXCERPTS]:
+            text = " ".join(doc.page_content.split())
+            if len(text) > RETRIEVAL_ONLY_EXCERPT_CHARS:
+                text = text[:RETRIEVAL_ONLY_EXCERPT_CHARS].rsplit(" ", 1)[0] + " ..."
+            source = os.path.basename(str(doc.metadata.get("source", ""))) or "policy document"
+            excerpts.append(f"- ({source}) {text}")
+        return RETRIEVAL_ONLY_INTRO + "\n\n" + "\n".join(excerpts)
+
+    def _postprocess(self, query: str, answer: str, source_docs, trace: Trace,
+                     guard: Optional[AnswerGuard] = None) -> str:
+        """
+        Replace unhelpful answers and append an escalation offer where appropriate.
+
+        With a guard that saw the whole (or the cut-off) answer stream, its verdicts are
+        used instead of scanning the answer again.
+        """
+        no_information = guard.no_information if guard is not None else self._is_no_information_response(answer)
+        if not source_docs or no_information:
+            trace.set_flag("no_information")
+            return NO_INFORMATION_RESPONSE
+
+        if self._should_escalate(query, answer, guard):
+            trace.set_flag("escalated")
             return (
-                f"I'm having trouble processing your request at the moment. "
-                f"This could be due to technical difficulties or the complexity of your query. "
-                f"Please try again or consider speaking with one of our human insurance agents for assistance."
+                f"{answer}\n\n"
+                "For this specific query, it might be better to speak with one of our human insurance agents. "
+                "Would you like me to arrange for someone to contact you?"
             )
 
+        return answer
+
     def _is_insurance_related(self, query: str) -> bool:
         """
         Check if the query is related to insurance.
@@ -175,54 +486,20 @@ class InsuranceChatbot:
         Returns:
             Boolean indicating if the answer lacks information
         """
-        no_info_indicators = [
-            "I don't have enough information",
-            "I don't have information", 
-            "I cannot provide",
-            "I don't have specific",
-            "not included in",
-            "not mentioned in",
-            "not in the context",
-            "not available in",
-            "not specified in",
-            "not found in",
-            "I don't know",
-            "I'm not sure",
-            "cannot find",
-            "no information about",
-            "the provided context does not",
-            "no details about",
-            "cannot access",
-            "do not have access",
-            "not provided in"
-        ]
-        
-        return any(indicator.lower() in answer.lower() for indicator in no_info_indicators)
+        return any(indicator.lower() in answer.lower() for indicator in NO_INFORMATION_INDICATORS)
 
-    def _should_escalate(self, query: str, answer: str) -> bool:
+    def _should_escalate(self, query: str, answer: str, guard: Optional[AnswerGuard] = None) -> bool:
         """
         Determine if a query should be escalated to a human agent.
 
         Args:
             query: The user query
             answer: The generated answer
+            guard: AnswerGuard that checked the answer while it was generated, if any
 
         Returns:
             Boolean indicating if the query should be escalated
         """
-        complex_indicators = [
-            "would need more details",
-            "cannot accurately",
-            "specific to your situation",
-            "recommend speaking with an agent",
-            "cannot calculate",
-            "varies depending on",
-            "specific information",
-            "not in my knowledge",
-            "outside the scope",
-            "detailed answer"
-        ]
-
         complex_topics = [
             "lawsuit", "legal", "sue", "death", "dispute", "rejected claim",
             "denied", "appeal", "fraud", "investigation", "cancelation",
@@ -231,7 +508,8 @@ class InsuranceChatbot:
         ]
 
         query_lower = query.lower()
-        return (
-            any(indicator.lower() in answer.lower() for indicator in complex_indicators) or
-            any(topic in query_lower for topic in complex_topics)
-        )
\ No newline at end of file
+        if guard is not None:
+            uncertain_answer = guard.escalation
+        else:
+            uncertain_answer = any(indicator.lower() in answer.lower() for indicator in ESCALATION_INDICATORS)
+        return uncertain_answer or any(topic in query_lower for topic in complex_topics)
\ No newline at end of file
@@ -0,0 +1,460 @@
+"""
+Columnar snapshots of knowledge bases: chunk texts, metadata and embeddings.
+
+A snapshot is a directory holding one file per column plus a manifest.json:
+
+    text.bin            UTF-8 chunk texts, concatenated
+    text_offsets.bin    int64 byte offsets into text.bin, one more than there are chunks
+    metadata.json       per metadata key, the distinct values it takes
+    metadata_codes.bin  int32 (chunks x keys) index into those values, -1 when absent
+    embeddings.bin      float32 (chunks x dimension) chunk embeddings, in index order
+
+Metadata is dictionary-encoded because its values (source file, page, section, policy
+type) repeat across chunks. Uncompressed columns are memory-mapped, so opening a
+snapshot reads only the manifest and each column is paged in when first used;
+compressed columns (zlib or lzma) are smaller on disk and are read whole when first
+used. Partitioned knowledge bases are saved with one snapshot per partition under
+partitions/<name>/. Loading rebuilds the FAISS indexes from the stored embeddings,
+so nothing is embedded again.
+
+Usage:
+    python kb_snapshot.py save snapshots/default [--compression zlib]
+    python kb_snapshot.py info snapshots/default
+"""
+import os
+import json
+import lzma
+import zlib
+import shutil
+import argparse
+import logging
+from typing import Any, Dict, Iterator, List, Sequence
+
+from metrics import Trace
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FORMAT = "kb-snapshot"
+FORMAT_VERSION = 1
+COMPRESSIONS = (None, "zlib", "lzma")
+
+_COMPRESSORS = {
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (lambda data: lzma.compress(data, preset=6), lzma.decompress),
+}
+
+
+def _index_type(index) -> str:
+    import faiss
+
+    if isinstance(index, faiss.IndexHNSWFlat):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf"
+    return "flat"
+
+
+def _stored_vectors(index):
+    """Read back every vector a FAISS index holds, in index order."""
+    import faiss
+    import numpy as np
+
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def _write_column(directory: str, name: str, data: bytes, compression: str = None) -> Dict[str, Any]:
+    if compression is not None:
+        data = _COMPRESSORS[compression][0](data)
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(data)
+    return {"file": name, "bytes": len(data)}
+
+
+def write_columns(directory: str, texts: Sequence[str], metadatas: Sequence[Dict[str, Any]], vectors,
+                  version: str = None, index_type: str = "flat", compression: str = None) -> Dict[str, Any]:
+    """
+    Write one snapshot of chunks into an existing, empty directory.
+
+    Args:
+        directory: Where the column files and manifest go
+        texts: Chunk texts, in index order
+        metadatas: JSON-serializable metadata of each chunk
+        vectors: Embedding matrix, one row per chunk
+        version: Content version of the knowledge base, restored on load
+        index_type: FAISS index flavour to rebuild on load, see knowledge_base.INDEX_TYPES
+        compression: None, "zlib" or "lzma"
+
+    Returns:
+        The manifest
+    """
+    import numpy as np
+
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}'. Expected one of {COMPRESSIONS}.")
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    rows = len(texts)
+    if len(metadatas) != rows or matrix.shape[0] != rows:
+        raise ValueError(f"Columns differ in length: {rows} texts, {len(metadatas)} metadatas, "
+                         f"{matrix.shape[0]} vectors")
+
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(rows + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in encoded], out=offsets[1:])
+
+    keys: List[str] = []
+    values: Dict[str, List[Any]] = {}
+    value_codes: Dict[str, Dict[str, int]] = {}
+    codes = []
+    for metadata in metadatas:
+        for key in metadata:
+            if key not in values:
+                keys.append(key)
+                values[key] = []
+                value_codes[key] = {}
+        row = []
+        for key in keys:
+            if key not in metadata:
+                row.append(-1)
+                continue
+            # Keyed by the JSON form so that e.g. 1, 1.0, True and "1" stay distinct values.
+            value_key = json.dumps(metadata[key], sort_keys=True)
+            code = value_codes[key].get(value_key)
+            if code is None:
+                code = value_codes[key][value_key] = len(values[key])
+                values[key].append(metadata[key])
+            row.append(code)
+        codes.append(row)
+    code_matrix = np.full((rows, len(keys)), -1, dtype=np.int32)
+    for i, row in enumerate(codes):
+        code_matrix[i, :len(row)] = row
+
+    columns = {
+        "text": _write_column(directory, "text.bin", b"".join(encoded), compression),
+        "text_offsets": _write_column(directory, "text_offsets.bin", offsets.tobytes(), compression),
+        "metadata_codes": _write_column(directory, "metadata_codes.bin", code_matrix.tobytes(), compression),
+        "embeddings": _write_column(directory, "embeddings.bin", matrix.tobytes(), compression),
+    }
+    with open(os.path.join(directory, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump({"keys": keys, "values": values}, f, separators=(",", ":"))
+
+    manifest = {
+        "format": FORMAT,
+        "format_version": FORMAT_VERSION,
+        "rows": rows,
+        "dimension": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "version": version,
+        "index_type": index_type,
+        "compression": compression,
+        "metadata_keys": len(keys),
+        "columns": columns,
+    }
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _write_vector_store(directory: str, vector_store, compression: str = None) -> Dict[str, Any]:
+    from retrieval import indexed_documents
+
+    documents = indexed_documents(vector_store)
+    return write_columns(
+        directory,
+        [doc.page_content for doc in documents],
+        [doc.metadata for doc in documents],
+        _stored_vectors(vector_store.index),
+        version=getattr(vector_store, "version", None),
+        index_type=_index_type(vector_store.index),
+        compression=compression,
+    )
+
+
+def save_snapshot(knowledge_base, path: str, compression: str = None) -> Dict[str, Any]:
+    """
+    Save a FAISS or partitioned knowledge base as a snapshot directory.
+
+    The snapshot is written next to `path` and moved into place when complete, so a
+    reader never sees a half-written one and an existing snapshot is replaced whole.
+
+    Returns:
+        The top-level manifest
+    """
+    if hasattr(knowledge_base, "shard_info"):
+        raise ValueError("Sharded knowledge bases are held by the shard processes; snapshot each shard instead")
+
+    trace = Trace("snapshot_save")
+    staging = f"{path.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    try:
+        with trace.span("write"):
+            if hasattr(knowledge_base, "partitions"):
+                partitions = {}
+                for name, store in sorted(knowledge_base.partitions.items()):
+                    os.makedirs(os.path.join(staging, "partitions", name))
+                    partitions[name] = _write_vector_store(os.path.join(staging, "partitions", name), store,
+                                                           compression)
+                manifest = {
+                    "format": FORMAT,
+                    "format_version": FORMAT_VERSION,
+                    "version": knowledge_base.version,
+                    "compression": compression,
+                    "rows": sum(part["rows"] for part in partitions.values()),
+                    "partitions": sorted(partitions),
+                }
+                with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+                    json.dump(manifest, f, indent=2)
+            else:
+                manifest = _write_vector_store(staging, knowledge_base, compression)
+        trace.add_count("chunks", manifest["rows"])
+
+        previous = f"{path.rstrip(os.sep)}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.replace(path, previous)
+        os.replace(staging, path)
+        shutil.rmtree(previous, ignore_errors=True)
+    except Exception as e:
+        trace.record_error(e)
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    finally:
+        trace.finish()
+    logger.info(f"Saved a snapshot of {manifest['rows']} chunks to {path}")
+    return manifest
+
+
+def _read_manifest(path: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No knowledge base snapshot at {path}") from None
+    if manifest.get("format") != FORMAT or manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {FORMAT_VERSION} {FORMAT} snapshot")
+    return manifest
+
+
+class TextColumn(Sequence):
+    """Chunk texts of a snapshot, decoded one at a time as they are read."""
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("text index out of range")
+        return bytes(self._data[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+
+    def __iter__(self):
+        data = self._data.tobytes()
+        offsets = self._offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield data[start:end].decode("utf-8")
+
+
+class SnapshotReader:
+    """
+    Lazily loaded columns of one (unpartitioned) snapshot.
+
+    Opening a reader only reads the manifest; each column is memory-mapped, or read
+    and decompressed, the first time it is used.
+    """
+
+    def __init__(self, path: str, mmap: bool = True):
+        self.path = path
+        self.manifest = _read_manifest(path)
+        if "partitions" in self.manifest:
+            raise ValueError(f"{path} is a partitioned snapshot; read each partition with partition_readers()")
+        self.mmap = mmap and self.manifest["compression"] is None
+        self._columns = {}
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    def _column(self, name: str, dtype, shape):
+        import numpy as np
+
+        if name not in self._columns:
+            info = self.manifest["columns"][name]
+            file_path = os.path.join(self.path, info["file"])
+            if os.path.getsize(file_path) != info["bytes"]:
+                raise ValueError(f"Snapshot column {file_path} is {os.path.getsize(file_path)} bytes, "
+                                 f"expected {info['bytes']}")
+            count = int(np.prod(shape))
+            if count == 0:
+                column = np.zeros(shape, dtype=dtype)
+            elif self.mmap:
+                column = np.memmap(file_path, dtype=dtype, mode="r", shape=shape)
+            else:
+                with open(file_path, "rb") as f:
+                    data = f.read()
+                if self.manifest["compression"] is not None:
+                    data = _COMPRESSORS[self.manifest["compression"]][1](data)
+                column = np.frombuffer(data, dtype=dtype).reshape(shape)
+            self._columns[name] = column
+        return self._columns[name]
+
+    @property
+    def embeddings(self):
+        """float32 matrix with one row per chunk (read-only)."""
+        return self._column("embeddings", "float32", (len(self), self.manifest["dimension"]))
+
+    @property
+    def texts(self) -> TextColumn:
+        offsets = self._column("text_offsets", "int64", (len(self) + 1,))
+        return TextColumn(self._column("text", "uint8", (int(offsets[-1]),)), offsets)
+
+    def _metadata_dictionary(self):
+        if "metadata.json" not in self._columns:
+            with open(os.path.join(self.path, "metadata.json"), encoding="utf-8") as f:
+                self._columns["metadata.json"] = json.load(f)
+        return self._columns["metadata.json"]
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        dictionary = self._metadata_dictionary()
+        codes = self._column("metadata_codes", "int32", (len(self), self.manifest["metadata_keys"]))
+        return {
+            key: dictionary["values"][key][code]
+            for key, code in zip(dictionary["keys"], codes[i].tolist())
+            if code >= 0
+        }
+
+    def metadatas(self) -> List[Dict[str, Any]]:
+        dictionary = self._metadata_dictionary()
+        codes = self._column("metadata_codes", "int32", (len(self), self.manifest["metadata_keys"])).tolist()
+        keys, values = dictionary["keys"], dictionary["values"]
+        return [{key: values[key][code] for key, code in zip(keys, row) if code >= 0} for row in codes]
+
+    # Documents were validated when they were saved, so they are rebuilt without
+    # validating them again, as unpickling does.
+
+    def document(self, i: int):
+        from langchain_core.documents import Document
+
+        return Document.construct(page_content=self.texts[i], metadata=self.metadata(i))
+
+    def documents(self) -> Iterator:
+        from langchain_core.documents import Document
+
+        for text, metadata in zip(self.texts, self.metadatas()):
+            yield Document.construct(page_content=text, metadata=metadata)
+
+    def vector_store(self, embeddings):
+        """Build a FAISS vector store from the stored chunks and embeddings, without re-embedding them."""
+        import uuid
+        import numpy as np
+        from langchain_community.vectorstores import FAISS
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from knowledge_base import create_faiss_index
+
+        vectors = self.embeddings
+        index = create_faiss_index(self.manifest["index_type"], vectors if len(self) else np.zeros((1, vectors.shape[1])))
+        if len(self):
+            index.add(np.ascontiguousarray(vectors))
+        ids = [str(uuid.uuid4()) for _ in range(len(self))]
+        docstore = InMemoryDocstore(dict(zip(ids, self.documents())))
+        vector_store = FAISS(embeddings, index, docstore, dict(enumerate(ids)))
+        vector_store.version = self.version
+        return vector_store
+
+
+def partition_readers(path: str, mmap: bool = True) -> Dict[str, SnapshotReader]:
+    """Readers for each partition of a partitioned snapshot, or {"": reader} for an unpartitioned one."""
+    manifest = _read_manifest(path)
+    if "partitions" not in manifest:
+        return {"": SnapshotReader(path, mmap)}
+    return {name: SnapshotReader(os.path.join(path, "partitions", name), mmap) for name in manifest["partitions"]}
+
+
+def load_snapshot(path: str, embeddings=None, mmap: bool = True):
+    """
+    Load a knowledge base saved with save_snapshot.
+
+    Args:
+        path: Snapshot directory
+        embeddings: Embedding model for later queries; must be the one the snapshot was
+            built with. Defaults to get_embeddings()
+        mmap: Memory-map uncompressed columns instead of reading them
+
+    Returns:
+        A FAISS vector store, or a PartitionedKnowledgeBase for partitioned snapshots,
+        with the same content version as the saved knowledge base
+    """
+    from model_backends import get_embeddings
+
+    trace = Trace("snapshot_load")
+    try:
+        embeddings = embeddings or get_embeddings()
+        manifest = _read_manifest(path)
+        with trace.span("load"):
+            readers = partition_readers(path, mmap)
+            stores = {name: reader.vector_store(embeddings) for name, reader in readers.items()}
+        trace.add_count("chunks", manifest["rows"])
+        if "partitions" not in manifest:
+            return stores[""]
+
+        from partitioning import PartitionedKnowledgeBase
+
+        knowledge_base = PartitionedKnowledgeBase(stores, embeddings)
+        if knowledge_base.version != manifest["version"]:
+            raise ValueError(f"Snapshot {path} loaded as version {knowledge_base.version}, "
+                             f"expected {manifest['version']}")
+        return knowledge_base
+    except Exception as e:
+        trace.record_error(e)
+        raise
+    finally:
+        trace.finish()
+
+
+def snapshot_info(path: str) -> Dict[str, Any]:
+    """Manifest of a snapshot with its size on disk, and those of its partitions."""
+    manifest = _read_manifest(path)
+    info = dict(manifest)
+    info["disk_bytes"] = sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    )
+    if "partitions" in manifest:
+        info["partitions"] = {
+            name: _read_manifest(os.path.join(path, "partitions", name)) for name in manifest["partitions"]
+        }
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    save = subparsers.add_parser("save", help="Build the default knowledge base (or --pdf) and snapshot it")
+    save.add_argument("path")
+    save.add_argument("--pdf", help="Snapshot this PDF instead of the default policies")
+    save.add_argument("--compression", choices=[c for c in COMPRESSIONS if c])
+    info = subparsers.add_parser("info", help="Print a snapshot's manifest and size")
+    info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "save":
+        from knowledge_base import create_knowledge_base
+
+        knowledge_base = create_knowledge_base(custom_pdf_path=args.pdf)
+        save_snapshot(knowledge_base, args.path, args.compression)
+    print(json.dumps(snapshot_info(args.path), indent=2))
+
+
+if __name__ == "__main__":
+    main()
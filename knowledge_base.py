@@ -1,55 +1,121 @@
-import os
-import tempfile
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
-import google.generativeai as genai
-import logging
 import io
-import re
 import os
+import hashlib
+from model_backends import get_embeddings
+from metrics import Trace, estimate_tokens
+import logging
+
+# LangChain loaders, splitters, FAISS and reportlab are imported inside the functions
+# that use them so that importing this module (e.g. on app start-up) stays cheap.
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def create_knowledge_base(custom_pdf_path=None, custom_text=None):
+def partitioning_enabled() -> bool:
+    """Whether knowledge bases are partitioned by policy type by default (KB_PARTITIONED, off unless set)."""
+    return os.getenv("KB_PARTITIONED", "false").lower() in ("1", "true", "yes")
+
+
+def create_knowledge_base(custom_pdf_path=None, custom_text=None, custom_pdf_bytes=None, source_name=None,
+                          partitioned=None):
     """
     Create a knowledge base from insurance policy documents or custom text.
     
     Args:
         custom_pdf_path: Path to a custom PDF document
         custom_text: Custom text to use instead of documents
+        custom_pdf_bytes: Custom PDF content held in memory (bytes or a binary file-like object)
+        source_name: Name recorded as the source of in-memory content
+        partitioned: Index each policy type separately and route questions to them (see
+            partitioning.py); defaults to the KB_PARTITIONED environment variable
         
     Returns:
-        A vector store containing insurance policy information
+        A vector store containing insurance policy information. Without custom content and
+        with KB_SHARD_URLS set, a client for the default documents served by shard
+        processes (see sharding.py)
     """
-    documents = []
+    from ingestion import ingest_documents, ingest_partitioned_documents
+
+    if os.getenv("KB_SHARD_URLS") and not (custom_pdf_path or custom_text or custom_pdf_bytes is not None):
+        from sharding import connect_shards
+
+        return connect_shards()
+
+    if partitioned is None:
+        partitioned = partitioning_enabled()
+
+    trace = Trace("ingestion")
+    try:
+        embeddings = get_embeddings()
+        documents = iter_documents(
+            custom_pdf_path=custom_pdf_path,
+            custom_text=custom_text,
+            custom_pdf_bytes=custom_pdf_bytes,
+            source_name=source_name,
+        )
+        ingest = ingest_partitioned_documents if partitioned else ingest_documents
+        vector_store = ingest(documents, embeddings, trace=trace)
+        logger.info(f"Created knowledge base with {trace.counts.get('chunks', 0)} chunks")
+        return vector_store
+    except Exception as e:
+        trace.record_error(e)
+        raise
+    finally:
+        trace.finish()
+
+
+def load_documents(custom_pdf_path=None, custom_text=None, custom_pdf_bytes=None, source_name=None):
+    """
+    Load the source documents for a knowledge base.
     
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("Google API key not found. Please set the GOOGLE_API_KEY environment variable.")
+    Args:
+        custom_pdf_path: Path to a custom PDF document
+        custom_text: Custom text to use instead of documents
+        custom_pdf_bytes: Custom PDF content held in memory
+        source_name: Name recorded as the source of in-memory content
+        
+    Returns:
+        A list of Document objects, falling back to a built-in overview if nothing was found
+    """
+    return list(iter_documents(
+        custom_pdf_path=custom_pdf_path,
+        custom_text=custom_text,
+        custom_pdf_bytes=custom_pdf_bytes,
+        source_name=source_name,
+    ))
+
+
+def iter_documents(custom_pdf_path=None, custom_text=None, custom_pdf_bytes=None, source_name=None):
+    """
+    Lazily yield the source documents (one per PDF page) for a knowledge base.
     
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model="models/embedding-001",
-        google_api_key=api_key,
-    )
+    Args:
+        custom_pdf_path: Path to a custom PDF document
+        custom_text: Custom text to use instead of documents
+        custom_pdf_bytes: Custom PDF content held in memory (bytes or a binary file-like object)
+        source_name: Name recorded as the source of in-memory content
+        
+    Yields:
+        Document objects, falling back to a built-in overview if nothing was found
+    """
+    loaded = 0
     
     if custom_pdf_path:
         logger.info(f"Loading custom PDF from {custom_pdf_path}")
-        loader = PyPDFLoader(custom_pdf_path)
-        documents.extend(loader.load())
+        for page in iter_pdf_pages([custom_pdf_path]):
+            loaded += 1
+            yield page
+    
+    elif custom_pdf_bytes is not None:
+        logger.info(f"Loading in-memory PDF {source_name or 'upload'}")
+        for page in iter_pdf_bytes_pages(custom_pdf_bytes, source_name or "uploaded.pdf"):
+            loaded += 1
+            yield page
     
     elif custom_text:
         logger.info("Using custom text for knowledge base")
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".txt") as temp_file:
-            temp_file.write(custom_text)
-            temp_path = temp_file.name
-        
-        loader = TextLoader(temp_path)
-        documents.extend(loader.load())
-        
-        os.unlink(temp_path)
+        loaded += 1
+        yield text_document(custom_text, source_name or "custom_text")
     
     else:
         logger.info("Using default insurance policy documents")
@@ -60,204 +126,371 @@ def create_knowledge_base(custom_pdf_path=None, custom_text=None):
         
         attached_dir = "attached_assets"
         if os.path.exists(attached_dir):
+            from langchain_community.document_loaders import TextLoader
+
             for filename in os.listdir(attached_dir):
                 if filename.endswith(".txt"):
                     file_path = os.path.join(attached_dir, filename)
                     loader = TextLoader(file_path)
-                    documents.extend(loader.load())
+                    documents = loader.load()
                     logger.info(f"Loaded text file from {file_path}")
+                    loaded += len(documents)
+                    yield from documents
         
-        for policy_type in ["auto", "health", "home", "life"]:
-            pdf_path = os.path.join(sample_dir, f"{policy_type}_insurance.pdf")
-            if os.path.exists(pdf_path):
-                loader = PyPDFLoader(pdf_path)
-                documents.extend(loader.load())
-                logger.info(f"Loaded sample file from {pdf_path}")
-    
-    if not documents:
+        pdf_paths = [
+            os.path.join(sample_dir, f"{policy_type}_insurance.pdf")
+            for policy_type in ["auto", "health", "home", "life"]
+        ]
+        for page in iter_pdf_pages(path for path in pdf_paths if os.path.exists(path)):
+            loaded += 1
+            yield page
+    
+    if not loaded:
         logger.warning("No documents loaded, creating fallback document")
-        fallback_text = create_fallback_document()
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".txt") as temp_file:
-            temp_file.write(fallback_text)
-            temp_path = temp_file.name
-        
-        loader = TextLoader(temp_path)
-        documents.extend(loader.load())
-        
-        os.unlink(temp_path)
+        yield text_document(create_fallback_document(), "fallback")
+
+
+def load_pdf_files(pdf_paths):
+    """Load every page of the given PDF files as Document objects."""
+    return list(iter_pdf_pages(pdf_paths))
+
+
+def iter_pdf_pages(pdf_paths):
+    """Yield the pages of the given PDF files one at a time, without holding whole documents in memory."""
+    for pdf_path in pdf_paths:
+        with open(pdf_path, "rb") as pdf_file:
+            yield from _iter_pdf_file_pages(pdf_file, str(pdf_path))
+        logger.info(f"Loaded PDF file from {pdf_path}")
+
+
+def iter_pdf_bytes_pages(pdf_data, source_name="uploaded.pdf"):
+    """
+    Yield the pages of an in-memory PDF one at a time.
     
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
+    Args:
+        pdf_data: PDF content as bytes or a binary file-like object (e.g. BytesIO or an upload)
+        source_name: Value recorded as the 'source' metadata of every page
+    """
+    if isinstance(pdf_data, (bytes, bytearray, memoryview)):
+        pdf_data = io.BytesIO(pdf_data)
+    yield from _iter_pdf_file_pages(pdf_data, source_name)
+
+
+def _iter_pdf_file_pages(pdf_file, source):
+    """Extract text page by page with pypdf, using the same metadata as PyPDFLoader."""
+    import pypdf
+    from langchain_core.documents import Document
+
+    reader = pypdf.PdfReader(pdf_file)
+    for page_number, page in enumerate(reader.pages):
+        yield Document(page_content=page.extract_text(), metadata={"source": source, "page": page_number})
+
+
+def text_document(text, source_name="custom_text"):
+    """Wrap a text buffer (str or StringIO) in a Document without touching the filesystem."""
+    from langchain_core.documents import Document
+
+    if hasattr(text, "read"):
+        text = text.read()
+    return Document(page_content=text, metadata={"source": source_name})
+
+
+def make_text_splitter(chunk_size=1000, chunk_overlap=200, strategy=None):
+    """
+    Create the text splitter used to chunk documents for embedding.
+    
+    Args:
+        chunk_size: Maximum characters per chunk
+        chunk_overlap: Characters shared by neighbouring chunks (policy strategy: only inside long sections)
+        strategy: "recursive" or "policy"; defaults to the CHUNKING_STRATEGY environment variable
+    """
+    from chunking import get_chunking_strategy, PolicySectionSplitter
+
+    if get_chunking_strategy(strategy) == "policy":
+        return PolicySectionSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
         separators=["\n\n", "\n", " ", ""],
     )
+
+
+def split_documents(documents, chunk_size=1000, chunk_overlap=200, strategy=None):
+    """Split documents into chunks for embedding, see make_text_splitter."""
+    return make_text_splitter(chunk_size, chunk_overlap, strategy).split_documents(documents)
+
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+
+
+def create_faiss_index(index_type, vectors):
+    """
+    Create an empty (but trained, where required) FAISS index for the given vectors.
     
-    chunks = text_splitter.split_documents(documents)
-    logger.info(f"Created knowledge base with {len(chunks)} chunks")
+    Args:
+        index_type: "flat" (exact), "hnsw" (graph-based approximate) or "ivf" (inverted lists)
+        vectors: Embedding matrix the index will hold
+        
+    Returns:
+        A FAISS index using L2 distance
+    """
+    import faiss
+    import numpy as np
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    dimension = matrix.shape[1]
+
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dimension)
+    if index_type == "hnsw":
+        return faiss.IndexHNSWFlat(dimension, 32)
+    if index_type == "ivf":
+        nlist = max(1, min(int(len(matrix) ** 0.5), len(matrix) // 39 or 1))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, nlist)
+        index.train(matrix)
+        index.nprobe = max(1, nlist // 8)
+        return index
+    raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+
+
+def build_vector_store(chunks, embeddings, trace=None, index_type="flat"):
+    """
+    Embed chunks and index them in FAISS, timing the two steps separately.
+    
+    Args:
+        chunks: Document chunks to index
+        embeddings: Embedding model used for the chunks and later queries
+        trace: Optional Trace receiving 'embed' and 'index' spans
+        index_type: FAISS index flavour, see INDEX_TYPES
+        
+    Returns:
+        A FAISS vector store
+    """
+    trace = trace or Trace("ingestion")
+    texts = [chunk.page_content for chunk in chunks]
+    metadatas = [chunk.metadata for chunk in chunks]
+    
+    with trace.span("embed"):
+        vectors = embeddings.embed_documents(texts)
+    trace.add_tokens("embedding", sum(estimate_tokens(text) for text in texts))
+    trace.add_count("chunks", len(chunks))
     
-    vector_store = FAISS.from_documents(chunks, embeddings)
+    with trace.span("index"):
+        vector_store = create_empty_vector_store(embeddings, vectors, index_type)
+        vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+    vector_store.version = update_content_version(new_content_digest(), texts).hexdigest()
     return vector_store
 
 
+def new_content_digest():
+    """Start a content digest for update_content_version."""
+    return hashlib.blake2b(digest_size=8)
+
+
+def update_content_version(digest, texts):
+    """Fold chunk texts, in index order, into a running content digest and return it."""
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest
+
+
+def knowledge_base_version(knowledge_base) -> str:
+    """
+    Identify the content of a knowledge base.
+
+    Knowledge bases built by this module carry a 'version' digest of their chunk texts,
+    so rebuilding the same documents gives the same version. Other stores fall back to
+    their object identity.
+    """
+    return getattr(knowledge_base, "version", None) or f"instance-{id(knowledge_base):x}"
+
+
+def create_empty_vector_store(embeddings, sample_vectors, index_type="flat"):
+    """
+    Create an empty FAISS vector store whose index is sized (and trained) from sample vectors.
+    """
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+
+    return FAISS(embeddings, create_faiss_index(index_type, sample_vectors), InMemoryDocstore(), {})
+
+
+SAMPLE_POLICIES = {
+    "auto_insurance": """
+    AUTO INSURANCE POLICY
+    COVERAGE TYPES:
+    - Liability Coverage: Pays for bodily injury and property damage to others when you're at fault
+    - Collision Coverage: Pays for damage to your vehicle from an accident
+    - Comprehensive Coverage: Pays for damage from non-collision events (theft, weather, vandalism)
+    - Personal Injury Protection (PIP): Covers medical expenses for you and passengers
+    - Uninsured/Underinsured Motorist Coverage: Protects you from drivers with inadequate insurance
+    
+    POLICY LIMITS:
+    - Per person/per accident limits (e.g., 100/300/50 = $100,000 per person, $300,000 per accident, $50,000 property damage)
+    - Deductible: Amount you pay before insurance pays (typically $250, $500, or $1,000)
+    
+    FACTORS AFFECTING PREMIUMS:
+    - Driving history and claims history
+    - Vehicle type, age, and usage
+    - Geographic location and garaging address
+    - Credit score and age
+    - Annual mileage
+    
+    FILING A CLAIM:
+    1. Document the incident (photos, police report if applicable)
+    2. Contact insurance company promptly
+    3. Provide required information (policy number, date/time/location, other party's information)
+    4. Work with assigned claims adjuster
+    5. Get repair estimates
+    
+    DISCOUNTS:
+    - Multi-policy discount
+    - Good driver discount
+    - Vehicle safety features
+    - Good student discount
+    - Defensive driving course
+    """,
+    "health_insurance": """
+    HEALTH INSURANCE POLICY
+    PLAN TYPES:
+    - HMO (Health Maintenance Organization): Lower costs, limited network
+    - PPO (Preferred Provider Organization): More flexibility, higher premiums
+    - HDHP (High Deductible Health Plan): Lower premiums, higher out-of-pocket costs
+    - EPO (Exclusive Provider Organization): No out-of-network coverage except emergencies
+    
+    COVERED SERVICES:
+    - Preventive care (annual check-ups, vaccinations)
+    - Emergency services
+    - Hospitalization
+    - Prescription drugs
+    - Mental health services
+    - Maternity and newborn care
+    
+    COST SHARING:
+    - Premium: Monthly payment to maintain coverage
+    - Deductible: Amount paid before insurance begins coverage
+    - Copayment: Fixed amount paid for specific services
+    - Coinsurance: Percentage of costs paid after meeting deductible
+    - Out-of-pocket maximum: Limit on total annual expenses
+    
+    ENROLLMENT PERIODS:
+    - Open Enrollment: Annual period to enroll or change plans
+    - Special Enrollment: Available after qualifying life events
+    """,
+    "home_insurance": """
+    HOME INSURANCE POLICY
+    COVERAGE COMPONENTS:
+    - Dwelling coverage: Structure of your home
+    - Personal property: Belongings inside your home
+    - Liability protection: Legal expenses if someone is injured on your property
+    - Additional living expenses: Temporary housing if your home is uninhabitable
+    - Other structures: Detached garage, sheds, fences
+    
+    POLICY TYPES:
+    - HO-1: Basic form (limited perils)
+    - HO-2: Broad form (named perils)
+    - HO-3: Special form (open perils for dwelling, named perils for contents)
+    - HO-5: Comprehensive form (open perils for both dwelling and contents)
+    - HO-6: Condo insurance
+    - HO-8: Older home insurance
+    
+    CLAIM PROCESS:
+    1. Document damage with photos/videos
+    2. Contact your insurance company promptly
+    3. Complete claim forms
+    4. Meet with insurance adjuster
+    5. Obtain repair estimates
+    6. Receive and review settlement offer
+    
+    DISCOUNTS:
+    - Home security systems
+    - Smoke detectors and fire alarms
+    - Impact-resistant roof
+    - Bundling with auto insurance
+    - Claims-free history
+    """,
+    "life_insurance": """
+    LIFE INSURANCE POLICY
+    TYPES OF POLICIES:
+    - Term Life: Temporary coverage (10, 20, 30 years) with lower premiums
+    - Whole Life: Permanent coverage with cash value component and fixed premiums
+    - Universal Life: Permanent coverage with flexible premiums and investment options
+    - Variable Life: Permanent coverage with investment options in sub-accounts
+    
+    POLICY COMPONENTS:
+    - Death benefit: Amount paid to beneficiaries
+    - Premium: Regular payment to maintain coverage
+    - Cash value: Savings component in permanent policies
+    - Riders: Additional coverage options (accelerated benefits, waiver of premium)
+    
+    ELIGIBILITY FACTORS:
+    - Age and gender
+    - Health condition and medical history
+    - Family medical history
+    - Lifestyle choices (smoking, high-risk activities)
+    - Occupation
+    
+    APPLICATION PROCESS:
+    1. Initial application
+    2. Medical exam (can be waived for simplified issue policies)
+    3. Medical underwriting (reviewing health records)
+    4. Policy approval and delivery
+    5. Regular premium payments
+    
+    TAX ADVANTAGES:
+    - Tax-free death benefits
+    - Tax-deferred cash value growth
+    - Potential for tax-free policy loans
+    """
+}
+
+
+def write_policy_pdf(pdf_path, content):
+    """
+    Render policy text into a PDF, one text line per input line, starting a new page when full.
+    """
+    import reportlab.pdfgen.canvas
+    from reportlab.lib.pagesizes import letter
+
+    canvas = reportlab.pdfgen.canvas.Canvas(pdf_path, pagesize=letter)
+    
+    text_object = canvas.beginText(50, 750)
+    text_object.setFont("Helvetica", 10)
+    
+    cleaned_content = content.strip()
+    lines = cleaned_content.split('\n')
+    
+    for line in lines:
+        if text_object.getY() < 50:
+            canvas.drawText(text_object)
+            canvas.showPage()
+            text_object = canvas.beginText(50, 750)
+            text_object.setFont("Helvetica", 10)
+        text_object.textLine(line.strip())
+    
+    canvas.drawText(text_object)
+    canvas.save()
+
+
 def create_sample_insurance_files(directory_path):
     """
     Create sample insurance policy text files in the specified directory.
     """
     try:
-        import reportlab.pdfgen.canvas
-        from reportlab.lib.pagesizes import letter
-
-        insurance_data = {
-            "auto_insurance": """
-            AUTO INSURANCE POLICY
-            COVERAGE TYPES:
-            - Liability Coverage: Pays for bodily injury and property damage to others when you're at fault
-            - Collision Coverage: Pays for damage to your vehicle from an accident
-            - Comprehensive Coverage: Pays for damage from non-collision events (theft, weather, vandalism)
-            - Personal Injury Protection (PIP): Covers medical expenses for you and passengers
-            - Uninsured/Underinsured Motorist Coverage: Protects you from drivers with inadequate insurance
-            
-            POLICY LIMITS:
-            - Per person/per accident limits (e.g., 100/300/50 = $100,000 per person, $300,000 per accident, $50,000 property damage)
-            - Deductible: Amount you pay before insurance pays (typically $250, $500, or $1,000)
-            
-            FACTORS AFFECTING PREMIUMS:
-            - Driving history and claims history
-            - Vehicle type, age, and usage
-            - Geographic location and garaging address
-            - Credit score and age
-            - Annual mileage
-            
-            FILING A CLAIM:
-            1. Document the incident (photos, police report if applicable)
-            2. Contact insurance company promptly
-            3. Provide required information (policy number, date/time/location, other party's information)
-            4. Work with assigned claims adjuster
-            5. Get repair estimates
-            
-            DISCOUNTS:
-            - Multi-policy discount
-            - Good driver discount
-            - Vehicle safety features
-            - Good student discount
-            - Defensive driving course
-            """,
-            "health_insurance": """
-            HEALTH INSURANCE POLICY
-            PLAN TYPES:
-            - HMO (Health Maintenance Organization): Lower costs, limited network
-            - PPO (Preferred Provider Organization): More flexibility, higher premiums
-            - HDHP (High Deductible Health Plan): Lower premiums, higher out-of-pocket costs
-            - EPO (Exclusive Provider Organization): No out-of-network coverage except emergencies
-            
-            COVERED SERVICES:
-            - Preventive care (annual check-ups, vaccinations)
-            - Emergency services
-            - Hospitalization
-            - Prescription drugs
-            - Mental health services
-            - Maternity and newborn care
-            
-            COST SHARING:
-            - Premium: Monthly payment to maintain coverage
-            - Deductible: Amount paid before insurance begins coverage
-            - Copayment: Fixed amount paid for specific services
-            - Coinsurance: Percentage of costs paid after meeting deductible
-            - Out-of-pocket maximum: Limit on total annual expenses
-            
-            ENROLLMENT PERIODS:
-            - Open Enrollment: Annual period to enroll or change plans
-            - Special Enrollment: Available after qualifying life events
-            """,
-            "home_insurance": """
-            HOME INSURANCE POLICY
-            COVERAGE COMPONENTS:
-            - Dwelling coverage: Structure of your home
-            - Personal property: Belongings inside your home
-            - Liability protection: Legal expenses if someone is injured on your property
-            - Additional living expenses: Temporary housing if your home is uninhabitable
-            - Other structures: Detached garage, sheds, fences
-            
-            POLICY TYPES:
-            - HO-1: Basic form (limited perils)
-            - HO-2: Broad form (named perils)
-            - HO-3: Special form (open perils for dwelling, named perils for contents)
-            - HO-5: Comprehensive form (open perils for both dwelling and contents)
-            - HO-6: Condo insurance
-            - HO-8: Older home insurance
-            
-            CLAIM PROCESS:
-            1. Document damage with photos/videos
-            2. Contact your insurance company promptly
-            3. Complete claim forms
-            4. Meet with insurance adjuster
-            5. Obtain repair estimates
-            6. Receive and review settlement offer
-            
-            DISCOUNTS:
-            - Home security systems
-            - Smoke detectors and fire alarms
-            - Impact-resistant roof
-            - Bundling with auto insurance
-            - Claims-free history
-            """,
-            "life_insurance": """
-            LIFE INSURANCE POLICY
-            TYPES OF POLICIES:
-            - Term Life: Temporary coverage (10, 20, 30 years) with lower premiums
-            - Whole Life: Permanent coverage with cash value component and fixed premiums
-            - Universal Life: Permanent coverage with flexible premiums and investment options
-            - Variable Life: Permanent coverage with investment options in sub-accounts
-            
-            POLICY COMPONENTS:
-            - Death benefit: Amount paid to beneficiaries
-            - Premium: Regular payment to maintain coverage
-            - Cash value: Savings component in permanent policies
-            - Riders: Additional coverage options (accelerated benefits, waiver of premium)
-            
-            ELIGIBILITY FACTORS:
-            - Age and gender
-            - Health condition and medical history
-            - Family medical history
-            - Lifestyle choices (smoking, high-risk activities)
-            - Occupation
-            
-            APPLICATION PROCESS:
-            1. Initial application
-            2. Medical exam (can be waived for simplified issue policies)
-            3. Medical underwriting (reviewing health records)
-            4. Policy approval and delivery
-            5. Regular premium payments
-            
-            TAX ADVANTAGES:
-            - Tax-free death benefits
-            - Tax-deferred cash value growth
-            - Potential for tax-free policy loans
-            """
-        }
-
-        for name, content in insurance_data.items():
+        for name, content in SAMPLE_POLICIES.items():
             pdf_path = os.path.join(directory_path, f"{name}.pdf")
-            canvas = reportlab.pdfgen.canvas.Canvas(pdf_path, pagesize=letter)
-            
-            text_object = canvas.beginText(50, 750)
-            text_object.setFont("Helvetica", 10)
-            
-            cleaned_content = content.strip()
-            lines = cleaned_content.split('\n')
-            
-            for line in lines:
-                text_object.textLine(line.strip())
-            
-            canvas.drawText(text_object)
-            canvas.save()
+            write_policy_pdf(pdf_path, content)
             
             print(f"Created sample file: {pdf_path}")
 
     except Exception as e:
         logger.error(f"Error creating sample insurance files: {str(e)}")
         try:
-            for name, content in insurance_data.items():
+            for name, content in SAMPLE_POLICIES.items():
                 txt_path = os.path.join(directory_path, f"{name}.txt")
                 with open(txt_path, 'w') as f:
                     f.write(content)
@@ -293,10 +526,8 @@ def create_fallback_document():
     Death benefits are generally tax-free to beneficiaries.
     """
 
-from langchain_core.documents import Document
-
 def document_to_dict(doc):
-    """Convert a Document object to a dictionary for JSON serialization."""
+    """Convert a Document object to a dictionary for JSON serialization (see kb_snapshot.py for whole knowledge bases)."""
     return {
         "page_content": doc.page_content,
         "metadata": doc.metadata
@@ -304,6 +535,8 @@ def document_to_dict(doc):
 
 def dict_to_document(doc_dict):
     """Convert a dictionary back to a Document object."""
+    from langchain_core.documents import Document
+
     return Document(
         page_content=doc_dict["page_content"],
         metadata=doc_dict["metadata"]
@@ -0,0 +1,235 @@
+"""
+Load generator for the headless API server (server.py).
+
+Runs a number of concurrent virtual users for a fixed duration. Each user opens a
+session and sends golden-set questions one after another, optionally streamed, and
+the run reports throughput, latency and time-to-first-token percentiles and the
+number of rejected (503) and failed requests.
+
+With --start-server a server is launched on the offline stand-in models, so the
+numbers reflect the serving path rather than Gemini.
+
+Usage:
+    python load_test.py --start-server --users 1 8 32 --duration 30 --stream
+    python load_test.py --url http://localhost:8000 --users 16
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+import logging
+
+from evaluate_retrieval import DEFAULT_QUESTIONS, load_questions
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = "bench_results"
+
+
+def _post(url, payload, timeout):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST"
+    )
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+def send_message(base_url, session_id, message, stream=False, timeout=120.0):
+    """
+    Send one message and time it.
+
+    Returns:
+        A dictionary with the HTTP 'status', total 'latency' and, for streamed
+        requests, 'ttft' (time until the first token event arrived)
+    """
+    url = f"{base_url}/v1/sessions/{session_id}/messages"
+    start = time.perf_counter()
+    ttft = None
+    try:
+        with _post(url, {"message": message, "stream": stream}, timeout) as response:
+            if stream:
+                for line in response:
+                    if ttft is None and line.startswith(b"event: token"):
+                        ttft = time.perf_counter() - start
+                    if line.startswith(b"event: done") or line.startswith(b"event: error"):
+                        status = 200 if line.startswith(b"event: done") else 500
+                        break
+                else:
+                    status = 500
+            else:
+                response.read()
+                status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return {"status": status, "latency": time.perf_counter() - start, "ttft": ttft}
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[position]
+
+
+def run_load(base_url, users, duration, questions, stream=False, turns_per_session=5, seed=0):
+    """Drive `users` concurrent conversations for `duration` seconds and summarise the results."""
+    results = []
+    results_lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def user(index):
+        rng = random.Random(seed * 1000 + index)
+        while time.monotonic() < deadline:
+            try:
+                with _post(f"{base_url}/v1/sessions", {}, 10) as response:
+                    session_id = json.loads(response.read())["session_id"]
+            except Exception:
+                with results_lock:
+                    results.append({"status": 0, "latency": 0.0, "ttft": None})
+                time.sleep(0.05)
+                continue
+            for _ in range(turns_per_session):
+                if time.monotonic() >= deadline:
+                    break
+                result = send_message(base_url, session_id, rng.choice(questions)["question"], stream)
+                with results_lock:
+                    results.append(result)
+                if result["status"] == 503:
+                    time.sleep(0.05)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(index,), daemon=True) for index in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ok = [result for result in results if result["status"] == 200]
+    latencies = [result["latency"] for result in ok]
+    ttfts = [result["ttft"] for result in ok if result["ttft"] is not None]
+    summary = {
+        "users": users,
+        "stream": stream,
+        "requests": len(results),
+        "ok": len(ok),
+        "rejected": sum(1 for result in results if result["status"] == 503),
+        "errors": sum(1 for result in results if result["status"] not in (200, 503)),
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+    }
+    for name, values in (("latency", latencies), ("ttft", ttfts)):
+        for label, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+            value = _percentile(values, q)
+            summary[f"{name}_{label}_ms"] = value * 1000 if value is not None else None
+    return summary
+
+
+def _wait_until_healthy(base_url, timeout=120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/healthz", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except Exception:
+            time.sleep(0.5)
+    raise RuntimeError(f"Server at {base_url} did not become healthy within {timeout} seconds")
+
+
+def start_server(port, workers, queue_size):
+    """Launch server.py on the offline stand-in models and wait until it is healthy."""
+    env = dict(os.environ)
+    env.setdefault("EMBEDDING_BACKEND", "hashing")
+    env.setdefault("LLM_BACKEND", "fake")
+    env.setdefault("CHAIN_VERBOSE", "false")
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+         "--port", str(port), "--workers", str(workers), "--queue-size", str(queue_size)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_until_healthy(f"http://127.0.0.1:{port}")
+    except Exception:
+        process.terminate()
+        raise
+    return process
+
+
+def print_table(rows):
+    columns = ["users", "requests", "ok", "rejected", "errors", "throughput_rps",
+               "latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "ttft_p50_ms", "ttft_p95_ms"]
+    print(" | ".join(f"{column:>14}" for column in columns))
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row[column]
+            cells.append(f"{value:.1f}" if isinstance(value, float) else str(value))
+        print(" | ".join(f"{cell:>14}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per concurrency level")
+    parser.add_argument("--turns", type=int, default=5, help="Messages per session before starting a new one")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--start-server", action="store_true", help="Launch server.py on the offline models")
+    parser.add_argument("--port", type=int, default=8765, help="Port for --start-server")
+    parser.add_argument("--workers", type=int, default=8, help="Worker pool size for --start-server")
+    parser.add_argument("--queue-size", type=int, default=32, help="Worker queue size for --start-server")
+    parser.add_argument("--output", help="Results file (default: bench_results/load-<timestamp>.json)")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    process = None
+    base_url = args.url.rstrip("/")
+    if args.start_server:
+        base_url = f"http://127.0.0.1:{args.port}"
+        process = start_server(args.port, args.workers, args.queue_size)
+
+    try:
+        rows = []
+        for users in args.users:
+            logger.info(f"Running {users} concurrent users for {args.duration:.0f}s")
+            rows.append(run_load(base_url, users, args.duration, questions, args.stream, args.turns))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "benchmark": "load",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "url": base_url,
+        "server_started": args.start_server,
+        "workers": args.workers if args.start_server else None,
+        "llm_backend": os.getenv("LLM_BACKEND", "fake") if args.start_server else None,
+        "results": rows,
+    }
+    output_path = args.output or os.path.join(RESULTS_DIR, f"load-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_table(rows)
+    print(f"\nResults written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Memory accounting for knowledge bases and conversations.
+
+Reports, per loaded knowledge base, the bytes held by its vector index and by its
+chunk texts and docstore, and per conversation the size of its LangChain memory
+and stored history. Knowledge bases are shared through KNOWLEDGE_BASES, which keeps
+them under KB_MEMORY_BUDGET_MB by evicting the least recently used ones.
+
+Usage:
+    python memory_accounting.py                 # report for the default policies
+    python memory_accounting.py --pdf a.pdf b.pdf --budget-mb 5
+"""
+import os
+import json
+import time
+import argparse
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+
+from metrics import REGISTRY
+from session_store import approximate_size
+from singleflight import SingleFlight
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+KB_MEMORY_BUDGET_MB = float(os.getenv("KB_MEMORY_BUDGET_MB", "0"))
+
+_FOOTPRINT_FIELDS = ("vectors", "index_bytes", "text_bytes", "docstore_bytes", "total_bytes")
+
+
+def vector_store_footprint(vector_store) -> Dict[str, Any]:
+    """
+    Memory held by one FAISS vector store.
+
+    Returns:
+        A dictionary with the number of 'vectors', the embedding 'dimension',
+        'index_bytes' (the serialized FAISS index), 'text_bytes' (UTF-8 chunk texts),
+        'docstore_bytes' (the Python documents, metadata and id map holding them)
+        and 'total_bytes'
+    """
+    import faiss
+
+    documents = list(getattr(vector_store.docstore, "_dict", {}).values())
+    index_bytes = int(faiss.serialize_index(vector_store.index).nbytes)
+    docstore_bytes = approximate_size(vector_store.docstore) + approximate_size(vector_store.index_to_docstore_id)
+    return {
+        "vectors": vector_store.index.ntotal,
+        "dimension": vector_store.index.d,
+        "index_bytes": index_bytes,
+        "text_bytes": sum(len(doc.page_content.encode("utf-8")) for doc in documents),
+        "docstore_bytes": docstore_bytes,
+        "total_bytes": index_bytes + docstore_bytes,
+    }
+
+
+def knowledge_base_footprint(knowledge_base) -> Dict[str, Any]:
+    """
+    Memory held by a knowledge base, with a breakdown per partition for partitioned ones.
+
+    Sharded knowledge bases hold their vectors in the shard processes, so only their
+    vector count is reported and their bytes count as zero here.
+    """
+    from knowledge_base import knowledge_base_version
+
+    if hasattr(knowledge_base, "partitions"):
+        partitions = {name: vector_store_footprint(store) for name, store in sorted(knowledge_base.partitions.items())}
+        footprint = {field: sum(part[field] for part in partitions.values()) for field in _FOOTPRINT_FIELDS}
+        footprint["dimension"] = next((part["dimension"] for part in partitions.values()), None)
+        footprint["partitions"] = partitions
+    elif hasattr(knowledge_base, "shard_info"):
+        footprint = {field: 0 for field in _FOOTPRINT_FIELDS}
+        footprint["vectors"] = sum(info["vectors"] for info in knowledge_base.shard_info)
+        footprint["dimension"] = None
+        footprint["remote"] = True
+    else:
+        footprint = vector_store_footprint(knowledge_base)
+    return {"kind": type(knowledge_base).__name__, "version": knowledge_base_version(knowledge_base), **footprint}
+
+
+def session_footprint(chatbot, store=None, session_id: str = None) -> Dict[str, Any]:
+    """
+    Memory held by a conversation's chatbot, and the size of its stored history.
+
+    Args:
+        chatbot: The conversation's InsuranceChatbot
+        store: Optional SessionStore holding the conversation
+        session_id: Id of the conversation in the store
+    """
+    from knowledge_base import knowledge_base_version
+
+    footprint = {
+        "memory_messages": len(chatbot.memory.chat_memory.messages),
+        "memory_bytes": approximate_size(chatbot.memory),
+        "knowledge_base": knowledge_base_version(chatbot.knowledge_base),
+    }
+    if store is not None and session_id is not None:
+        footprint.update(store.history_size(session_id))
+    return footprint
+
+
+class KnowledgeBaseCache:
+    """
+    Knowledge bases shared between conversations, kept under a memory budget.
+
+    Each knowledge base is built once per key (concurrent requests for a key wait for
+    the same build) and its footprint is measured when it is added. While the total
+    exceeds ``budget_bytes`` the least recently used knowledge bases are evicted, never
+    the one just requested. ``on_evict`` is called with each evicted knowledge base so
+    that the chatbots holding it can be dropped too; otherwise it would stay in memory.
+    A budget of 0 disables eviction.
+
+    rebuild() replaces a loaded knowledge base with a freshly built one, which is handed
+    to ``on_replace`` together with the old one so that chatbots can swap it in.
+    """
+
+    def __init__(self, budget_bytes: int = int(KB_MEMORY_BUDGET_MB * 1024 * 1024),
+                 on_evict: Callable[[Any], None] = None, on_replace: Callable[[Any, Any], None] = None):
+        self.budget_bytes = budget_bytes
+        self.on_evict = on_evict
+        self.on_replace = on_replace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight("knowledge_base")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(entry["footprint"]["total_bytes"] for entry in self._entries.values())
+
+    def get(self, key: Hashable, factory: Callable[[], Any]):
+        """Return the knowledge base for `key`, building it with `factory` if it is not loaded."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["last_used"] = time.time()
+                self._entries.move_to_end(key)
+                return entry["knowledge_base"]
+
+        knowledge_base, _ = self._flights.do(key, lambda: self._load(key, factory))
+        return knowledge_base
+
+    def rebuild(self, key: Hashable, factory: Callable[[], Any]):
+        """
+        Build a new knowledge base for `key` and replace the loaded one with it.
+
+        get() keeps returning the old knowledge base until the new one is built, so
+        questions are not held up by the rebuild. If the build fails, the old one stays.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        old = entry["knowledge_base"] if entry is not None else None
+        knowledge_base, _ = self._flights.do(("rebuild", key), lambda: self._load(key, factory))
+        if old is not None and old is not knowledge_base:
+            REGISTRY.counter("knowledge_bases_rebuilt", "Loaded knowledge bases replaced by a rebuild").inc()
+            if self.on_replace is not None:
+                self.on_replace(old, knowledge_base)
+        return knowledge_base
+
+    def _load(self, key: Hashable, factory: Callable[[], Any]):
+        knowledge_base = factory()
+        footprint = knowledge_base_footprint(knowledge_base)
+        REGISTRY.counter("knowledge_bases_loaded", "Knowledge bases built into memory").inc()
+        with self._lock:
+            self._entries[key] = {"knowledge_base": knowledge_base, "footprint": footprint, "last_used": time.time()}
+            self._entries.move_to_end(key)
+            evicted = self._over_budget(keep=key)
+        logger.info(f"Loaded knowledge base {key!r}: {footprint['total_bytes'] / 1024:.0f} KiB, "
+                    f"{footprint['vectors']} vectors")
+        for evicted_key, evicted_entry in evicted:
+            REGISTRY.counter("knowledge_bases_evicted", "Knowledge bases evicted to stay within the memory budget").inc()
+            logger.info(f"Evicted knowledge base {evicted_key!r} "
+                        f"({evicted_entry['footprint']['total_bytes'] / 1024:.0f} KiB) to stay within the memory budget")
+            if self.on_evict is not None:
+                self.on_evict(evicted_entry["knowledge_base"])
+        return knowledge_base
+
+    def _over_budget(self, keep: Hashable) -> List[Tuple[Hashable, Dict[str, Any]]]:
+        evicted = []
+        if self.budget_bytes <= 0:
+            return evicted
+        total = sum(entry["footprint"]["total_bytes"] for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.budget_bytes:
+                break
+            if key == keep:
+                continue
+            entry = self._entries.pop(key)
+            total -= entry["footprint"]["total_bytes"]
+            evicted.append((key, entry))
+        if total > self.budget_bytes:
+            logger.warning(f"Knowledge base {keep!r} alone exceeds the memory budget of {self.budget_bytes} bytes")
+        return evicted
+
+    def drop(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def footprints(self) -> List[Dict[str, Any]]:
+        """Footprints of the loaded knowledge bases, most recently used first."""
+        with self._lock:
+            entries = list(self._entries.items())
+        return [
+            {"key": str(key), "last_used": entry["last_used"], **entry["footprint"]}
+            for key, entry in reversed(entries)
+        ]
+
+
+def _drop_sessions_using(knowledge_base):
+    from session_store import ACTIVE_SESSIONS
+
+    dropped = ACTIVE_SESSIONS.drop_where(lambda chatbot: chatbot.knowledge_base is knowledge_base)
+    if dropped:
+        logger.info(f"Dropped {dropped} conversations using an evicted knowledge base")
+
+
+def _swap_sessions_using(old_knowledge_base, knowledge_base):
+    from session_store import ACTIVE_SESSIONS
+
+    swapped = 0
+    for _, chatbot in ACTIVE_SESSIONS.items():
+        if chatbot.knowledge_base is old_knowledge_base:
+            chatbot.index.swap(knowledge_base)
+            swapped += 1
+    if swapped:
+        logger.info(f"Swapped a rebuilt knowledge base into {swapped} conversations")
+
+
+def _evicted(knowledge_base):
+    from response_cache import forget_faq_warm_up
+
+    _drop_sessions_using(knowledge_base)
+    forget_faq_warm_up(knowledge_base)
+
+
+def _replaced(old_knowledge_base, knowledge_base):
+    from response_cache import forget_faq_warm_up
+
+    _swap_sessions_using(old_knowledge_base, knowledge_base)
+    forget_faq_warm_up(old_knowledge_base)
+
+
+KNOWLEDGE_BASES = KnowledgeBaseCache(on_evict=_evicted, on_replace=_replaced)
+
+
+def memory_report(knowledge_bases: Iterable[Dict[str, Any]] = None,
+                  sessions: Iterable[Tuple[str, Any]] = None, store=None) -> Dict[str, Any]:
+    """
+    Diagnostics dump of the memory held by knowledge bases and conversations.
+
+    Args:
+        knowledge_bases: Knowledge base footprints; defaults to those in KNOWLEDGE_BASES
+        sessions: (session id, chatbot) pairs; defaults to the chatbots in ACTIVE_SESSIONS
+        store: SessionStore to report the stored history sizes from
+
+    Returns:
+        A JSON-serializable dictionary with per-item footprints and totals
+    """
+    from session_store import ACTIVE_SESSIONS
+
+    knowledge_bases = list(KNOWLEDGE_BASES.footprints() if knowledge_bases is None else knowledge_bases)
+    sessions = ACTIVE_SESSIONS.items() if sessions is None else sessions
+    session_rows = [
+        {"session_id": session_id, **session_footprint(chatbot, store, session_id)}
+        for session_id, chatbot in sessions
+    ]
+    return {
+        "knowledge_bases": knowledge_bases,
+        "sessions": session_rows,
+        "totals": {
+            "knowledge_base_bytes": sum(kb["total_bytes"] for kb in knowledge_bases),
+            "session_memory_bytes": sum(row["memory_bytes"] for row in session_rows),
+            "budget_bytes": KNOWLEDGE_BASES.budget_bytes,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", nargs="*", default=[], help="Also load each of these PDFs as an uploaded document")
+    parser.add_argument("--budget-mb", type=float, help="Memory budget; defaults to KB_MEMORY_BUDGET_MB")
+    args = parser.parse_args()
+
+    from knowledge_base import create_knowledge_base
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger(__name__).setLevel(logging.INFO)
+    if args.budget_mb is not None:
+        KNOWLEDGE_BASES.budget_bytes = int(args.budget_mb * 1024 * 1024)
+
+    KNOWLEDGE_BASES.get("default", create_knowledge_base)
+    for path in args.pdf:
+        with open(path, "rb") as f:
+            pdf_bytes = f.read()
+        KNOWLEDGE_BASES.get(
+            ("upload", os.path.basename(path)),
+            lambda: create_knowledge_base(custom_pdf_bytes=pdf_bytes, source_name=os.path.basename(path)),
+        )
+    print(json.dumps(memory_report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
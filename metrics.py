@@ -0,0 +1,295 @@
+import json
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "insurance_chatbot"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (roughly four characters per token) used when the backend reports none."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_key, extra=None) -> str:
+    pairs = list(label_key) + list(extra or [])
+    if not pairs:
+        return ""
+    body = ",".join(f'{key}="{value}"' for key, value in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}_total{_format_labels(key)} {value}" for key, value in items]
+
+    def to_dict(self):
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, compatible with the Prometheus text format."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Estimate a quantile from the bucket counts (upper bound of the matching bucket)."""
+        series = self._series.get(_label_key(labels))
+        if not series or not series["count"]:
+            return None
+        target = q * series["count"]
+        for bound, count in zip(self.buckets, series["counts"]):
+            if count >= target:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = []
+        with self._lock:
+            items = [(key, dict(series, counts=list(series["counts"]))) for key, series in self._series.items()]
+        for key, series in items:
+            for bound, count in zip(self.buckets, series["counts"]):
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+    def to_dict(self):
+        with self._lock:
+            return [
+                {
+                    "labels": dict(key),
+                    "buckets": dict(zip(map(str, self.buckets), series["counts"])),
+                    "sum": series["sum"],
+                    "count": series["count"],
+                }
+                for key, series in self._series.items()
+            ]
+
+
+class MetricsRegistry:
+    """In-process collection of counters and histograms."""
+
+    def __init__(self, prefix: str = METRIC_PREFIX):
+        self.prefix = prefix
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, description, **kwargs):
+        full_name = f"{self.prefix}_{name}"
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = cls(full_name, description, **kwargs)
+                self._metrics[full_name] = metric
+            return metric
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def histogram(self, name: str, description: str = "", buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            exposed_name = f"{metric.name}_total" if metric.kind == "counter" else metric.name
+            lines.append(f"# HELP {exposed_name} {metric.description}")
+            lines.append(f"# TYPE {exposed_name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: {"type": metric.kind, "series": metric.to_dict()} for metric in metrics}
+
+    def render_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Trace:
+    """
+    Structured timing record for one request or one ingestion run.
+
+    Stages are timed with ``span``; token counts, flags (e.g. cache hits) and errors
+    are attached as the work progresses, and ``finish`` exports everything to the
+    registry and logs the trace as a single JSON line.
+    """
+
+    def __init__(self, kind: str, registry: MetricsRegistry = None):
+        self.kind = kind
+        self.registry = registry or REGISTRY
+        self.spans: Dict[str, float] = {}
+        self.tokens: Dict[str, int] = {}
+        self.counts: Dict[str, int] = {}
+        self.flags: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[stage] = self.spans.get(stage, 0.0) + time.perf_counter() - start
+
+    def mark(self, stage: str):
+        """Record the time elapsed since the trace started as a stage, e.g. time to first token."""
+        self.spans[stage] = time.perf_counter() - self._start
+
+    def add_tokens(self, kind: str, count: int):
+        self.tokens[kind] = self.tokens.get(kind, 0) + count
+
+    def add_count(self, name: str, count: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def set_flag(self, name: str, value: Any = True):
+        self.flags[name] = value
+
+    def record_error(self, error: BaseException):
+        self.error = type(error).__name__
+
+    def finish(self) -> Dict[str, Any]:
+        if self.duration is not None:
+            return self.to_dict()
+        self.duration = time.perf_counter() - self._start
+
+        registry = self.registry
+        registry.histogram(f"{self.kind}_seconds", f"End-to-end {self.kind} latency").observe(self.duration)
+        stage_histogram = registry.histogram(f"{self.kind}_stage_seconds", f"Per-stage {self.kind} latency")
+        for stage, seconds in self.spans.items():
+            stage_histogram.observe(seconds, stage=stage)
+        token_counter = registry.counter(f"{self.kind}_tokens", f"Estimated tokens processed per {self.kind}")
+        for kind, count in self.tokens.items():
+            token_counter.inc(count, kind=kind)
+        item_counter = registry.counter(f"{self.kind}_items", f"Items (documents, chunks, ...) handled per {self.kind}")
+        for name, count in self.counts.items():
+            item_counter.inc(count, item=name)
+        flag_counter = registry.counter(f"{self.kind}_flags", f"Flags raised during {self.kind}s")
+        for name, value in self.flags.items():
+            if value is True:
+                flag_counter.inc(flag=name)
+        registry.counter(f"{self.kind}s", f"Number of {self.kind}s").inc()
+        if self.error:
+            registry.counter(f"{self.kind}_errors", f"Failed {self.kind}s by error type").inc(error=self.error)
+
+        logger.info(f"{self.kind} trace: {json.dumps(self.to_dict())}")
+        return self.to_dict()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "duration": self.duration,
+            "spans": dict(self.spans),
+            "tokens": dict(self.tokens),
+            "counts": dict(self.counts),
+            "flags": dict(self.flags),
+            "error": self.error,
+        }
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", registry: MetricsRegistry = None):
+    """
+    Serve the registry over HTTP in a daemon thread; calling it again is a no-op.
+
+    ``/metrics`` returns the Prometheus text format and ``/metrics.json`` a JSON dump.
+    """
+    global _metrics_server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    registry = registry or REGISTRY
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = registry.render_prometheus(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = registry.render_json(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            payload = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+            logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return _metrics_server
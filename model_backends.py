@@ -0,0 +1,117 @@
+import os
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("google", "hashing")
+LLM_BACKENDS = ("google", "fake")
+
+
+def _require_google_api_key():
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("Google API key not found. Please set the GOOGLE_API_KEY environment variable.")
+    return api_key
+
+
+def uses_google_backend():
+    """Return True if either the embedding or the chat backend talks to Gemini."""
+    return (
+        os.getenv("EMBEDDING_BACKEND", "google").lower() == "google"
+        or os.getenv("LLM_BACKEND", "google").lower() == "google"
+    )
+
+
+def get_embeddings(backend=None):
+    """
+    Create the embedding model selected by configuration.
+
+    Args:
+        backend: "google" or "hashing"; defaults to the EMBEDDING_BACKEND environment variable
+
+    Returns:
+        A LangChain Embeddings instance
+    """
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "google")).lower()
+
+    if backend == "hashing":
+        from offline_models import HashingEmbeddings
+
+        return HashingEmbeddings(dimension=int(os.getenv("HASHING_EMBEDDING_DIM", "384")))
+
+    if backend == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        return GoogleGenerativeAIEmbeddings(
+            model="models/embedding-001",
+            google_api_key=_require_google_api_key(),
+        )
+
+    raise ValueError(f"Unknown embedding backend '{backend}'. Expected one of {EMBEDDING_BACKENDS}.")
+
+
+def get_chat_model(backend=None, model_name=None, resilient=None):
+    """
+    Create the chat model selected by configuration.
+
+    Args:
+        backend: "google" or "fake"; defaults to the LLM_BACKEND environment variable
+        model_name: Gemini model name; defaults to the GEMINI_MODEL environment variable
+        resilient: Wrap the model with deadlines, hedging and a circuit breaker
+            (see resilient_model.ResilientChatModel); defaults to the LLM_RESILIENCE
+            environment variable, which is on unless set to false
+
+    Returns:
+        A LangChain chat model
+    """
+    if resilient is None:
+        resilient = os.getenv("LLM_RESILIENCE", "true").lower() in ("1", "true", "yes")
+    if not resilient:
+        return _create_chat_model(backend, model_name)
+
+    from resilient_model import ResilientChatModel
+
+    primary = _create_chat_model(backend, model_name)
+    fallback_model = os.getenv("LLM_FALLBACK_MODEL")
+    fallback = _create_chat_model(backend, fallback_model, seed_offset=1) if fallback_model else None
+    return ResilientChatModel(
+        primary=primary,
+        fallback=fallback,
+        hedge=os.getenv("LLM_HEDGE", "true").lower() in ("1", "true", "yes"),
+    )
+
+
+def _create_chat_model(backend=None, model_name=None, seed_offset=0):
+    backend = (backend or os.getenv("LLM_BACKEND", "google")).lower()
+
+    if backend == "fake":
+        from offline_models import FakeChatModel
+
+        return FakeChatModel(
+            ttft_ms=float(os.getenv("FAKE_LLM_TTFT_MS", "0")),
+            ttft_sigma=float(os.getenv("FAKE_LLM_TTFT_SIGMA", "0")),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0")),
+            tokens_per_second_sigma=float(os.getenv("FAKE_LLM_TPS_SIGMA", "0")),
+            failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
+            seed=int(os.getenv("FAKE_LLM_SEED", "0")) + seed_offset,
+        )
+
+    if backend == "google":
+        import google.generativeai as genai
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        api_key = _require_google_api_key()
+        genai.configure(api_key=api_key)
+
+        models = genai.list_models()
+        logger.info(f"Available Gemini models: {[model.name for model in models]}")
+
+        return ChatGoogleGenerativeAI(
+            model=model_name or os.getenv("GEMINI_MODEL", "gemini-1.5-flash-latest"),
+            temperature=0.2,
+            google_api_key=api_key,
+            convert_system_message_to_human=True
+        )
+
+    raise ValueError(f"Unknown LLM backend '{backend}'. Expected one of {LLM_BACKENDS}.")
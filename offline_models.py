@@ -0,0 +1,164 @@
+import re
+import time
+import random
+import hashlib
+import threading
+from typing import Any, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9\-/$%]*")
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic, network-free embeddings based on the hashing trick.
+
+    Unigrams and bigrams are hashed into a fixed number of signed buckets and the
+    resulting vector is L2-normalised, so lexically similar texts end up close
+    together. The output only depends on the input text and the dimension.
+    """
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        tokens = _tokenize(text)
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            sign = 1.0 if value & 1 else -1.0
+            vector[(value >> 1) % self.dimension] += sign
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline stand-in for the Gemini chat model.
+
+    Answers are built deterministically from the prompt: question-rewriting prompts
+    echo the follow-up question, and answer prompts quote the context lines that
+    share the most words with the question. Latency is simulated with a log-normal
+    time to first token and a log-normal token throughput, drawn from a seeded RNG.
+    """
+
+    ttft_ms: float = 0.0
+    """Median time to first token in milliseconds."""
+    ttft_sigma: float = 0.0
+    """Log-normal sigma of the time to first token; 0 means constant."""
+    tokens_per_second: float = 0.0
+    """Median output throughput; 0 means tokens are emitted without delay."""
+    tokens_per_second_sigma: float = 0.0
+    """Log-normal sigma of the throughput; 0 means constant."""
+    failure_rate: float = 0.0
+    """Share of calls that fail with an error after the time to first token, for fault injection."""
+    seed: int = 0
+    max_context_lines: int = 3
+
+    _rng: random.Random = PrivateAttr()
+    _rng_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-insurance-chat"
+
+    def _sample(self, median: float, sigma: float) -> float:
+        if median <= 0:
+            return 0.0
+        if sigma <= 0:
+            return median
+        with self._rng_lock:
+            return self._rng.lognormvariate(np.log(median), sigma)
+
+    def _compose_answer(self, prompt: str) -> str:
+        if "Standalone question:" in prompt:
+            match = re.search(r"Follow Up Input:\s*(.*?)\s*Standalone question:", prompt, re.S)
+            return match.group(1).strip() if match else prompt.strip()
+
+        context_match = re.search(r"CONTEXT INFORMATION:\s*(.*?)\s*PREVIOUS CONVERSATION:", prompt, re.S)
+        question_match = re.search(r"CURRENT QUESTION:\s*(.*?)\s*YOUR RESPONSE:", prompt, re.S)
+        if not context_match or not question_match:
+            return "I don't have enough information to answer that question."
+
+        question_terms = {token for token in _tokenize(question_match.group(1)) if len(token) > 3}
+        scored_lines = []
+        for position, line in enumerate(context_match.group(1).splitlines()):
+            line = line.strip(" -\t")
+            overlap = len(question_terms.intersection(_tokenize(line)))
+            if line and overlap:
+                scored_lines.append((overlap, position, line))
+
+        if not scored_lines:
+            return "I don't have enough information to answer that question."
+
+        best = sorted(scored_lines, key=lambda item: (-item[0], item[1]))[: self.max_context_lines]
+        quoted = "\n".join(f"- {line}" for _, _, line in sorted(best, key=lambda item: item[1]))
+        return f"Based on the policy information available:\n{quoted}"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(chunk.message.content for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        answer = self._compose_answer(prompt)
+
+        time.sleep(self._sample(self.ttft_ms, self.ttft_sigma) / 1000.0)
+        if self.failure_rate > 0:
+            with self._rng_lock:
+                failed = self._rng.random() < self.failure_rate
+            if failed:
+                raise RuntimeError("Simulated chat model failure")
+        throughput = self._sample(self.tokens_per_second, self.tokens_per_second_sigma)
+        delay = 1.0 / throughput if throughput > 0 else 0.0
+
+        emitted = False
+        for token in re.split(r"(\s+)", answer):
+            if not token:
+                continue
+            if delay and emitted and not token.isspace():
+                time.sleep(delay)
+            emitted = True
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
@@ -0,0 +1,223 @@
+import hashlib
+import logging
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.vectorstores import VectorStore
+
+from chunking import POLICY_TYPES, policy_type_from_source
+from metrics import REGISTRY
+from retrieval import tokenize
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+GENERAL_PARTITION = "general"
+
+POLICY_KEYWORDS = {
+    "auto": {
+        "auto", "car", "cars", "vehicle", "vehicles", "driver", "drivers", "driving", "collision",
+        "motorist", "uninsured", "underinsured", "pip", "bodily", "traffic",
+    },
+    "health": {
+        "health", "medical", "doctor", "doctors", "hospital", "hospitalization", "prescription",
+        "prescriptions", "copay", "copayment", "coinsurance", "hmo", "ppo", "epo", "network",
+        "preventive", "surgery", "out-of-pocket",
+    },
+    "home": {
+        "home", "homes", "homeowner", "homeowners", "house", "dwelling", "property", "flood", "roof",
+        "renters", "belongings", "ho-1", "ho-2", "ho-3", "ho-4", "ho-5",
+    },
+    "life": {
+        "life", "death", "beneficiary", "beneficiaries", "term", "whole", "universal", "variable",
+        "burial", "funeral", "survivors",
+    },
+}
+
+
+def partition_key(chunk) -> str:
+    """
+    Partition a chunk belongs to: its policy type, or GENERAL_PARTITION.
+
+    Uses the 'policy_type' metadata set by the policy-aware splitter, falling back to
+    the policy type in the source file name (e.g. auto_insurance.pdf).
+    """
+    policy_type = chunk.metadata.get("policy_type")
+    if policy_type in POLICY_TYPES:
+        return policy_type
+    if policy_type is None:
+        return policy_type_from_source(chunk.metadata.get("source", "")) or GENERAL_PARTITION
+    return GENERAL_PARTITION
+
+
+class KeywordRouter:
+    """
+    Pick the partitions a question is about from policy-type keywords.
+
+    Each keyword in the question votes for its policy type. The partitions whose vote
+    count is at least ``min_share`` of the best one are selected. A question without
+    votes, or one that selects more than ``max_partitions`` types, is uncertain and is
+    routed to every partition.
+    """
+
+    def __init__(self, keywords: Dict[str, Iterable[str]] = None, min_share: float = 0.5, max_partitions: int = 2):
+        self.keywords = {name: set(words) for name, words in (keywords or POLICY_KEYWORDS).items()}
+        self.min_share = min_share
+        self.max_partitions = max_partitions
+
+    def route(self, question: str) -> Optional[List[str]]:
+        """
+        Returns:
+            The names of the selected partitions, or None when routing is uncertain
+        """
+        votes = Counter()
+        for token in tokenize(question):
+            for name, words in self.keywords.items():
+                if token in words:
+                    votes[name] += 1
+        if not votes:
+            return None
+        best = max(votes.values())
+        selected = sorted(name for name, count in votes.items() if count >= best * self.min_share)
+        return selected if len(selected) <= self.max_partitions else None
+
+
+class PartitionedKnowledgeBase(VectorStore):
+    """
+    Knowledge base with one FAISS index per policy type.
+
+    Questions are routed to the partitions for the policy types they mention (plus the
+    general partition, holding chunks of no single type) and only those indexes are
+    searched; results from several partitions are merged by distance. When routing is
+    uncertain every partition is searched, and when the selected partitions hold fewer
+    than k chunks the remainder is filled from the other partitions, ranked after the
+    routed results. Exposes the parts of the FAISS vector store interface the chatbot uses.
+    """
+
+    def __init__(self, partitions: Dict[str, Any], embeddings, router: KeywordRouter = None):
+        self.partitions = partitions
+        self._embeddings = embeddings
+        self.router = router or KeywordRouter()
+        self.version = self._content_version()
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    def _content_version(self) -> str:
+        from knowledge_base import knowledge_base_version
+
+        digest = hashlib.blake2b(digest_size=8)
+        for name in sorted(self.partitions):
+            digest.update(f"{name}={knowledge_base_version(self.partitions[name])}\0".encode("utf-8"))
+        return digest.hexdigest()
+
+    def partition_sizes(self) -> Dict[str, int]:
+        return {name: store.index.ntotal for name, store in self.partitions.items()}
+
+    def route(self, question: str) -> Tuple[List[str], bool]:
+        """
+        Returns:
+            A (partition names, routed) tuple; routed is False when every partition is used
+        """
+        selected = self.router.route(question)
+        if selected:
+            names = [name for name in selected if name in self.partitions]
+            if names:
+                if GENERAL_PARTITION in self.partitions:
+                    names.append(GENERAL_PARTITION)
+                return names, True
+        return sorted(self.partitions), False
+
+    def similarity_search_for_question(self, question: str, query_vector: List[float], k: int = 4,
+                                       trace=None, **kwargs: Any):
+        """
+        Search the partitions the question is routed to with an already embedded query.
+
+        Args:
+            question: Question text, used for routing
+            query_vector: Embedding of the question
+            k: Number of chunks to return
+            trace: Optional Trace receiving the routing flags and the number of vectors searched
+        """
+        return [doc for doc, _ in self.similarity_search_with_score_for_question(question, query_vector, k, trace, **kwargs)]
+
+    def similarity_search_with_score_for_question(self, question: str, query_vector: List[float], k: int = 4,
+                                                  trace=None, **kwargs: Any):
+        """Like similarity_search_for_question, returning (document, distance) pairs."""
+        names, routed = self.route(question)
+        results = self._search(names, query_vector, k, **kwargs)
+        searched = list(names)
+        if routed and len(results) < k:
+            others = [name for name in sorted(self.partitions) if name not in names]
+            results += self._search(others, query_vector, k - len(results), **kwargs)
+            searched += others
+
+        if trace is not None:
+            trace.set_flag("routed", routed)
+            trace.set_flag("partitions", ",".join(names))
+            trace.add_count("searched_vectors", sum(self.partitions[name].index.ntotal for name in searched))
+        REGISTRY.counter("partition_searches", "Knowledge base searches by whether routing narrowed the partitions").inc(
+            result="routed" if routed else "all"
+        )
+        return results
+
+    def _search(self, names: List[str], query_vector: List[float], k: int, **kwargs: Any):
+        if not names or k <= 0:
+            return []
+        scored = []
+        for name in names:
+            scored.extend(self.partitions[name].similarity_search_with_score_by_vector(query_vector, k=k, **kwargs))
+        scored.sort(key=lambda item: item[1])
+        return scored[:k]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any):
+        """Search every partition; use similarity_search_for_question to route."""
+        return [doc for doc, _ in self._search(sorted(self.partitions), embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any):
+        return self.similarity_search_for_question(query, self._embeddings.embed_query(query), k, **kwargs)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        from langchain_core.documents import Document
+        from knowledge_base import create_empty_vector_store
+
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = self._embeddings.embed_documents(texts)
+        ids = []
+        for text, metadata, vector in zip(texts, metadatas, vectors):
+            name = partition_key(Document(page_content=text, metadata=metadata))
+            if name not in self.partitions:
+                self.partitions[name] = create_empty_vector_store(self._embeddings, [vector])
+            ids.extend(self.partitions[name].add_embeddings([(text, vector)], metadatas=[metadata]))
+        self.version = self._content_version()
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding, metadatas: Optional[List[dict]] = None, **kwargs: Any):
+        knowledge_base = cls({}, embedding)
+        knowledge_base.add_texts(texts, metadatas)
+        return knowledge_base
+
+
+def build_partitioned_knowledge_base(chunks, embeddings, trace=None, index_type="flat") -> PartitionedKnowledgeBase:
+    """
+    Embed chunks and index them in one FAISS index per partition (see partition_key).
+
+    Args:
+        chunks: Document chunks to index
+        embeddings: Embedding model used for the chunks and later queries
+        trace: Optional Trace receiving 'embed' and 'index' spans
+        index_type: FAISS index flavour, see knowledge_base.INDEX_TYPES
+    """
+    from knowledge_base import build_vector_store
+
+    groups: Dict[str, List] = {}
+    for chunk in chunks:
+        groups.setdefault(partition_key(chunk), []).append(chunk)
+    partitions = {
+        name: build_vector_store(group, embeddings, trace=trace, index_type=index_type)
+        for name, group in groups.items()
+    }
+    return PartitionedKnowledgeBase(partitions, embeddings)
@@ -0,0 +1,233 @@
+import os
+import time
+import threading
+import contextvars
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from metrics import REGISTRY
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+HEDGE_INITIAL_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DELAY_MS", "2000")) / 1000.0
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "100")) / 1000.0
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+MAX_CONCURRENT_CALLS = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+
+
+class BackendUnavailable(Exception):
+    """The model backend could not produce an answer in time or is considered unhealthy."""
+
+
+class DeadlineExceeded(BackendUnavailable):
+    """The request deadline passed before the model answered."""
+
+
+class BackendError(BackendUnavailable):
+    """The model backend failed; the original exception is chained as the cause."""
+
+
+class CircuitOpenError(BackendUnavailable):
+    """The circuit breaker is open, so the backend is not being called."""
+
+
+class Deadline:
+    """A point in time by which a request has to be answered."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: float = None):
+    """
+    Make model calls in this block share one request deadline (LLM_TIMEOUT_SECONDS by default).
+
+    A scope nested in another keeps the outer deadline if that one expires first, so a
+    caller (e.g. the API server) can bound everything a request does.
+    """
+    deadline = Deadline(REQUEST_TIMEOUT_SECONDS if seconds is None else seconds)
+    outer = _current_deadline.get()
+    if outer is not None and outer.expires_at < deadline.expires_at:
+        deadline = outer
+    token = _current_deadline.set(deadline)
+    try:
+        yield _current_deadline.get()
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend after repeated failures.
+
+    Closed: calls go through; ``failure_threshold`` consecutive failures open the circuit.
+    Open: calls are refused with CircuitOpenError for ``reset_timeout`` seconds.
+    Half-open: one trial call is let through; success closes the circuit, failure reopens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Check whether a call may go to the backend now."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def _transition(self, state: str):
+        logger.warning(f"Circuit breaker '{self.name}' {self.state} -> {state}")
+        self.state = state
+        REGISTRY.counter("circuit_breaker_transitions", "Circuit breaker state changes").inc(
+            breaker=self.name, state=state
+        )
+
+
+class LatencyTracker:
+    """Exact quantiles over the most recent ``window`` successful call latencies."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def hedge_delay(tracker: LatencyTracker, quantile: float = HEDGE_QUANTILE, min_samples: int = 20) -> float:
+    """How long to wait for the primary call before hedging: the recent latency quantile."""
+    if len(tracker) < min_samples:
+        return HEDGE_INITIAL_DELAY_SECONDS
+    return max(HEDGE_MIN_DELAY_SECONDS, tracker.quantile(quantile))
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_trackers: Dict[str, LatencyTracker] = {}
+_shared_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker for a backend, shared by every model instance that calls it."""
+    with _shared_lock:
+        return _breakers.setdefault(name, CircuitBreaker(name))
+
+
+def get_latency_tracker(name: str) -> LatencyTracker:
+    with _shared_lock:
+        return _trackers.setdefault(name, LatencyTracker())
+
+
+# Calls that lose a hedge or outlive their deadline cannot be interrupted; they finish
+# in the background on this pool, which also caps concurrent backend calls.
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CALLS, thread_name_prefix="llm-call")
+
+
+def submit_call(fn: Callable[[], Any]):
+    """Run a backend call on the shared call pool."""
+    return _executor.submit(fn)
+
+
+def hedged_call(primary: Callable[[], Any], hedge: Optional[Callable[[], Any]], delay: float,
+                timeout: float, name: str = "llm") -> Tuple[Any, str]:
+    """
+    Run `primary`, and `hedge` as well if `primary` has not finished after `delay` seconds.
+
+    The first successful result wins. If the primary fails before the hedge was started,
+    the hedge is started right away, acting as a retry.
+
+    Returns:
+        A (result, winner) tuple where winner is "primary" or "hedge"
+
+    Raises:
+        DeadlineExceeded: Neither call succeeded within `timeout` seconds
+        Exception: The last error, if every call that was started failed
+    """
+    deadline = Deadline(timeout)
+    outcomes = REGISTRY.counter("llm_calls", "Model calls through the resilience layer by outcome")
+    futures = {_executor.submit(primary): "primary"}
+    hedged = hedge is None
+    error = None
+
+    while futures:
+        wait_for = deadline.remaining() if hedged else min(delay, deadline.remaining())
+        done, _ = wait(futures, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            label = futures.pop(future)
+            if future.exception() is None:
+                outcomes.inc(backend=name, outcome=f"{label}_won")
+                return future.result(), label
+            error = future.exception()
+            outcomes.inc(backend=name, outcome=f"{label}_failed")
+        if deadline.expired():
+            break
+        if not hedged and (not done or not futures):
+            futures[_executor.submit(hedge)] = "hedge"
+            hedged = True
+            outcomes.inc(backend=name, outcome="hedge_started")
+
+    if futures:
+        outcomes.inc(backend=name, outcome="deadline_exceeded")
+        raise DeadlineExceeded(f"No answer from '{name}' within {timeout:.1f}s")
+    raise error
@@ -0,0 +1,229 @@
+import time
+import queue
+import threading
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+
+from metrics import REGISTRY
+from resilience import (
+    REQUEST_TIMEOUT_SECONDS,
+    BackendError,
+    BackendUnavailable,
+    CircuitOpenError,
+    DeadlineExceeded,
+    current_deadline,
+    get_breaker,
+    get_latency_tracker,
+    hedge_delay,
+    hedged_call,
+    submit_call,
+)
+
+_DONE = object()
+
+
+class ResilientChatModel(BaseChatModel):
+    """
+    Chat model wrapper adding deadlines, hedging and a circuit breaker.
+
+    Every call is bounded by the current request deadline (see resilience.deadline_scope)
+    or ``timeout``. A call that has not returned after the recent p95 latency is hedged
+    with a second request to ``fallback`` (or to ``primary`` again) and the first answer
+    wins. Failures and timeouts feed a circuit breaker shared by all wrappers with the
+    same ``breaker_name``; while it is open calls fail fast with CircuitOpenError. Backend
+    errors are re-raised as BackendError, so callers can handle every failure of the model
+    (as opposed to a bug in the caller) through BackendUnavailable.
+
+    Streaming calls get the deadline and the breaker too, and are hedged on time to first
+    token: a second stream is started if the first has produced nothing after the recent
+    p95 time to first token.
+    """
+
+    primary: BaseChatModel
+    fallback: Optional[BaseChatModel] = None
+    breaker_name: str = "llm"
+    timeout: float = REQUEST_TIMEOUT_SECONDS
+    hedge: bool = True
+
+    _breaker: Any = PrivateAttr()
+    _latency: Any = PrivateAttr()
+    _first_token: Any = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._breaker = get_breaker(self.breaker_name)
+        self._latency = get_latency_tracker(self.breaker_name)
+        self._first_token = get_latency_tracker(f"{self.breaker_name}:first_token")
+
+    @property
+    def _llm_type(self) -> str:
+        return f"resilient-{self.primary._llm_type}"
+
+    @property
+    def breaker(self):
+        return self._breaker
+
+    def _remaining(self) -> float:
+        deadline = current_deadline()
+        return min(self.timeout, deadline.remaining()) if deadline else self.timeout
+
+    def _check_breaker(self):
+        if not self._breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker '{self.breaker_name}' is open")
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self._check_breaker()
+        remaining = self._remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Request deadline passed before calling the model")
+
+        def call_primary():
+            return self.primary._generate(messages, stop=stop, **kwargs)
+
+        def call_hedge():
+            return (self.fallback or self.primary)._generate(messages, stop=stop, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            result, _ = hedged_call(
+                call_primary,
+                call_hedge if self.hedge else None,
+                hedge_delay(self._latency),
+                remaining,
+                self.breaker_name,
+            )
+        except BackendUnavailable:
+            self._breaker.record_failure()
+            raise
+        except Exception as e:
+            self._breaker.record_failure()
+            raise BackendError(f"{type(e).__name__}: {str(e)}") from e
+        self._breaker.record_success()
+        self._latency.observe(time.perf_counter() - start)
+        return result
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        """
+        Stream the answer, hedged on time to first token.
+
+        If the primary stream has produced nothing after the recent p95 time to first
+        token (or fails before producing anything), a second stream is started and the
+        first one to produce a chunk is the one read from; the other is cancelled.
+        """
+        self._check_breaker()
+        remaining = self._remaining()
+        deadline = time.monotonic() + remaining
+        chunks = queue.Queue()
+        producers = {}
+        outcomes = REGISTRY.counter("llm_calls", "Model calls through the resilience layer by outcome")
+
+        def start_stream(label, model):
+            cancelled = producers[label] = threading.Event()
+
+            def produce():
+                stream = model._stream(messages, stop=stop, **kwargs)
+                try:
+                    for chunk in stream:
+                        # The consumer stopped reading this stream (it lost the hedge,
+                        # closed the stream or missed the deadline).
+                        if cancelled.is_set():
+                            break
+                        chunks.put((label, chunk))
+                except BaseException as e:
+                    chunks.put((label, e))
+                finally:
+                    stream.close()
+                    chunks.put((label, _DONE))
+
+            submit_call(produce)
+
+        def start_hedge():
+            start_stream("hedge", self.fallback or self.primary)
+            outcomes.inc(backend=self.breaker_name, outcome="hedge_started")
+
+        start = time.perf_counter()
+        start_stream("primary", self.primary)
+        hedge_at = time.monotonic() + hedge_delay(self._first_token) if self.hedge else None
+        winner, finished, error = None, set(), None
+        try:
+            while True:
+                wait_until = deadline
+                if winner is None and hedge_at is not None and "hedge" not in producers:
+                    wait_until = min(deadline, hedge_at)
+                try:
+                    label, item = chunks.get(timeout=max(0.0, wait_until - time.monotonic()))
+                except queue.Empty:
+                    if time.monotonic() >= deadline:
+                        outcomes.inc(backend=self.breaker_name, outcome="deadline_exceeded")
+                        raise DeadlineExceeded(
+                            f"No complete answer from '{self.breaker_name}' within {remaining:.1f}s"
+                        )
+                    start_hedge()
+                    continue
+                # A stream that keeps producing, just slowly, must not outlive the deadline either.
+                if item is not _DONE and time.monotonic() >= deadline:
+                    outcomes.inc(backend=self.breaker_name, outcome="deadline_exceeded")
+                    raise DeadlineExceeded(f"No complete answer from '{self.breaker_name}' within {remaining:.1f}s")
+
+                if winner is not None and label != winner:
+                    continue
+                if item is _DONE:
+                    if label == winner:
+                        break
+                    finished.add(label)
+                    if len(finished) < len(producers):
+                        continue
+                    if error is not None:
+                        raise BackendError(f"{type(error).__name__}: {str(error)}") from error
+                    winner = label
+                    break
+                if isinstance(item, BaseException):
+                    if winner is not None:
+                        raise BackendError(f"{type(item).__name__}: {str(item)}") from item
+                    error = item
+                    outcomes.inc(backend=self.breaker_name, outcome=f"{label}_failed")
+                    # A primary failing before its first token is retried right away.
+                    if hedge_at is not None and "hedge" not in producers:
+                        start_hedge()
+                    continue
+
+                if winner is None:
+                    winner = label
+                    for other, cancelled in producers.items():
+                        if other != label:
+                            cancelled.set()
+                    outcomes.inc(backend=self.breaker_name, outcome=f"{label}_won")
+                    self._first_token.observe(time.perf_counter() - start)
+                if run_manager:
+                    run_manager.on_llm_new_token(item.message.content, chunk=item)
+                yield item
+        except GeneratorExit:
+            # The consumer closed the stream after at least one chunk (e.g. the answer
+            # guard stopped it), so the model was answering; this also ends a half-open
+            # trial, which would otherwise keep the breaker from ever letting calls through.
+            self._breaker.record_success()
+            raise
+        except Exception:
+            self._breaker.record_failure()
+            raise
+        finally:
+            for cancelled in producers.values():
+                cancelled.set()
+        self._breaker.record_success()
+        self._latency.observe(time.perf_counter() - start)
@@ -0,0 +1,257 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from metrics import REGISTRY, Trace
+from singleflight import request_key
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FAQ_QUESTIONS = [
+    "What are the eligibility criteria for life insurance?",
+    "How do I file a health insurance claim?",
+    "What does auto liability insurance cover?",
+    "What factors affect my home insurance premium?",
+    "What is the difference between term and whole life insurance?",
+    "How much coverage do I need for my car insurance?"
+]
+
+DEFAULT_MAX_ENTRIES = 256
+FAQ_WARMUP_WORKERS = int(os.getenv("FAQ_WARMUP_WORKERS", "4"))
+FAQ_WARMUP_RETRY_SECONDS = float(os.getenv("FAQ_WARMUP_RETRY_SECONDS", "300"))
+MAX_WARMED_VERSIONS = 64
+
+
+class ResponseCache:
+    """
+    Answers to first-turn questions, keyed by normalized question and knowledge base version.
+
+    Entries are only ever served for the knowledge base version they were computed
+    against, so rebuilding the index makes older entries unreachable; they are pushed
+    out by the least-recently-used limit. Entries for several versions can be live at
+    once, e.g. when sessions use different uploaded documents.
+
+    Pinned entries (answers users rated as helpful, see feedback_log.py) are skipped by
+    the least-recently-used limit. At most ``max_pinned`` entries stay pinned; beyond
+    that the least recently used pinned entry becomes an ordinary one again.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_pinned: int = None):
+        self.max_entries = max_entries
+        self.max_pinned = max_entries // 2 if max_pinned is None else max_pinned
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, question: str, knowledge_base) -> Optional[Dict[str, Any]]:
+        key = request_key(question, knowledge_base)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        REGISTRY.counter("response_cache_lookups", "Response cache lookups by result").inc(
+            result="hit" if entry is not None else "miss"
+        )
+        return entry
+
+    def put(self, question: str, knowledge_base, raw_answer: str, answer: str, source_documents,
+            pinned: bool = False):
+        """
+        Store an answer.
+
+        Args:
+            question: The question as asked
+            knowledge_base: Knowledge base the answer was retrieved from
+            raw_answer: Model output before post-processing, as kept in conversation memory
+            answer: Post-processed answer shown to the user
+            source_documents: Retrieved chunks the answer is based on
+            pinned: Keep the entry out of least-recently-used eviction; a pinned entry
+                stays pinned when it is replaced
+        """
+        key = request_key(question, knowledge_base)
+        entry = {
+            "question": question,
+            "raw_answer": raw_answer,
+            "answer": answer,
+            "source_documents": list(source_documents),
+            "created": time.time(),
+            "pinned": pinned,
+        }
+        with self._lock:
+            previous = self._entries.get(key)
+            entry["pinned"] = pinned or (previous is not None and previous["pinned"])
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._trim()
+
+    def pin(self, question: str, knowledge_base) -> bool:
+        """
+        Pin the cached answer to a question, if there is one.
+
+        Returns:
+            True if an entry was found and pinned
+        """
+        key = request_key(question, knowledge_base)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            entry["pinned"] = True
+            self._entries.move_to_end(key)
+            self._trim()
+        return True
+
+    def evict(self, question: str, knowledge_base) -> bool:
+        """
+        Drop the cached answer to a question, pinned or not.
+
+        Returns:
+            True if an entry was removed
+        """
+        with self._lock:
+            return self._entries.pop(request_key(question, knowledge_base), None) is not None
+
+    def _trim(self):
+        pinned = [key for key, entry in self._entries.items() if entry["pinned"]]
+        for key in pinned[:max(0, len(pinned) - self.max_pinned)]:
+            self._entries[key]["pinned"] = False
+        for key in [key for key, entry in self._entries.items() if not entry["pinned"]]:
+            if len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    def contains(self, question: str, knowledge_base) -> bool:
+        """Check for an entry without counting a lookup or refreshing its recency."""
+        with self._lock:
+            return request_key(question, knowledge_base) in self._entries
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+def warm_faq_answers(knowledge_base, questions: List[str] = None, cache: ResponseCache = None,
+                     llm=None, max_workers: int = FAQ_WARMUP_WORKERS) -> int:
+    """
+    Answer the FAQ questions against a knowledge base in parallel and cache the answers.
+
+    Each question is answered by its own chatbot with an empty conversation, exactly as
+    a first click would be, and cached under the knowledge base's version.
+
+    Args:
+        knowledge_base: Knowledge base to answer from
+        questions: Questions to warm; defaults to FAQ_QUESTIONS
+        cache: Cache to fill; defaults to RESPONSE_CACHE
+        llm: Chat model to share between the warm-up chatbots; defaults to get_chat_model()
+        max_workers: Number of questions answered concurrently
+
+    Returns:
+        The number of answers cached
+    """
+    from insurance_chatbot import InsuranceChatbot, ERROR_RESPONSE
+    from knowledge_base import knowledge_base_version
+    from model_backends import get_chat_model
+
+    questions = questions or FAQ_QUESTIONS
+    cache = cache or RESPONSE_CACHE
+    llm = llm or get_chat_model()
+    version = knowledge_base_version(knowledge_base)
+    trace = Trace("faq_warmup")
+
+    def answer(question):
+        chatbot = InsuranceChatbot(knowledge_base, verbose=False, llm=llm, response_cache=None)
+        details = chatbot.get_response_details(question)
+        messages = chatbot.memory.chat_memory.messages
+        if details["answer"] == ERROR_RESPONSE or details["trace"]["flags"].get("degraded") or not messages:
+            return False
+        cache.put(question, knowledge_base, messages[-1].content, details["answer"], details["source_documents"])
+        return True
+
+    try:
+        with trace.span("answer"):
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="faq-warmup") as executor:
+                cached = sum(executor.map(answer, questions))
+        trace.add_count("questions", len(questions))
+        trace.add_count("cached", cached)
+        logger.info(f"Warmed {cached}/{len(questions)} FAQ answers for knowledge base {version}")
+        return cached
+    except Exception as e:
+        trace.record_error(e)
+        raise
+    finally:
+        trace.finish()
+
+
+_warming = set()
+# Knowledge base version -> time.monotonic() its last warm-up finished, least recent first.
+_warmed: "OrderedDict[str, float]" = OrderedDict()
+_warming_lock = threading.Lock()
+
+
+def _record_warm_up(version: str, finished: float):
+    _warmed[version] = finished
+    _warmed.move_to_end(version)
+    while len(_warmed) > MAX_WARMED_VERSIONS:
+        _warmed.popitem(last=False)
+
+
+def forget_faq_warm_up(knowledge_base):
+    """Drop what ensure_faq_answers remembers about a knowledge base, e.g. once it is evicted."""
+    from knowledge_base import knowledge_base_version
+
+    with _warming_lock:
+        _warmed.pop(knowledge_base_version(knowledge_base), None)
+
+
+def ensure_faq_answers(knowledge_base, questions: List[str] = None, cache: ResponseCache = None, llm=None,
+                       retry_seconds: float = FAQ_WARMUP_RETRY_SECONDS):
+    """
+    Warm the FAQ answers for a knowledge base in a background thread unless already done.
+
+    Call this whenever a shared knowledge base (the default documents, or the API
+    server's) is built, loaded or used; it is cheap when nothing needs doing. A knowledge
+    base built for one user's upload is not worth six model calls for questions that may
+    never be asked against it. A warm-up starts when some FAQ answer for the knowledge base's version is
+    missing (a new or changed index, or evicted entries) and none is already running, and
+    only answers the missing questions. Once a warm-up for a version has finished, the
+    next one waits `retry_seconds`, so answers that could not be cached (e.g. because the
+    model is down) are not asked for again on every call. At most MAX_WARMED_VERSIONS
+    versions are remembered.
+
+    Returns:
+        The background thread, or None if no warm-up was needed
+    """
+    from knowledge_base import knowledge_base_version
+
+    questions = questions or FAQ_QUESTIONS
+    cache = cache or RESPONSE_CACHE
+    version = knowledge_base_version(knowledge_base)
+    now = time.monotonic()
+    with _warming_lock:
+        if version in _warming or now - _warmed.get(version, float("-inf")) < retry_seconds:
+            return None
+        missing = [question for question in questions if not cache.contains(question, knowledge_base)]
+        if not missing:
+            _record_warm_up(version, now)
+            return None
+        _warming.add(version)
+
+    def run():
+        try:
+            warm_faq_answers(knowledge_base, missing, cache, llm)
+        except Exception as e:
+            logger.error(f"FAQ warm-up failed for knowledge base {version}: {str(e)}")
+        finally:
+            with _warming_lock:
+                _warming.discard(version)
+                _record_warm_up(version, time.monotonic())
+
+    thread = threading.Thread(target=run, name=f"faq-warmup-{version}", daemon=True)
+    thread.start()
+    return thread
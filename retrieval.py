@@ -0,0 +1,119 @@
+import re
+import math
+import json
+import logging
+from collections import Counter
+from typing import Dict, List, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SEARCH_MODES = ("dense", "hybrid")
+
+_WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9\-]*")
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_PATTERN.findall(text.lower())
+
+
+def document_key(doc) -> str:
+    """Stable identity for a chunk, independent of which index returned it."""
+    return json.dumps([doc.page_content, doc.metadata], sort_keys=True, default=str)
+
+
+def indexed_documents(vector_store):
+    """Return every Document held by a FAISS vector store, in index order."""
+    return [
+        vector_store.docstore.search(doc_id)
+        for _, doc_id in sorted(vector_store.index_to_docstore_id.items())
+    ]
+
+
+class BM25Index:
+    """
+    Minimal in-memory Okapi BM25 index over Document chunks, used for the lexical
+    half of hybrid retrieval.
+    """
+
+    def __init__(self, documents, k1: float = 1.5, b: float = 0.75):
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+        self.term_frequencies = [Counter(tokenize(doc.page_content)) for doc in self.documents]
+        self.lengths = [sum(tf.values()) for tf in self.term_frequencies]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        document_frequency = Counter()
+        for tf in self.term_frequencies:
+            document_frequency.update(tf.keys())
+        total = len(self.documents)
+        self.idf = {
+            term: math.log(1 + (total - count + 0.5) / (count + 0.5))
+            for term, count in document_frequency.items()
+        }
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[object, float]]:
+        terms = [term for term in tokenize(query) if term in self.idf]
+        scores = []
+        for position, tf in enumerate(self.term_frequencies):
+            score = 0.0
+            length_norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / (self.average_length or 1))
+            for term in terms:
+                frequency = tf.get(term)
+                if frequency:
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + length_norm)
+            if score > 0:
+                scores.append((score, position))
+        scores.sort(key=lambda item: (-item[0], item[1]))
+        return [(self.documents[position], score) for score, position in scores[:k]]
+
+
+def reciprocal_rank_fusion(ranked_lists, k: int = 4, rrf_k: int = 60):
+    """
+    Merge several ranked document lists into one using reciprocal rank fusion.
+    """
+    fused: Dict[str, float] = {}
+    documents = {}
+    for ranked in ranked_lists:
+        for rank, doc in enumerate(ranked):
+            key = document_key(doc)
+            documents[key] = doc
+            fused[key] = fused.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    ordered = sorted(fused.items(), key=lambda item: -item[1])
+    return [documents[key] for key, _ in ordered[:k]]
+
+
+class HybridSearcher:
+    """
+    Dense FAISS search fused with BM25 keyword search.
+
+    Both retrievers fetch ``candidate_factor * k`` results, which are merged with
+    reciprocal rank fusion.
+    """
+
+    def __init__(self, vector_store, candidate_factor: int = 4):
+        self.vector_store = vector_store
+        self.bm25 = BM25Index(indexed_documents(vector_store))
+        self.candidate_factor = candidate_factor
+
+    def search(self, query: str, k: int = 4):
+        fetch = k * self.candidate_factor
+        dense = self.vector_store.similarity_search(query, k=fetch)
+        lexical = [doc for doc, _ in self.bm25.search(query, k=fetch)]
+        return reciprocal_rank_fusion([dense, lexical], k=k)
+
+
+def make_searcher(vector_store, mode: str = "dense"):
+    """
+    Return a ``search(query, k)`` callable for the given retrieval mode.
+
+    Args:
+        vector_store: FAISS vector store to search
+        mode: "dense" or "hybrid", see SEARCH_MODES
+    """
+    if mode == "dense":
+        return lambda query, k: vector_store.similarity_search(query, k=k)
+    if mode == "hybrid":
+        return HybridSearcher(vector_store).search
+    raise ValueError(f"Unknown search mode '{mode}'. Expected one of {SEARCH_MODES}.")
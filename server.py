@@ -0,0 +1,469 @@
+"""
+Headless HTTP API for the insurance chatbot.
+
+Serves the chatbot to web and mobile clients without Streamlit. One knowledge base
+and one chat model are shared by every conversation; each session id gets its own
+InsuranceChatbot (and so its own conversation memory). Answers are computed on a
+bounded worker pool, and requests beyond the pool plus its queue are rejected with
+503 instead of piling up.
+
+Endpoints:
+    POST   /v1/sessions                  -> {"session_id": ...}
+    POST   /v1/sessions/<id>/messages    {"message": "...", "stream": false}
+    DELETE /v1/sessions/<id>
+    GET    /v1/index                     -> current knowledge base version and those still draining
+    POST   /v1/index/reload              -> rebuild the knowledge base in the background (202)
+    GET    /healthz
+    GET    /metrics, /metrics.json
+    GET    /debug/memory                 -> knowledge base and per-session memory footprint
+
+With "stream": true (or "Accept: text/event-stream") the answer is sent as
+server-sent events: one "token" event per generated piece, then a "done" event
+with the final answer, its sources and the request trace.
+
+A reload builds the new knowledge base while questions keep being answered from
+the current one, then swaps it in for every session without touching their
+conversations; questions already in progress finish on the old one.
+
+Usage:
+    EMBEDDING_BACKEND=hashing LLM_BACKEND=fake python server.py --port 8000 --workers 8
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import argparse
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from metrics import REGISTRY
+from index_holder import as_index_holder
+from resilience import deadline_scope
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv("SERVER_WORKERS", "8"))
+DEFAULT_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "32"))
+DEFAULT_MAX_SESSIONS = int(os.getenv("SERVER_MAX_SESSIONS", "1000"))
+DEFAULT_SESSION_TTL = float(os.getenv("SERVER_SESSION_TTL_SECONDS", "1800"))
+STREAM_QUEUE_EVENTS = int(os.getenv("SERVER_STREAM_QUEUE_EVENTS", "256"))
+MAX_MESSAGE_CHARS = 4000
+
+
+class ServerBusy(Exception):
+    """Raised when the worker pool and its queue are full."""
+
+
+class SessionManager:
+    """
+    Maps session ids to InsuranceChatbot instances over one shared, swappable knowledge base.
+
+    Sessions idle for longer than ``ttl`` seconds are dropped, and the least recently
+    used session is evicted once ``max_sessions`` is reached. Each session has a lock
+    so that concurrent messages to one conversation are answered one at a time.
+    """
+
+    def __init__(self, knowledge_base, llm, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 ttl: float = DEFAULT_SESSION_TTL):
+        self.index = as_index_holder(knowledge_base, label="default")
+        self.llm = llm
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    @property
+    def knowledge_base(self):
+        return self.index.knowledge_base
+
+    def get(self, session_id: str):
+        """Return the (chatbot, lock) pair for a session, creating it if needed."""
+        from insurance_chatbot import InsuranceChatbot
+
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                while len(self._sessions) >= self.max_sessions:
+                    self._sessions.popitem(last=False)
+                entry = {
+                    "chatbot": InsuranceChatbot(self.index, verbose=False, llm=self.llm),
+                    "lock": threading.Lock(),
+                }
+                self._sessions[session_id] = entry
+                REGISTRY.counter("server_sessions_created", "Conversations started on the API server").inc()
+            entry["last_used"] = now
+            self._sessions.move_to_end(session_id)
+            return entry["chatbot"], entry["lock"]
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def items(self):
+        """(session id, chatbot) pairs of the live sessions."""
+        with self._lock:
+            return [(session_id, entry["chatbot"]) for session_id, entry in self._sessions.items()]
+
+    def _expire(self, now: float):
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if now - entry["last_used"] <= self.ttl:
+                break
+            del self._sessions[session_id]
+
+
+class WorkerPool:
+    """Thread pool that accepts at most ``workers + queue_size`` jobs at a time."""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chatbot-worker")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            REGISTRY.counter("server_rejected", "Requests rejected because the worker pool was full").inc()
+            raise ServerBusy()
+        with self._count_lock:
+            self._in_flight += 1
+
+        def run():
+            try:
+                return fn(*args)
+            finally:
+                with self._count_lock:
+                    self._in_flight -= 1
+                self._slots.release()
+
+        return self._executor.submit(run)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _serialize_sources(source_documents):
+    return [{"content": doc.page_content, "metadata": doc.metadata} for doc in source_documents]
+
+
+def _count_cancelled(stage: str):
+    REGISTRY.counter("server_cancelled", "Answers abandoned because the client timed out or disconnected").inc(
+        stage=stage
+    )
+
+
+# Workers get the request's cancel event and deadline (a time.monotonic() value). Jobs
+# whose client has given up while they were queued are skipped, and model calls share
+# the request deadline, so a timed-out request does not keep its worker busy.
+
+def _answer(sessions: SessionManager, session_id: str, message: str, cancelled: threading.Event,
+            deadline: float):
+    if cancelled.is_set():
+        _count_cancelled("queued")
+        return None
+    chatbot, lock = sessions.get(session_id)
+    with lock, deadline_scope(max(0.0, deadline - time.monotonic())):
+        if cancelled.is_set():
+            _count_cancelled("queued")
+            return None
+        return chatbot.get_response_details(message)
+
+
+def _stream_answer(sessions: SessionManager, session_id: str, message: str, events: queue.Queue,
+                   cancelled: threading.Event, deadline: float):
+    if cancelled.is_set():
+        _count_cancelled("queued")
+        return
+    chatbot, lock = sessions.get(session_id)
+    with lock, deadline_scope(max(0.0, deadline - time.monotonic())):
+        stream = chatbot.stream_response(message)
+        try:
+            for event in stream:
+                while True:
+                    # Checked between tokens: closing the stream stops the model's generation.
+                    if cancelled.is_set():
+                        _count_cancelled("streaming")
+                        return
+                    try:
+                        events.put(event, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        finally:
+            stream.close()
+
+
+class ChatbotServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, sessions: SessionManager, pool: WorkerPool, request_timeout: float = 120.0,
+                 knowledge_base_factory=None):
+        self.sessions = sessions
+        self.pool = pool
+        self.request_timeout = request_timeout
+        self.knowledge_base_factory = knowledge_base_factory
+        self.started = time.time()
+        self._knowledge_base_footprint = None
+        self._reload = None
+        self._reload_lock = threading.Lock()
+        super().__init__(address, ChatbotRequestHandler)
+
+    def memory_report(self):
+        from memory_accounting import knowledge_base_footprint, memory_report
+
+        # The shared knowledge base only changes on a reload, so measure each version once.
+        version = self.sessions.index.version
+        if self._knowledge_base_footprint is None or self._knowledge_base_footprint[0] != version:
+            footprint = {"key": "default", **knowledge_base_footprint(self.sessions.knowledge_base)}
+            self._knowledge_base_footprint = (version, footprint)
+        return memory_report([self._knowledge_base_footprint[1]], self.sessions.items())
+
+    def reload_knowledge_base(self) -> bool:
+        """
+        Start rebuilding the knowledge base in the background, warming its FAQ answers
+        before it is swapped in.
+
+        Returns:
+            False if a reload is already running
+        """
+        from response_cache import ensure_faq_answers
+
+        def build():
+            knowledge_base = self.knowledge_base_factory()
+            warm_up = ensure_faq_answers(knowledge_base, llm=self.sessions.llm)
+            if warm_up is not None:
+                warm_up.join()
+            return knowledge_base
+
+        with self._reload_lock:
+            if self._reload is not None and not self._reload.done():
+                return False
+            self._reload = self.sessions.index.rebuild_in_background(build, label="default")
+        return True
+
+
+class ChatbotRequestHandler(BaseHTTPRequestHandler):
+    server_version = "InsuranceChatbot/1.0"
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/healthz":
+            self._send_json(200, {
+                "status": "ok",
+                "sessions": len(self.server.sessions),
+                "in_flight": self.server.pool.in_flight,
+                "capacity": self.server.pool.capacity,
+                "uptime_seconds": time.time() - self.server.started,
+            })
+        elif path == "/metrics":
+            self._send_body(200, REGISTRY.render_prometheus(), "text/plain; version=0.0.4")
+        elif path == "/metrics.json":
+            self._send_body(200, REGISTRY.render_json(), "application/json")
+        elif path == "/v1/index":
+            self._send_json(200, self.server.sessions.index.status())
+        elif path == "/debug/memory":
+            self._send_json(200, self.server.memory_report())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if parts == ["v1", "sessions"]:
+            self._send_json(201, {"session_id": uuid.uuid4().hex})
+        elif len(parts) == 4 and parts[:2] == ["v1", "sessions"] and parts[3] == "messages":
+            self._handle_message(parts[2])
+        elif parts == ["v1", "index", "reload"]:
+            if self.server.knowledge_base_factory is None:
+                self._send_json(409, {"error": "this server's knowledge base cannot be rebuilt"})
+            elif self.server.reload_knowledge_base():
+                self._send_json(202, {"reloading": True, "version": self.server.sessions.index.version})
+            else:
+                self._send_json(409, {"error": "a reload is already running"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_DELETE(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if len(parts) == 3 and parts[:2] == ["v1", "sessions"]:
+            deleted = self.server.sessions.delete(parts[2])
+            self._send_json(200 if deleted else 404, {"deleted": deleted})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _handle_message(self, session_id: str):
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {"error": "request body must be JSON"})
+            return
+        message = str(payload.get("message") or "").strip()
+        if not message or len(message) > MAX_MESSAGE_CHARS:
+            self._send_json(400, {"error": f"'message' must be 1-{MAX_MESSAGE_CHARS} characters"})
+            return
+
+        stream = payload.get("stream") or "text/event-stream" in (self.headers.get("Accept") or "")
+        try:
+            if stream:
+                status = self._stream_message(session_id, message)
+            else:
+                status = self._reply_message(session_id, message)
+        except ServerBusy:
+            status = 503
+            self._send_json(503, {"error": "server busy, retry later"}, {"Retry-After": "1"})
+        except FutureTimeoutError:
+            status = 504
+            self._send_json(504, {"error": "timed out waiting for an answer"})
+        except Exception as e:
+            logger.error(f"Error answering message for session {session_id}: {type(e).__name__}: {str(e)}")
+            status = 500
+            self._send_json(500, {"error": "internal error"})
+
+        REGISTRY.counter("server_requests", "API requests by route and status").inc(
+            route="messages", status=str(status), stream=str(bool(stream)).lower()
+        )
+        REGISTRY.histogram("server_request_seconds", "API request latency including queueing").observe(
+            time.perf_counter() - start, route="messages"
+        )
+
+    def _reply_message(self, session_id: str, message: str) -> int:
+        cancelled = threading.Event()
+        future = self.server.pool.submit(_answer, self.server.sessions, session_id, message, cancelled,
+                                         time.monotonic() + self.server.request_timeout)
+        try:
+            details = future.result(timeout=self.server.request_timeout)
+        except FutureTimeoutError:
+            cancelled.set()
+            raise
+        self._send_json(200, {
+            "session_id": session_id,
+            "answer": details["answer"],
+            "sources": _serialize_sources(details["source_documents"]),
+            "trace": details["trace"],
+        })
+        return 200
+
+    def _stream_message(self, session_id: str, message: str) -> int:
+        # Bounded so that a client reading slowly holds back generation instead of buffering it all.
+        events = queue.Queue(maxsize=STREAM_QUEUE_EVENTS)
+        cancelled = threading.Event()
+        deadline = time.monotonic() + self.server.request_timeout
+        future = self.server.pool.submit(_stream_answer, self.server.sessions, session_id, message, events,
+                                         cancelled, deadline)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=0.1)
+                except queue.Empty:
+                    if future.done() and events.empty():
+                        error = future.exception()
+                        if error is not None:
+                            logger.error(f"Error streaming session {session_id}: {type(error).__name__}: {str(error)}")
+                            self._write_event("error", {"error": "internal error"})
+                        break
+                    if time.monotonic() > deadline:
+                        self._write_event("error", {"error": "timed out"})
+                        break
+                    continue
+                if event["type"] == "token":
+                    self._write_event("token", {"text": event["text"]})
+                else:
+                    self._write_event("done", {
+                        "session_id": session_id,
+                        "answer": event["answer"],
+                        "sources": _serialize_sources(event["source_documents"]),
+                        "trace": event["trace"],
+                    })
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info(f"Client disconnected from session {session_id} stream")
+        finally:
+            cancelled.set()
+        return 200
+
+    def _write_event(self, event: str, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, data, headers=None):
+        self._send_body(status, json.dumps(data), "application/json", headers)
+
+    def _send_body(self, status: int, body: str, content_type: str, headers=None):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def create_server(host="0.0.0.0", port=8000, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                  max_sessions=DEFAULT_MAX_SESSIONS, knowledge_base=None):
+    """Build the knowledge base and chat model once, start warming the FAQ answers and return the server."""
+    from knowledge_base import create_knowledge_base
+    from model_backends import get_chat_model
+    from response_cache import ensure_faq_answers
+
+    # A knowledge base passed in was built elsewhere, so only the default one can be reloaded.
+    factory = None if knowledge_base is not None else create_knowledge_base
+    knowledge_base = knowledge_base or create_knowledge_base()
+    llm = get_chat_model()
+    ensure_faq_answers(knowledge_base, llm=llm)
+    sessions = SessionManager(knowledge_base, llm, max_sessions=max_sessions)
+    return ChatbotServer((host, port), sessions, WorkerPool(workers, queue_size), knowledge_base_factory=factory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVER_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS)
+    args = parser.parse_args()
+
+    os.environ.setdefault("CHAIN_VERBOSE", "false")
+    server = create_server(args.host, args.port, args.workers, args.queue_size, args.max_sessions)
+    logger.info(f"Serving the insurance chatbot on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.pool.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_MEMORY_TURNS = int(os.getenv("SESSION_MEMORY_TURNS", "20"))
+SESSION_MAX_ACTIVE = int(os.getenv("SESSION_MAX_ACTIVE", "200"))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "900"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    document TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT,
+    created REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS feedback (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    verdict TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+class SessionStore:
+    """
+    Conversations kept in SQLite instead of process memory.
+
+    Each message is one row keyed by (session id, sequence number); the optional
+    metadata is stored as compact JSON. Readers fetch only the most recent messages
+    they display, so the cost of a rerun does not grow with the length of the
+    conversation, and conversations survive restarts of the app.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def create_session(self, document: str = None) -> str:
+        """Start a new conversation and return its id."""
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, document, created, updated) VALUES (?, ?, ?, ?)",
+                (session_id, document, now, now),
+            )
+        REGISTRY.counter("sessions_created", "Conversations started in the session store").inc()
+        return session_id
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT document, created, updated FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"session_id": session_id, "document": row[0], "created": row[1], "updated": row[2]}
+
+    def set_document(self, session_id: str, document: str):
+        """Record which document a conversation is about."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET document = ?, updated = ? WHERE session_id = ?",
+                (document, time.time(), session_id),
+            )
+
+    def append_message(self, session_id: str, role: str, content: str, metadata: Dict[str, Any] = None) -> int:
+        """
+        Append a message to a conversation.
+
+        Args:
+            session_id: Conversation to append to
+            role: "user" or "assistant"
+            content: Message text as shown to the user
+            metadata: Optional JSON-serializable details, e.g. sources of an answer
+
+        Returns:
+            The sequence number of the message within the conversation
+        """
+        encoded = json.dumps(metadata, separators=(",", ":")) if metadata else None
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+                self._conn.execute(
+                    "INSERT INTO messages (session_id, seq, role, content, metadata, created) VALUES (?, ?, ?, ?, ?, ?)",
+                    (session_id, seq, role, content, encoded, now),
+                )
+                self._conn.execute("UPDATE sessions SET updated = ? WHERE session_id = ?", (now, session_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return seq
+
+    def message_count(self, session_id: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def history_size(self, session_id: str) -> Dict[str, int]:
+        """Number of stored messages of a conversation and the bytes of their text and metadata."""
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(content AS BLOB)) + COALESCE(LENGTH(metadata), 0)), 0) "
+                "FROM messages WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+        return {"history_messages": count, "history_bytes": size}
+
+    def recent_messages(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Load the last `limit` messages of a conversation, oldest first.
+
+        Returns:
+            Message dictionaries with 'seq', 'role', 'content' and 'metadata' keys
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content, metadata FROM messages WHERE session_id = ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (session_id, limit),
+            ).fetchall()
+        return [
+            {"seq": seq, "role": role, "content": content, "metadata": json.loads(metadata) if metadata else {}}
+            for seq, role, content, metadata in reversed(rows)
+        ]
+
+    def message(self, session_id: str, seq: int) -> Optional[Dict[str, Any]]:
+        """Load one message by sequence number, as returned by recent_messages, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT role, content, metadata FROM messages WHERE session_id = ? AND seq = ?", (session_id, seq)
+            ).fetchone()
+        if row is None:
+            return None
+        role, content, metadata = row
+        return {"seq": seq, "role": role, "content": content, "metadata": json.loads(metadata) if metadata else {}}
+
+    def clear_messages(self, session_id: str):
+        """Forget the messages and feedback of a conversation but keep the conversation."""
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM feedback WHERE session_id = ?", (session_id,))
+
+    def delete_session(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM feedback WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def record_feedback(self, session_id: str, seq: int, verdict: str) -> bool:
+        """
+        Record a verdict on an answer; only the first verdict per answer counts.
+
+        Returns:
+            True if the verdict was recorded, False if the answer already had one
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO feedback (session_id, seq, verdict, created) VALUES (?, ?, ?, ?)",
+                (session_id, seq, verdict, time.time()),
+            )
+        return cursor.rowcount == 1
+
+    def feedback(self, session_id: str, since_seq: int = 0) -> Dict[int, str]:
+        """Verdicts given in a conversation, by message sequence number."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, verdict FROM feedback WHERE session_id = ? AND seq >= ?", (session_id, since_seq)
+            ).fetchall()
+        return dict(rows)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Process-wide session store at SESSION_DB_PATH, opened on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+            logger.info(f"Opened session store at {_store.path}")
+        return _store
+
+
+def answer_metadata(chatbot, details: Dict[str, Any], memory_length: int) -> Dict[str, Any]:
+    """
+    Details of an answer worth keeping next to its text in the store.
+
+    Args:
+        chatbot: Chatbot that answered
+        details: Result of chatbot.get_response_details
+        memory_length: Number of messages in the chatbot's memory before the question
+
+    Returns:
+        Metadata with the answer's sources, knowledge base version and trace flags, plus
+        'raw_answer' (the text saved in conversation memory) if the turn was remembered and
+        'first_turn' if the question was asked without earlier conversation
+    """
+    from knowledge_base import knowledge_base_version
+
+    metadata = {
+        "sources": sorted({doc.metadata.get("source", "") for doc in details["source_documents"]}),
+        "kb_version": details.get("kb_version") or knowledge_base_version(chatbot.knowledge_base),
+    }
+    if details["trace"]["flags"]:
+        metadata["flags"] = details["trace"]["flags"]
+    if memory_length == 0:
+        metadata["first_turn"] = True
+    messages = chatbot.memory.chat_memory.messages
+    if len(messages) > memory_length:
+        metadata["raw_answer"] = messages[-1].content
+    return metadata
+
+
+def restore_memory(chatbot, store: SessionStore, session_id: str, max_turns: int = SESSION_MEMORY_TURNS) -> int:
+    """
+    Rebuild a chatbot's conversation memory from the stored history.
+
+    Only turns the chatbot remembered when they were answered (those whose answer
+    carries 'raw_answer' metadata) are restored, with the answer text exactly as it
+    was saved to memory, so a rebuilt chatbot sees the same history as the original.
+
+    Args:
+        chatbot: Chatbot with empty memory
+        store: Store holding the conversation
+        session_id: Conversation to restore
+        max_turns: Restore at most this many of the most recent remembered turns
+
+    Returns:
+        The number of turns restored
+    """
+    messages = store.recent_messages(session_id, max_turns * 4)
+    turns = []
+    for question, answer in zip(messages, messages[1:]):
+        if question["role"] == "user" and answer["role"] == "assistant" and "raw_answer" in answer["metadata"]:
+            turns.append((question["content"], answer["metadata"]["raw_answer"]))
+    turns = turns[-max_turns:] if max_turns else []
+
+    for question, raw_answer in turns:
+        chatbot.memory.chat_memory.add_user_message(question)
+        chatbot.memory.chat_memory.add_ai_message(raw_answer)
+    return len(turns)
+
+
+class ActiveSessions:
+    """
+    Chatbots of recently used conversations, by session id.
+
+    Conversations idle for longer than ``idle_seconds`` are dropped from memory, and
+    the least recently used one is dropped once ``max_active`` is reached. A dropped
+    conversation is rebuilt by the factory, with its memory restored from the session
+    store, the next time it is used.
+    """
+
+    def __init__(self, max_active: int = SESSION_MAX_ACTIVE, idle_seconds: float = SESSION_IDLE_SECONDS):
+        self.max_active = max_active
+        self.idle_seconds = idle_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def get(self, session_id: str, factory: Callable[[], Any]):
+        """Return the chatbot for a session, building it with `factory` if it is not in memory."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry["last_used"] = now
+                self._sessions.move_to_end(session_id)
+                return entry["chatbot"]
+
+        chatbot = factory()
+        REGISTRY.counter("sessions_loaded", "Conversations built or rebuilt in memory").inc()
+        with self._lock:
+            entry = self._sessions.setdefault(session_id, {"chatbot": chatbot})
+            entry["last_used"] = now
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_active:
+                self._sessions.popitem(last=False)
+                REGISTRY.counter("sessions_evicted", "Conversations dropped from memory").inc(reason="capacity")
+            return entry["chatbot"]
+
+    def put(self, session_id: str, chatbot):
+        """Replace the chatbot of a session, e.g. after switching documents."""
+        with self._lock:
+            self._sessions[session_id] = {"chatbot": chatbot, "last_used": time.monotonic()}
+            self._sessions.move_to_end(session_id)
+
+    def drop(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def drop_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Drop the conversations whose chatbot matches `predicate` and return how many there were."""
+        with self._lock:
+            session_ids = [session_id for session_id, entry in self._sessions.items() if predicate(entry["chatbot"])]
+            for session_id in session_ids:
+                del self._sessions[session_id]
+        if session_ids:
+            REGISTRY.counter("sessions_evicted", "Conversations dropped from memory").inc(
+                len(session_ids), reason="knowledge_base"
+            )
+        return len(session_ids)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """(session id, chatbot) pairs of the conversations in memory, least recently used first."""
+        with self._lock:
+            return [(session_id, entry["chatbot"]) for session_id, entry in self._sessions.items()]
+
+    def _expire(self, now: float):
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if now - entry["last_used"] <= self.idle_seconds:
+                break
+            del self._sessions[session_id]
+            REGISTRY.counter("sessions_evicted", "Conversations dropped from memory").inc(reason="idle")
+
+
+ACTIVE_SESSIONS = ActiveSessions()
+
+
+def approximate_size(obj, _seen=None) -> int:
+    """
+    Approximate the memory held by an object and everything it references, in bytes.
+
+    Follows containers and instance attributes (including pydantic fields), counting
+    every object once. Classes, modules and functions are not followed.
+    """
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen or isinstance(obj, (type, type(sys), type(approximate_size))):
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approximate_size(k, seen) + approximate_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approximate_size(item, seen) for item in obj)
+    if hasattr(obj, "__dict__"):
+        size += approximate_size(vars(obj), seen)
+    slots = getattr(type(obj), "__slots__", ())
+    for name in (slots,) if isinstance(slots, str) else slots:
+        if hasattr(obj, name):
+            size += approximate_size(getattr(obj, name), seen)
+    return size
@@ -0,0 +1,440 @@
+"""
+Scatter-gather retrieval over knowledge base shards served by separate processes.
+
+Each shard process owns the documents whose source name hashes to it, builds its own
+knowledge base from them and answers nearest-neighbour searches over HTTP. The
+ShardedKnowledgeBase client embeds the question once, sends it to every shard in
+parallel, and merges the top-k by distance from the shards that answer within the
+request deadline; missing shards make the result partial instead of failing it.
+
+Endpoints of a shard:
+    POST /search     {"question": "...", "vector": [...], "k": 4}
+    GET  /healthz
+
+Usage:
+    # one shard of four over a directory of PDFs (omit --pdf-dir for the default policies)
+    EMBEDDING_BACKEND=hashing python sharding.py --shard 0 --shards 4 --port 9100 --pdf-dir bench_corpora/synthetic
+
+    # clients: create_knowledge_base() connects to the shards listed in KB_SHARD_URLS
+    KB_SHARD_URLS=http://127.0.0.1:9100,http://127.0.0.1:9101 python server.py
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+import subprocess
+import logging
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+from metrics import REGISTRY
+from resilience import current_deadline
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SHARD_TIMEOUT_SECONDS = float(os.getenv("KB_SHARD_TIMEOUT_SECONDS", "2"))
+SHARD_FANOUT_WORKERS = int(os.getenv("KB_SHARD_FANOUT_WORKERS", "32"))
+SHARD_RECHECK_SECONDS = float(os.getenv("KB_SHARD_RECHECK_SECONDS", "5"))
+
+
+class ShardsUnavailable(RuntimeError):
+    """No shard answered a search in time."""
+
+
+def shard_for_source(source: str, shards: int) -> int:
+    """Shard that owns a source document; every chunk of a document lives on the same shard."""
+    digest = hashlib.blake2b(os.path.basename(str(source)).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def _search_knowledge_base(knowledge_base, question: str, vector: List[float], k: int):
+    search = getattr(knowledge_base, "similarity_search_with_score_for_question", None)
+    if search is not None:
+        return search(question, vector, k)
+    return knowledge_base.similarity_search_with_score_by_vector(vector, k=k)
+
+
+class ShardServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, knowledge_base, shard: int, shards: int, delay: float = 0.0):
+        self.knowledge_base = knowledge_base
+        self.shard = shard
+        self.shards = shards
+        self.delay = delay
+        super().__init__(address, ShardRequestHandler)
+
+    def info(self) -> Dict[str, Any]:
+        from knowledge_base import knowledge_base_version
+
+        if self.knowledge_base is None:
+            version, vectors = "empty", 0
+        elif hasattr(self.knowledge_base, "partition_sizes"):
+            version, vectors = knowledge_base_version(self.knowledge_base), sum(self.knowledge_base.partition_sizes().values())
+        else:
+            version, vectors = knowledge_base_version(self.knowledge_base), self.knowledge_base.index.ntotal
+        return {"status": "ok", "shard": self.shard, "shards": self.shards, "version": version, "vectors": vectors}
+
+
+class ShardRequestHandler(BaseHTTPRequestHandler):
+    server_version = "InsuranceChatbotShard/1.0"
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/healthz":
+            self._send_json(200, self.server.info())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/search":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            vector = [float(value) for value in payload["vector"]]
+            k = int(payload.get("k", 4))
+        except (KeyError, TypeError, ValueError):
+            self._send_json(400, {"error": "expected JSON with 'vector' and optional 'question' and 'k'"})
+            return
+
+        start = time.perf_counter()
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        scored = []
+        if self.server.knowledge_base is not None:
+            scored = _search_knowledge_base(self.server.knowledge_base, str(payload.get("question") or ""), vector, k)
+        self._send_json(200, {
+            "shard": self.server.shard,
+            "results": [
+                {"page_content": doc.page_content, "metadata": doc.metadata, "score": float(score)}
+                for doc, score in scored
+            ],
+            "search_ms": (time.perf_counter() - start) * 1000,
+        })
+
+    def _send_json(self, status: int, data):
+        payload = json.dumps(data, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on this shard at its deadline; the result is no longer wanted.
+            logger.debug("Client disconnected before the response was sent")
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def build_shard_knowledge_base(shard: int, shards: int, pdf_dir: str = None):
+    """
+    Build the knowledge base for the documents a shard owns.
+
+    Args:
+        shard: Index of this shard
+        shards: Total number of shards
+        pdf_dir: Directory of PDFs to shard; defaults to the default policy documents
+
+    Returns:
+        The knowledge base, or None if no document hashes to this shard
+    """
+    from ingestion import ingest_documents, ingest_partitioned_documents
+    from knowledge_base import iter_documents, iter_pdf_pages, partitioning_enabled
+    from model_backends import get_embeddings
+
+    if pdf_dir:
+        pdf_paths = sorted(
+            os.path.join(pdf_dir, name) for name in os.listdir(pdf_dir)
+            if name.endswith(".pdf") and shard_for_source(name, shards) == shard
+        )
+        documents = iter_pdf_pages(pdf_paths)
+    else:
+        documents = (
+            page for page in iter_documents()
+            if shard_for_source(page.metadata.get("source", ""), shards) == shard
+        )
+
+    ingest = ingest_partitioned_documents if partitioning_enabled() else ingest_documents
+    try:
+        return ingest(documents, get_embeddings())
+    except ValueError:
+        logger.warning(f"Shard {shard}/{shards} owns no documents")
+        return None
+
+
+class ShardedKnowledgeBase:
+    """
+    Client side of scatter-gather retrieval over shard processes.
+
+    Every search goes to all healthy shards in parallel and waits until the current
+    request deadline (see resilience.deadline_scope), capped at ``timeout`` seconds.
+    Results of the shards that answered are merged by distance. Shards that fail or miss
+    the deadline are left out, and the trace is flagged with 'partial_results'. The
+    search only fails, with ShardsUnavailable, if no shard answers.
+
+    Shards that cannot be reached when connecting, or whose search fails, are marked
+    unhealthy and skipped by searches; their health is checked again in the background
+    every ``recheck_seconds`` until they answer. Exposes the search methods of the FAISS
+    vector store the chatbot uses; documents are added to the shard processes, so there
+    is no write API.
+    """
+
+    def __init__(self, shard_urls: Iterable[str], embeddings, timeout: float = SHARD_TIMEOUT_SECONDS,
+                 recheck_seconds: float = SHARD_RECHECK_SECONDS):
+        self.shard_urls = [url.rstrip("/") for url in shard_urls]
+        self._embeddings = embeddings
+        self.timeout = timeout
+        self.recheck_seconds = recheck_seconds
+        self._executor = ThreadPoolExecutor(max_workers=SHARD_FANOUT_WORKERS, thread_name_prefix="shard-search")
+        self._lock = threading.Lock()
+        # Shard index -> time.monotonic() of its last failed health check or search.
+        self._unhealthy: Dict[int, float] = {}
+        self._rechecking = set()
+        self.shard_info = list(self._executor.map(self._check_health, range(len(self.shard_urls))))
+        self._update_version()
+        if len(self._unhealthy) == len(self.shard_urls):
+            logger.error(f"None of the {len(self.shard_urls)} shards is reachable; searches fail until one is")
+
+    def _update_version(self):
+        digest = hashlib.blake2b(digest_size=8)
+        for info in self.shard_info:
+            digest.update(f"{info['shard']}/{info['shards']}={info['version']}\0".encode("utf-8"))
+        self.version = digest.hexdigest()
+
+    def _mark_unhealthy(self, shard: int):
+        with self._lock:
+            self._unhealthy[shard] = time.monotonic()
+
+    def _check_health(self, shard: int) -> Dict[str, Any]:
+        """Shard info from /healthz, or an 'unreachable' placeholder after marking the shard unhealthy."""
+        url = self.shard_urls[shard]
+        checks = REGISTRY.counter("shard_health_checks", "Shard health checks by outcome")
+        try:
+            info = self._request(url, "/healthz", None, self.timeout)
+        except (OSError, ValueError) as e:
+            self._mark_unhealthy(shard)
+            checks.inc(shard=str(shard), outcome="unreachable")
+            logger.warning(f"Shard {shard} at {url} is unreachable: {type(e).__name__}: {str(e)}")
+            return {"status": "unreachable", "shard": shard, "shards": len(self.shard_urls),
+                    "version": "unreachable", "vectors": 0, "url": url}
+        with self._lock:
+            self._unhealthy.pop(shard, None)
+        checks.inc(shard=str(shard), outcome="ok")
+        return info
+
+    def _recheck(self, shard: int):
+        try:
+            info = self._check_health(shard)
+            if info["status"] == "ok":
+                with self._lock:
+                    self.shard_info[shard] = info
+                    self._update_version()
+                logger.info(f"Shard {shard} at {self.shard_urls[shard]} is reachable again")
+        finally:
+            with self._lock:
+                self._rechecking.discard(shard)
+
+    def _healthy_shards(self) -> List[int]:
+        """Shards to search now; starts background health checks of unhealthy shards that are due one."""
+        now = time.monotonic()
+        with self._lock:
+            due = [shard for shard, failed in self._unhealthy.items()
+                   if now - failed >= self.recheck_seconds and shard not in self._rechecking]
+            self._rechecking.update(due)
+            healthy = [shard for shard in range(len(self.shard_urls)) if shard not in self._unhealthy]
+        for shard in due:
+            self._executor.submit(self._recheck, shard)
+        return healthy
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    @staticmethod
+    def _request(url: str, path: str, payload: Optional[Dict[str, Any]], timeout: float) -> Dict[str, Any]:
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(url + path, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+
+    def similarity_search_with_score_for_question(self, question: str, query_vector: List[float], k: int = 4,
+                                                  trace=None, **kwargs: Any):
+        """
+        Scatter an embedded question to every shard and merge the (document, distance) pairs.
+
+        Args:
+            question: Question text, passed on to shards that route by it
+            query_vector: Embedding of the question
+            k: Number of chunks to return
+            trace: Optional Trace receiving per-shard latencies and the partial-result flag
+        """
+        from langchain_core.documents import Document
+
+        deadline = current_deadline()
+        budget = min(self.timeout, deadline.remaining()) if deadline else self.timeout
+        payload = {"question": question, "vector": [float(value) for value in query_vector], "k": k}
+        started = time.perf_counter()
+
+        def search(url):
+            response = self._request(url, "/search", payload, budget)
+            return response, time.perf_counter() - started
+
+        healthy = self._healthy_shards()
+        futures = {self._executor.submit(search, self.shard_urls[shard]): shard for shard in healthy}
+        done, _ = wait(futures, timeout=budget) if futures else (set(), set())
+
+        searches = REGISTRY.counter("shard_searches", "Shard searches by outcome")
+        latency = REGISTRY.histogram("shard_search_seconds", "Shard search latency as seen by the client")
+        scored, shard_ms = [], {}
+        missing = [shard for shard in range(len(self.shard_urls)) if shard not in futures.values()]
+        for shard in missing:
+            searches.inc(shard=str(shard), outcome="skipped")
+        for future, shard in sorted(futures.items(), key=lambda item: item[1]):
+            if future not in done:
+                missing.append(shard)
+                searches.inc(shard=str(shard), outcome="timeout")
+                continue
+            if future.exception() is not None:
+                missing.append(shard)
+                searches.inc(shard=str(shard), outcome="error")
+                # A slow shard is waited for again next time; one that cannot be reached is skipped.
+                if not isinstance(getattr(future.exception(), "reason", future.exception()), TimeoutError):
+                    self._mark_unhealthy(shard)
+                logger.warning(f"Shard {shard} search failed: {type(future.exception()).__name__}: {future.exception()}")
+                continue
+            response, seconds = future.result()
+            searches.inc(shard=str(shard), outcome="ok")
+            latency.observe(seconds, shard=str(shard))
+            shard_ms[str(shard)] = round(seconds * 1000, 3)
+            scored.extend(
+                (Document(page_content=item["page_content"], metadata=item["metadata"]), item["score"])
+                for item in response["results"]
+            )
+
+        missing.sort()
+        if trace is not None:
+            trace.set_flag("shard_ms", shard_ms)
+            trace.set_flag("partial_results", bool(missing))
+            if missing:
+                trace.set_flag("missing_shards", missing)
+        if len(missing) == len(self.shard_urls):
+            raise ShardsUnavailable(f"None of the {len(self.shard_urls)} shards answered within {budget:.2f}s")
+
+        scored.sort(key=lambda item: item[1])
+        return scored[:k]
+
+    def similarity_search_for_question(self, question: str, query_vector: List[float], k: int = 4,
+                                       trace=None, **kwargs: Any):
+        return [doc for doc, _ in self.similarity_search_with_score_for_question(question, query_vector, k, trace)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any):
+        return self.similarity_search_for_question("", embedding, k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any):
+        return self.similarity_search_for_question(query, self._embeddings.embed_query(query), k)
+
+
+def connect_shards(shard_urls: Iterable[str] = None, embeddings=None) -> ShardedKnowledgeBase:
+    """Connect to running shards, by default those listed in KB_SHARD_URLS (comma-separated)."""
+    from model_backends import get_embeddings
+
+    if shard_urls is None:
+        shard_urls = [url.strip() for url in os.getenv("KB_SHARD_URLS", "").split(",") if url.strip()]
+    if not shard_urls:
+        raise ValueError("No shard URLs given; set KB_SHARD_URLS.")
+    return ShardedKnowledgeBase(shard_urls, embeddings or get_embeddings())
+
+
+def start_local_shards(shards: int, base_port: int = 9100, pdf_dir: str = None, delays_ms: Dict[int, float] = None,
+                       startup_timeout: float = 600.0, only: Iterable[int] = None):
+    """
+    Start shard processes on this machine and wait until they serve.
+
+    Args:
+        shards: Number of shards the documents are split into
+        base_port: Port of shard 0; shard i listens on base_port + i
+        pdf_dir: Directory of PDFs to shard; defaults to the default policy documents
+        delays_ms: Artificial search delay per shard index, for testing deadlines
+        startup_timeout: Seconds to wait for every shard to finish indexing
+        only: Start just these shard indexes instead of all of them
+
+    Returns:
+        A (processes, urls) tuple
+    """
+    processes, urls = [], []
+    for shard in (range(shards) if only is None else only):
+        command = [sys.executable, os.path.abspath(__file__), "--shard", str(shard), "--shards", str(shards),
+                   "--host", "127.0.0.1", "--port", str(base_port + shard)]
+        if pdf_dir:
+            command += ["--pdf-dir", pdf_dir]
+        if delays_ms and shard in delays_ms:
+            command += ["--delay-ms", str(delays_ms[shard])]
+        processes.append(subprocess.Popen(command))
+        urls.append(f"http://127.0.0.1:{base_port + shard}")
+
+    deadline = time.monotonic() + startup_timeout
+    pending = set(urls)
+    while pending:
+        if time.monotonic() > deadline:
+            stop_local_shards(processes)
+            raise TimeoutError(f"Shards did not start within {startup_timeout:.0f}s: {sorted(pending)}")
+        for process in processes:
+            if process.poll() is not None:
+                stop_local_shards(processes)
+                raise RuntimeError(f"Shard process exited with code {process.returncode}")
+        for url in list(pending):
+            try:
+                ShardedKnowledgeBase._request(url, "/healthz", None, 1.0)
+                pending.discard(url)
+            except OSError:
+                pass
+        time.sleep(0.2)
+    return processes, urls
+
+
+def stop_local_shards(processes):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shard", type=int, required=True)
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--pdf-dir")
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Artificial delay added to every search")
+    args = parser.parse_args()
+
+    knowledge_base = build_shard_knowledge_base(args.shard, args.shards, args.pdf_dir)
+    server = ShardServer((args.host, args.port), knowledge_base, args.shard, args.shards, args.delay_ms / 1000.0)
+    info = server.info()
+    logger.info(f"Shard {args.shard}/{args.shards} serving {info['vectors']} vectors on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import re
+import threading
+import logging
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from metrics import REGISTRY
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Canonical form of a question: lower case, single spaces, no trailing punctuation."""
+    return _WHITESPACE.sub(" ", question).strip().rstrip("?!. ").lower()
+
+
+def request_key(question: str, knowledge_base) -> Tuple[str, str]:
+    """Key under which identical context-free questions against one knowledge base version are shared."""
+    from knowledge_base import knowledge_base_version
+
+    return normalize_question(question), knowledge_base_version(knowledge_base)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that arrive
+    with the same key while it is running (followers) block until it finishes and
+    receive the same result, or the same exception. Once the call completes the key
+    is forgotten, so this is coalescing of in-flight work, not a cache.
+    """
+
+    def __init__(self, name: str = "request"):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run `fn` once for all concurrent callers with `key`.
+
+        Returns:
+            A (result, shared) tuple; `shared` is True for followers that reused the leader's result
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        calls = REGISTRY.counter("singleflight_calls", "Calls through the single-flight layer by role")
+        if not leader:
+            calls.inc(group=self.name, role="follower")
+            REGISTRY.counter("singleflight_saved_calls", "Executions avoided by joining an in-flight call").inc(
+                group=self.name
+            )
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        calls.inc(group=self.name, role="leader")
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.followers:
+                logger.info(f"Single-flight '{self.name}' shared one call with {call.followers} waiting callers")
+        return call.result, False
+
+
+REQUEST_FLIGHTS = SingleFlight("request")
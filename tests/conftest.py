@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Tests run offline: hashed embeddings and the fake chat model, no API key needed.
+os.environ.setdefault("EMBEDDING_BACKEND", "hashing")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("CHAIN_VERBOSE", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
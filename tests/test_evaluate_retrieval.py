@@ -0,0 +1,23 @@
+import pytest
+from langchain_core.documents import Document
+
+from evaluate_retrieval import evaluate
+
+CHUNKS = [
+    Document(page_content="Collision coverage pays for damage to your vehicle.", metadata={"source": "auto_policy.pdf"}),
+    Document(page_content="Term life insurance covers a fixed period.", metadata={"source": "life_policy.pdf"}),
+]
+QUESTION = {"question": "What does collision coverage pay for?", "policy_type": "auto",
+            "relevant_phrases": ["collision"]}
+
+
+def test_evaluate_reports_recall_and_latency():
+    result = evaluate(lambda query, k: CHUNKS[:k], CHUNKS, [QUESTION], 1)
+
+    assert result["recall_at_k"] == 1.0 and result["mrr"] == 1.0
+    assert result["p50_ms"] >= 0 and result["p95_ms"] >= 0
+
+
+def test_evaluate_rejects_an_empty_question_set():
+    with pytest.raises(ValueError, match="No questions"):
+        evaluate(lambda query, k: CHUNKS[:k], CHUNKS, [], 4)
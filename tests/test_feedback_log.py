@@ -0,0 +1,53 @@
+import pytest
+
+from feedback_log import apply_feedback_to_cache
+from insurance_chatbot import ERROR_RESPONSE
+from knowledge_base import create_knowledge_base, knowledge_base_version
+from response_cache import ResponseCache
+
+QUESTION = "What does collision coverage pay for?"
+ANSWER = "Collision coverage pays for damage to your vehicle from an accident."
+
+
+@pytest.fixture(scope="module")
+def knowledge_base():
+    return create_knowledge_base(custom_text=ANSWER, partitioned=False)
+
+
+def rating(knowledge_base, answer=ANSWER, flags=None):
+    return {
+        "question": QUESTION,
+        "answer": answer,
+        "kb_version": knowledge_base_version(knowledge_base),
+        "first_turn": True,
+        "flags": flags or {},
+        "verdict": "positive",
+    }
+
+
+def test_helpful_answer_is_pinned(knowledge_base):
+    cache = ResponseCache()
+
+    assert apply_feedback_to_cache(cache, rating(knowledge_base), knowledge_base, ANSWER) == "pinned"
+    assert cache.contains(QUESTION, knowledge_base)
+
+
+@pytest.mark.parametrize("answer, flags", [
+    (ANSWER, {"degraded": True, "degraded_reason": "BackendError"}),
+    (ANSWER, {"no_information": True}),
+    (ERROR_RESPONSE, {}),
+])
+def test_degraded_answers_are_not_pinned(knowledge_base, answer, flags):
+    cache = ResponseCache()
+
+    assert apply_feedback_to_cache(cache, rating(knowledge_base, answer, flags), knowledge_base, answer) is None
+    assert not cache.contains(QUESTION, knowledge_base)
+
+
+def test_degraded_answer_does_not_pin_a_cached_one(knowledge_base):
+    cache = ResponseCache()
+    cache.put(QUESTION, knowledge_base, ANSWER, ANSWER, [])
+
+    entry = rating(knowledge_base, flags={"degraded": True})
+    assert apply_feedback_to_cache(cache, entry, knowledge_base, ANSWER) is None
+    assert cache.get(QUESTION, knowledge_base)["pinned"] is False
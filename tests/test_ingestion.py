@@ -0,0 +1,27 @@
+from langchain_core.documents import Document
+
+import ingestion
+from ingestion import ingest_documents
+from model_backends import get_embeddings
+
+
+def _pages(count):
+    return [Document(page_content=f"Policy clause {i}: coverage item {i} is limited to {i * 100} dollars.",
+                     metadata={"source": "policy.pdf", "page": i}) for i in range(count)]
+
+
+def test_ivf_is_trained_on_more_than_the_first_batch():
+    store = ingest_documents(_pages(200), get_embeddings(), index_type="ivf", batch_size=8)
+
+    assert store.index.ntotal == 200
+    assert store.index.nlist > 1
+    assert store.similarity_search("coverage item 42", k=1)
+
+
+def test_ivf_training_sample_is_bounded(monkeypatch):
+    monkeypatch.setattr(ingestion, "IVF_TRAINING_SAMPLE", 80)
+
+    store = ingest_documents(_pages(200), get_embeddings(), index_type="ivf", batch_size=8)
+
+    assert store.index.ntotal == 200
+    assert store.index.nlist == 2
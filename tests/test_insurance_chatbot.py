@@ -0,0 +1,44 @@
+import gc
+import weakref
+
+from insurance_chatbot import InsuranceChatbot
+from knowledge_base import create_knowledge_base
+
+AUTO_POLICY = "Collision coverage pays for damage to your vehicle from an accident. The deductible is 500 dollars."
+HOME_POLICY = "Home insurance covers damage to your house from fire and storms. Claims are filed online."
+
+
+def test_swapped_out_knowledge_base_is_released():
+    old = create_knowledge_base(custom_text=AUTO_POLICY, partitioned=False)
+    chatbot = InsuranceChatbot(old, verbose=False, single_flight=None, response_cache=None)
+    assert chatbot.get_response_details("What does collision coverage pay for?")["answer"]
+
+    collected = weakref.ref(old)
+    chatbot.index.swap(create_knowledge_base(custom_text=HOME_POLICY, partitioned=False))
+    del old
+    gc.collect()
+
+    assert collected() is None
+    details = chatbot.get_response_details("How do I file a claim?")
+    assert any("Claims are filed online" in doc.page_content for doc in details["source_documents"])
+
+
+def test_stream_past_the_deadline_ends_with_the_partial_answer():
+    from offline_models import FakeChatModel
+    from resilience import deadline_scope
+    from resilient_model import ResilientChatModel
+
+    policy = "\n".join(f"Collision coverage pays for damage to your vehicle in case {i}." for i in range(3))
+    llm = ResilientChatModel(primary=FakeChatModel(tokens_per_second=20), breaker_name="test-partial-answer",
+                             hedge=False)
+    chatbot = InsuranceChatbot(create_knowledge_base(custom_text=policy, partitioned=False), verbose=False, llm=llm,
+                               single_flight=None, response_cache=None)
+
+    with deadline_scope(0.5):
+        events = list(chatbot.stream_response("What does collision coverage pay for?"))
+
+    streamed = "".join(event["text"] for event in events if event["type"] == "token")
+    done = events[-1]
+    assert streamed
+    assert done["answer"] == streamed
+    assert done["trace"]["flags"]["degraded"] and done["trace"]["flags"]["partial_answer"]
@@ -0,0 +1,76 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from kb_snapshot import _stored_vectors, load_snapshot, save_snapshot
+from knowledge_base import create_knowledge_base, knowledge_base_version
+from model_backends import get_embeddings
+from retrieval import indexed_documents
+
+QUESTIONS = ["What does collision coverage pay for?", "How do I file a home insurance claim?"]
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["flat", "partitioned"])
+def knowledge_base(request):
+    return create_knowledge_base(partitioned=request.param)
+
+
+def stores(knowledge_base):
+    return getattr(knowledge_base, "partitions", None) or {"": knowledge_base}
+
+
+@pytest.mark.parametrize("compression", [None, "zlib", "lzma"])
+def test_round_trip(knowledge_base, tmp_path, compression):
+    path = str(tmp_path / "snapshot")
+    save_snapshot(knowledge_base, path, compression)
+    loaded = load_snapshot(path, get_embeddings())
+
+    assert knowledge_base_version(loaded) == knowledge_base_version(knowledge_base)
+    assert sorted(stores(loaded)) == sorted(stores(knowledge_base))
+    for name, store in stores(knowledge_base).items():
+        loaded_store = stores(loaded)[name]
+        documents, loaded_documents = indexed_documents(store), indexed_documents(loaded_store)
+        assert [doc.page_content for doc in loaded_documents] == [doc.page_content for doc in documents]
+        assert [doc.metadata for doc in loaded_documents] == [doc.metadata for doc in documents]
+        assert len(loaded_store.docstore._dict) == len(store.docstore._dict)
+        assert np.array_equal(_stored_vectors(loaded_store.index), _stored_vectors(store.index))
+    for question in QUESTIONS:
+        assert [doc.page_content for doc in loaded.similarity_search(question, k=4)] == \
+               [doc.page_content for doc in knowledge_base.similarity_search(question, k=4)]
+
+
+def snapshot_columns(path):
+    """Column files of a snapshot, including those of its partitions."""
+    return [os.path.join(root, name) for root, _, names in os.walk(path) for name in names if name.endswith(".bin")]
+
+
+def test_truncated_column_is_rejected(knowledge_base, tmp_path):
+    path = str(tmp_path / "snapshot")
+    save_snapshot(knowledge_base, path)
+    column = next(name for name in snapshot_columns(path) if name.endswith("embeddings.bin"))
+    with open(column, "r+b") as f:
+        f.truncate(os.path.getsize(column) - 4)
+
+    with pytest.raises(ValueError, match="bytes"):
+        load_snapshot(path, get_embeddings())
+
+
+def test_wrong_format_version_is_rejected(knowledge_base, tmp_path):
+    path = str(tmp_path / "snapshot")
+    save_snapshot(knowledge_base, path)
+    manifest_path = os.path.join(path, "manifest.json")
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest["format_version"] += 1
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    with pytest.raises(ValueError, match="snapshot"):
+        load_snapshot(path, get_embeddings())
+
+
+def test_missing_snapshot_is_rejected(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_snapshot(str(tmp_path / "missing"), get_embeddings())
@@ -0,0 +1,46 @@
+import gc
+import weakref
+
+from insurance_chatbot import InsuranceChatbot
+from knowledge_base import create_knowledge_base
+from memory_accounting import KnowledgeBaseCache, _drop_sessions_using
+from session_store import ACTIVE_SESSIONS
+
+AUTO_POLICY = "Collision coverage pays for damage to your vehicle from an accident. The deductible is 500 dollars."
+HOME_POLICY = "Home insurance covers damage to your house from fire and storms. Claims are filed online."
+
+
+def test_evicted_knowledge_base_is_released():
+    cache = KnowledgeBaseCache(budget_bytes=1, on_evict=_drop_sessions_using)
+    knowledge_base = cache.get("auto", lambda: create_knowledge_base(custom_text=AUTO_POLICY, partitioned=False))
+    chatbot = InsuranceChatbot(knowledge_base, verbose=False, single_flight=None, response_cache=None)
+    assert chatbot.get_response_details("What does collision coverage pay for?")["answer"]
+    ACTIVE_SESSIONS.put("test-evicted-session", chatbot)
+    collected = weakref.ref(knowledge_base)
+    del knowledge_base, chatbot
+
+    cache.get("home", lambda: create_knowledge_base(custom_text=HOME_POLICY, partitioned=False))
+    gc.collect()
+
+    assert "auto" not in cache
+    assert "test-evicted-session" not in ACTIVE_SESSIONS
+    assert collected() is None
+
+
+def test_evicted_knowledge_base_is_released_by_sessions_that_switched_away():
+    cache = KnowledgeBaseCache(budget_bytes=1, on_evict=_drop_sessions_using)
+    knowledge_base = cache.get("auto-switched", lambda: create_knowledge_base(custom_text=AUTO_POLICY, partitioned=False))
+    chatbot = InsuranceChatbot(knowledge_base, verbose=False, single_flight=None, response_cache=None)
+    assert chatbot.get_response_details("What does collision coverage pay for?")["answer"]
+    ACTIVE_SESSIONS.put("test-switched-session", chatbot)
+    collected = weakref.ref(knowledge_base)
+    del knowledge_base
+
+    chatbot.index.swap(create_knowledge_base(custom_text=HOME_POLICY, partitioned=False))
+    cache.get("home-switched", lambda: create_knowledge_base(custom_text=HOME_POLICY, partitioned=False))
+    gc.collect()
+
+    assert "auto-switched" not in cache
+    assert "test-switched-session" in ACTIVE_SESSIONS
+    assert collected() is None
+    ACTIVE_SESSIONS.drop("test-switched-session")
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from offline_models import FakeChatModel
+from resilience import BackendError, DeadlineExceeded, deadline_scope
+from resilient_model import ResilientChatModel
+
+PROMPT = "Answer the question using the context.\n\nContext:\nThe deductible is 500 dollars per claim.\n\nQuestion: What is the deductible?"
+
+
+def open_breaker(model):
+    breaker = model.breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    breaker.reset_timeout = 0.0
+    return breaker
+
+
+def test_stream_closed_early_ends_half_open_trial():
+    model = ResilientChatModel(primary=FakeChatModel(), breaker_name="test-stream-closed-early", hedge=False)
+    breaker = open_breaker(model)
+
+    stream = model.stream(PROMPT)
+    next(stream)
+    assert breaker.state == breaker.HALF_OPEN
+    stream.close()
+
+    assert breaker.state == breaker.CLOSED
+    assert breaker.allow()
+    assert breaker.allow()
+
+
+def test_stream_read_to_the_end_closes_breaker():
+    model = ResilientChatModel(primary=FakeChatModel(), breaker_name="test-stream-complete", hedge=False)
+    breaker = open_breaker(model)
+
+    assert "".join(chunk.content for chunk in model.stream(PROMPT))
+    assert breaker.state == breaker.CLOSED
+
+
+def test_slow_stream_is_hedged_on_time_to_first_token():
+    model = ResilientChatModel(primary=FakeChatModel(ttft_ms=3000), fallback=FakeChatModel(),
+                               breaker_name="test-stream-hedged")
+    for _ in range(20):
+        model._first_token.observe(0.05)
+
+    start = time.perf_counter()
+    answer = "".join(chunk.content for chunk in model.stream(PROMPT))
+
+    assert answer
+    assert time.perf_counter() - start < 1.5
+    assert model.breaker.state == model.breaker.CLOSED
+
+
+def test_stream_failing_before_first_token_is_retried_on_fallback():
+    model = ResilientChatModel(primary=FakeChatModel(failure_rate=1.0), fallback=FakeChatModel(),
+                               breaker_name="test-stream-retried")
+
+    assert "".join(chunk.content for chunk in model.stream(PROMPT))
+
+
+def test_stream_fails_when_every_attempt_fails():
+    model = ResilientChatModel(primary=FakeChatModel(failure_rate=1.0), fallback=FakeChatModel(failure_rate=1.0),
+                               breaker_name="test-stream-failed")
+
+    with pytest.raises(BackendError):
+        list(model.stream(PROMPT))
+
+
+def test_stream_read_slowly_stops_at_the_deadline():
+    # The model produces every chunk at once, so chunks are always waiting to be read.
+    model = ResilientChatModel(primary=FakeChatModel(), breaker_name="test-stream-deadline", hedge=False)
+    prompt = "Answer the question using the context.\n\nContext:\n" + "\n".join(
+        f"The deductible is {i}00 dollars per claim for collision damage." for i in range(3)
+    ) + "\n\nQuestion: What is the deductible?"
+    chunks = []
+
+    start = time.perf_counter()
+    with deadline_scope(0.3), pytest.raises(DeadlineExceeded):
+        for chunk in model.stream(prompt):
+            chunks.append(chunk)
+            time.sleep(0.05)
+
+    assert chunks
+    assert time.perf_counter() - start < 0.6
@@ -0,0 +1,70 @@
+import pytest
+
+import response_cache
+from knowledge_base import create_knowledge_base
+from response_cache import ResponseCache, ensure_faq_answers
+
+QUESTIONS = ["What does collision coverage pay for?", "What is the deductible?", "Who can file a claim?"]
+
+
+@pytest.fixture
+def warm_ups(monkeypatch):
+    """Record warm-ups instead of answering; the last question can never be cached, as during an outage."""
+    calls = []
+
+    def warm_faq_answers(knowledge_base, questions, cache, llm):
+        calls.append(list(questions))
+        for question in questions[:-1] if QUESTIONS[-1] in questions else questions:
+            cache.put(question, knowledge_base, "answer", "answer", [])
+        return len(questions)
+
+    monkeypatch.setattr(response_cache, "warm_faq_answers", warm_faq_answers)
+    return calls
+
+
+def test_finished_warm_up_is_not_repeated_until_the_retry_interval(warm_ups):
+    knowledge_base = create_knowledge_base(custom_text="Collision coverage pays for accident damage.", partitioned=False)
+    cache = ResponseCache()
+
+    ensure_faq_answers(knowledge_base, QUESTIONS, cache, retry_seconds=60).join()
+    for _ in range(5):
+        assert ensure_faq_answers(knowledge_base, QUESTIONS, cache, retry_seconds=60) is None
+
+    assert warm_ups == [QUESTIONS]
+
+
+def test_retry_warms_only_missing_questions(warm_ups):
+    knowledge_base = create_knowledge_base(custom_text="Home insurance covers fire damage.", partitioned=False)
+    cache = ResponseCache()
+
+    ensure_faq_answers(knowledge_base, QUESTIONS, cache, retry_seconds=0).join()
+    ensure_faq_answers(knowledge_base, QUESTIONS, cache, retry_seconds=0).join()
+
+    assert warm_ups == [QUESTIONS, QUESTIONS[-1:]]
+
+
+def test_remembered_warm_ups_are_bounded(warm_ups, monkeypatch):
+    monkeypatch.setattr(response_cache, "MAX_WARMED_VERSIONS", 2)
+    monkeypatch.setattr(response_cache, "_warmed", response_cache.OrderedDict())
+    cache = ResponseCache()
+    for i in range(4):
+        knowledge_base = create_knowledge_base(custom_text=f"Policy number {i} covers theft.", partitioned=False)
+        ensure_faq_answers(knowledge_base, QUESTIONS, cache, retry_seconds=60).join()
+
+    assert len(response_cache._warmed) == 2
+
+
+def test_evicted_knowledge_base_is_forgotten(warm_ups):
+    from memory_accounting import KnowledgeBaseCache, _evicted
+
+    knowledge_bases = KnowledgeBaseCache(budget_bytes=1, on_evict=_evicted)
+    knowledge_base = knowledge_bases.get("flood", lambda: create_knowledge_base(
+        custom_text="Flood insurance covers water damage.", partitioned=False))
+    ensure_faq_answers(knowledge_base, QUESTIONS, ResponseCache(), retry_seconds=60).join()
+    version = knowledge_base.version
+    assert version in response_cache._warmed
+
+    knowledge_bases.get("quake", lambda: create_knowledge_base(
+        custom_text="Earthquake insurance covers shaking damage.", partitioned=False))
+
+    assert version not in response_cache._warmed
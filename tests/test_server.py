@@ -0,0 +1,74 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from knowledge_base import create_knowledge_base
+from offline_models import FakeChatModel
+from resilient_model import ResilientChatModel
+from server import ChatbotServer, SessionManager, WorkerPool, _answer
+
+POLICY = "\n".join([
+    "Collision coverage pays for damage to your vehicle from an accident with another car.",
+    "Collision coverage pays for repairs to your vehicle after hitting an object such as a fence.",
+    "Collision coverage pays regardless of who caused the accident, minus your deductible.",
+])
+QUESTION = "What does collision coverage pay for?"
+
+
+@pytest.fixture
+def server():
+    knowledge_base = create_knowledge_base(custom_text=POLICY, partitioned=False)
+    # About 50 tokens at 5 tokens per second: the answer takes ~10s if it is not cancelled.
+    llm = ResilientChatModel(primary=FakeChatModel(tokens_per_second=5), hedge=False, breaker_name="test-server")
+    server = ChatbotServer(("127.0.0.1", 0), SessionManager(knowledge_base, llm), WorkerPool(workers=1, queue_size=0),
+                           request_timeout=1.0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post_message(server, session_id, stream):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.request("POST", f"/v1/sessions/{session_id}/messages",
+                       json.dumps({"message": QUESTION, "stream": stream}))
+    return connection, connection.getresponse()
+
+
+def wait_idle(pool, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while pool.in_flight and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return pool.in_flight == 0
+
+
+def test_disconnected_stream_frees_its_worker(server):
+    connection, response = post_message(server, "disconnecting", stream=True)
+    assert response.status == 200
+    while not response.readline().startswith(b"event: token"):
+        pass
+    response.close()
+    connection.close()
+
+    assert wait_idle(server.pool, timeout=1.0)
+
+
+def test_generation_stops_at_the_request_deadline(server):
+    start = time.monotonic()
+    connection, response = post_message(server, "deadline", stream=False)
+    assert response.status in (200, 504)
+    connection.close()
+
+    assert wait_idle(server.pool)
+    assert time.monotonic() - start < 3.0
+
+
+def test_request_abandoned_while_queued_is_skipped(server):
+    cancelled = threading.Event()
+    cancelled.set()
+
+    assert _answer(server.sessions, "abandoned", QUESTION, cancelled, time.monotonic() + 10) is None
+    assert len(server.sessions) == 0
@@ -0,0 +1,71 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from knowledge_base import create_knowledge_base
+from metrics import Trace
+from model_backends import get_embeddings
+from sharding import ShardedKnowledgeBase, ShardServer, ShardsUnavailable
+
+AUTO_POLICY = "Collision coverage pays for damage to your vehicle from an accident."
+HOME_POLICY = "Home insurance covers damage to your house from fire and storms."
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def start_shard():
+    servers = []
+
+    def start(text, shard, shards, port=None):
+        knowledge_base = create_knowledge_base(custom_text=text, partitioned=False)
+        server = ShardServer(("127.0.0.1", port or free_port()), knowledge_base, shard, shards)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def search(knowledge_base, question="What does collision coverage pay for?"):
+    trace = Trace("test")
+    embeddings = get_embeddings()
+    results = knowledge_base.similarity_search_for_question(question, embeddings.embed_query(question), 4, trace)
+    return results, trace.flags
+
+
+def test_unreachable_shard_is_skipped_until_it_comes_back(start_shard):
+    down_port = free_port()
+    sharded = ShardedKnowledgeBase([start_shard(AUTO_POLICY, 0, 2), f"http://127.0.0.1:{down_port}"],
+                                   get_embeddings(), timeout=1.0, recheck_seconds=0.0)
+    assert [info["status"] for info in sharded.shard_info] == ["ok", "unreachable"]
+    version = sharded.version
+
+    results, flags = search(sharded)
+    assert results and flags["partial_results"] and flags["missing_shards"] == [1]
+
+    start_shard(HOME_POLICY, 1, 2, port=down_port)
+    for _ in range(50):
+        results, flags = search(sharded)
+        if not flags["partial_results"]:
+            break
+        time.sleep(0.05)
+    assert not flags["partial_results"]
+    assert {doc.page_content for doc in results} == {AUTO_POLICY, HOME_POLICY}
+    assert sharded.version != version
+
+
+def test_search_fails_only_when_no_shard_answers():
+    sharded = ShardedKnowledgeBase([f"http://127.0.0.1:{free_port()}"], get_embeddings(), timeout=1.0)
+
+    with pytest.raises(ShardsUnavailable):
+        search(sharded)
@@ -1,92 +1,151 @@
+import time
+from functools import lru_cache
 import streamlit as st
 from typing import List, Dict, Any
 
-def display_chat_history(chat_history: List[Dict[str, Any]]):
+HISTORY_WINDOW = 20
+TYPING_FRAMES = 30
+TYPING_FRAME_SECONDS = 0.02
+FEEDBACK_PROMPT_HTML = "<span style='color:#777; font-size:0.8rem;'>Was this response helpful?</span>"
+
+
+@lru_cache(maxsize=2048)
+def render_message_html(role: str, content: str) -> str:
     """
-    Display the chat history in a visually appealing format with feedback buttons.
+    Build the HTML for a chat bubble once; reruns reuse the cached string.
 
     Args:
-        chat_history: List of message dictionaries with 'role' and 'content' keys
+        role: "user" or "assistant"
+        content: Message text
+
+    Returns:
+        HTML markup for the message
+    """
+    css_class = "user-message" if role == "user" else "assistant-message"
+    return f"""<div class="{css_class}">{content}</div>"""
+
+
+def _type_out(content: str):
+    """
+    Reveal a freshly generated answer in a bounded number of word-aligned frames.
+    """
+    words = content.split(" ")
+    step = max(1, len(words) // TYPING_FRAMES)
+    typing_placeholder = st.empty()
+    for end in range(step, len(words) + step, step):
+        displayed_text = " ".join(words[:end])
+        typing_placeholder.markdown(
+            f"""<div class="assistant-message typing-effect">{displayed_text}</div>""",
+            unsafe_allow_html=True
+        )
+        if end < len(words):
+            time.sleep(TYPING_FRAME_SECONDS)
+    typing_placeholder.markdown(render_message_html("assistant", content), unsafe_allow_html=True)
+
+
+def display_chat_history(chat_history: List[Dict[str, Any]], hidden: int = 0, feedback: Dict[int, str] = None,
+                         window: int = HISTORY_WINDOW, knowledge_base=None):
+    """
+    Display the most recent messages of the chat history with feedback buttons.
+
+    Only the last messages are loaded from the session store and rendered; a "load
+    earlier" button extends the window on demand. Message HTML is cached, and only
+    a newly generated answer gets the typing effect.
+
+    Args:
+        chat_history: Stored messages, oldest first, with 'seq', 'role' and 'content' keys
+        hidden: Number of older messages that were not loaded
+        feedback: Verdicts already given, by message sequence number
+        window: Number of messages added to the window by "load earlier"
+        knowledge_base: Knowledge base the answers came from, passed on with feedback
     """
     if not chat_history:
         return
+
+    feedback = feedback or {}
+    if "history_window" not in st.session_state:
+        st.session_state.history_window = window
+    if "typed_until" not in st.session_state:
+        st.session_state.typed_until = -1
     
     chat_container = st.container()
     
     with chat_container:
-        for idx, message in enumerate(chat_history):
+        if hidden > 0:
+            if st.button(f"Load earlier messages ({hidden} hidden)", key="load_earlier_messages"):
+                st.session_state.history_window += window
+                st.rerun()
+
+        for message in chat_history:
+            seq = message["seq"]
             role = message["role"]
             content = message["content"]
             
             if role == "user":
                 with st.chat_message("user", avatar="👤"):
-                    st.markdown(f"""<div class="user-message">{content}</div>""", unsafe_allow_html=True)
+                    st.markdown(render_message_html("user", content), unsafe_allow_html=True)
             
             elif role == "assistant":
-                is_new_message = (idx == len(chat_history) - 1 and 
-                                role == "assistant" and 
-                                "displayed_messages" in st.session_state and
-                                idx not in st.session_state.displayed_messages)
+                is_new_message = seq > st.session_state.typed_until
                 
                 with st.chat_message("assistant", avatar="🤖"):
                     if is_new_message:
-                        typing_placeholder = st.empty()
-                        displayed_text = ""
-                        for i in range(len(content) + 1):
-                            displayed_text = content[:i]
-                            typing_placeholder.markdown(
-                                f"""<div class="assistant-message typing-effect">{displayed_text}</div>""", 
-                                unsafe_allow_html=True
-                            )
-                            if i < len(content):
-                                if len(content) > 500:
-                                    import time
-                                    time.sleep(0.001)
-                                elif len(content) > 200:
-                                    import time
-                                    time.sleep(0.005)
-                                else:
-                                    import time
-                                    time.sleep(0.01)
-                        
-                        if "displayed_messages" not in st.session_state:
-                            st.session_state.displayed_messages = set()
-                        st.session_state.displayed_messages.add(idx)
+                        _type_out(content)
+                        st.session_state.typed_until = seq
                     else:
-                        st.markdown(f"""<div class="assistant-message">{content}</div>""", unsafe_allow_html=True)
+                        st.markdown(render_message_html("assistant", content), unsafe_allow_html=True)
                     
-                    if "feedback_given" in st.session_state and idx not in st.session_state.feedback_given:
+                    if seq not in feedback:
                         feedback_container = st.container()
                         with feedback_container:
                             col1, col2, col3 = st.columns([1, 1, 10])
                             with col1:
-                                if st.button("👍", key=f"thumbs_up_{idx}"):
-                                    give_feedback(idx, "positive")
+                                st.button("👍", key=f"thumbs_up_{seq}", on_click=give_feedback,
+                                          args=(seq, "positive", knowledge_base))
                             with col2:
-                                if st.button("👎", key=f"thumbs_down_{idx}"):
-                                    give_feedback(idx, "negative")
+                                st.button("👎", key=f"thumbs_down_{seq}", on_click=give_feedback,
+                                          args=(seq, "negative", knowledge_base))
                             with col3:
-                                st.markdown("<span style='color:#777; font-size:0.8rem;'>Was this response helpful?</span>", unsafe_allow_html=True)
+                                st.markdown(FEEDBACK_PROMPT_HTML, unsafe_allow_html=True)
 
-def give_feedback(msg_idx, feedback_type):
+def give_feedback(msg_seq, feedback_type, knowledge_base=None):
     """
     Process user feedback on chatbot responses.
 
+    Runs as the button callback, before the rerun the click triggers, so the rerun
+    already shows the answer as rated. The rating is queued for the feedback log
+    together with the question, answer and sources; nothing here waits for the disk.
+
     Args:
-        msg_idx: Index of the message in chat history
+        msg_seq: Sequence number of the answer in the stored conversation
         feedback_type: Type of feedback ("positive" or "negative")
+        knowledge_base: Knowledge base the answer came from, used to update the response cache
     """
-    if "feedback_given" not in st.session_state:
-        st.session_state.feedback_given = set()
-        
-    if msg_idx not in st.session_state.feedback_given:
-        st.session_state.feedback_given.add(msg_idx)
-        
-        if feedback_type == "positive":
-            st.success("Thank you for your feedback! We're glad this response was helpful.")
-        else:
-            st.info("Thank you for your feedback. We'll work to improve our responses.")
-
-        import time
-        time.sleep(0.5)
-        st.rerun() 
\ No newline at end of file
+    from feedback_log import get_feedback_log
+    from session_store import get_session_store
+
+    store = get_session_store()
+    session_id = st.session_state.session_id
+    if not store.record_feedback(session_id, msg_seq, feedback_type):
+        return
+
+    answer = store.message(session_id, msg_seq)
+    question = store.message(session_id, msg_seq - 1)
+    if answer is not None:
+        metadata = answer["metadata"]
+        get_feedback_log().record({
+            "session_id": session_id,
+            "seq": msg_seq,
+            "question": question["content"] if question and question["role"] == "user" else None,
+            "answer": answer["content"],
+            "sources": metadata.get("sources", []),
+            "kb_version": metadata.get("kb_version"),
+            "first_turn": bool(metadata.get("first_turn")),
+            "flags": metadata.get("flags", {}),
+            "verdict": feedback_type,
+        }, knowledge_base, metadata.get("raw_answer"))
+
+    if feedback_type == "positive":
+        st.toast("Thank you for your feedback! We're glad this response was helpful.")
+    else:
+        st.toast("Thank you for your feedback. We'll work to improve our responses.")